@@ -1,8 +1,17 @@
 from django.contrib import admin
-from .models import User, Rider, Quote, Order, Invoice
+from .models import User, Rider, Location, LocationAlias, Route, Quote, RouteRate, Order, OrderStatusEvent, DeliveryRun, DeliveryStop, Invoice, Payment, Job
 
 admin.site.register(User)
 admin.site.register(Rider)
+admin.site.register(Location)
+admin.site.register(LocationAlias)
+admin.site.register(Route)
 admin.site.register(Quote)
+admin.site.register(RouteRate)
 admin.site.register(Order)
+admin.site.register(OrderStatusEvent)
+admin.site.register(DeliveryRun)
+admin.site.register(DeliveryStop)
 admin.site.register(Invoice)
+admin.site.register(Payment)
+admin.site.register(Job)
@@ -0,0 +1,151 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .locations import normalize_location
+from .models import Rider, Order
+
+
+def location_score(rider, order):
+    '''
+    Default scoring: lower is better. Riders based where the parcel is
+    picked up win, and among equals the one that has been free longest.
+    '''
+    same_location = normalize_location(rider.location) == normalize_location(order.quote.location_from)
+    return (0 if same_location else 1, rider.updated_ts)
+
+
+def get_scoring_function():
+    return import_string(settings.RIDER_SCORING_FUNCTION)
+
+
+class RiderAvailabilityIndex:
+    '''
+    In-process index of free riders (riders without an active order)
+    bucketed by normalized location. Signals keep it current for writes
+    made by this process; a full reload every RIDER_INDEX_MAX_AGE seconds
+    picks up everyone else's. The index only proposes candidates, the
+    assignment engine re-checks them under row locks.
+    '''
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.locations = {}
+        self.riders = {}
+        self.loaded = None
+
+    def free_riders(self):
+        active = Order.objects.filter(rider=OuterRef('pk')).exclude(order_status=Order.DEL)
+        return Rider.objects.filter(~Exists(active))
+
+    def refresh(self):
+        riders = dict(self.free_riders().values_list('pk', 'location'))
+        with self.lock:
+            self.riders = {pk: normalize_location(location) for pk, location in riders.items()}
+            self.locations = {}
+            for pk, location in self.riders.items():
+                self.locations.setdefault(location, set()).add(pk)
+            self.loaded = time.monotonic()
+
+    def ensure_fresh(self):
+        if self.loaded is None or time.monotonic() - self.loaded > self.max_age:
+            self.refresh()
+
+    def candidates(self):
+        self.ensure_fresh()
+        with self.lock:
+            return list(self.riders)
+
+    def at_location(self, location):
+        with self.lock:
+            return set(self.locations.get(normalize_location(location), ()))
+
+    def mark_free(self, pk, location):
+        location = normalize_location(location)
+        with self.lock:
+            self.discard(pk)
+            self.riders[pk] = location
+            self.locations.setdefault(location, set()).add(pk)
+
+    def mark_busy(self, pk):
+        with self.lock:
+            self.discard(pk)
+
+    def discard(self, pk):
+        location = self.riders.pop(pk, None)
+        if location is not None:
+            self.locations[location].discard(pk)
+
+    def clear(self):
+        with self.lock:
+            self.riders = {}
+            self.locations = {}
+            self.loaded = None
+
+
+availability_index = RiderAvailabilityIndex(settings.RIDER_INDEX_MAX_AGE)
+
+
+def assign_riders(batch_size=None, score=None):
+    '''
+    Assign free riders to a batch of RELEASED orders without a rider in one
+    pass. Riders based at the pickup location are scored first, everyone
+    else only when none are. Orders and riders are claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED, so several workers can run at once
+    without double-booking a rider. Returns the assigned (order, rider) pairs.
+    '''
+    from .signals import invalidate_instances
+
+    batch_size = batch_size or settings.RIDER_ASSIGNMENT_BATCH_SIZE
+    score = score or get_scoring_function()
+
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('quote')
+            .filter(order_status=Order.REL, rider__isnull=True)
+            .order_by('status_changed_ts', 'id')[:batch_size]
+        )
+        if not orders:
+            return []
+
+        candidates = availability_index.candidates()
+        riders = {
+            rider.pk: rider for rider in
+            availability_index.free_riders().select_for_update(skip_locked=True, of=('self',)).filter(pk__in=candidates)
+        }
+        # Riders the index thought were free but the database says are busy
+        for pk in set(candidates) - set(riders):
+            availability_index.mark_busy(pk)
+
+        assignments = []
+        for order in orders:
+            if not riders:
+                break
+            nearby = availability_index.at_location(order.quote.location_from) & riders.keys()
+            pool = [riders[pk] for pk in nearby] or list(riders.values())
+            rider = min(pool, key=lambda rider: score(rider, order))
+            del riders[rider.pk]
+            order.rider = rider
+            assignments.append((order, rider))
+
+        if not assignments:
+            return []
+
+        now = timezone.now()
+        assigned_orders = [order for order, _ in assignments]
+        for order in assigned_orders:
+            order.updated_ts = now
+        rider_ids = [rider.pk for _, rider in assignments]
+
+        Order.objects.bulk_update(assigned_orders, ['rider', 'updated_ts'], batch_size=settings.BULK_BATCH_SIZE)
+        invalidate_instances(Order, assigned_orders)
+
+    for pk in rider_ids:
+        availability_index.mark_busy(pk)
+    return assignments
@@ -0,0 +1,184 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Order
+
+
+def get_cache():
+    return caches[settings.DETAIL_CACHE_ALIAS]
+
+
+def version_key(model, pk):
+    return f'api:detail:{model._meta.label_lower}:{pk}'
+
+
+def body_key(model, pk, version):
+    digest = hashlib.sha1(version.encode('utf-8')).hexdigest()
+    return f'api:detail:{model._meta.label_lower}:{pk}:{digest}'
+
+
+def make_etag(model, pk, version):
+    digest = hashlib.sha1(f'{model._meta.label_lower}:{pk}:{version}'.encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def get_version(instance, serializer_class):
+    '''
+    The object's updated_ts plus those of the related objects its serializer
+    nests, so a change to a nested rider or quote also moves the version
+    '''
+    timestamps = [instance.updated_ts.isoformat()]
+    select_related, _ = serializer_class.get_related_fields()
+    for path in select_related:
+        related = instance
+        for name in path.split('__'):
+            related = getattr(related, name, None) if related is not None else None
+        timestamps.append(related.updated_ts.isoformat() if related is not None else '-')
+    return '|'.join(timestamps)
+
+
+def get_detail(model, serializer_class, pk):
+    '''
+    Read-through lookup of a serialized object. Returns (etag, data) or
+    None if the object does not exist.
+
+    The cache holds a version pointer (the updated_ts stamps) per object
+    and the serialized body under model + pk + version, so a stale body can
+    never be served once the pointer has moved on.
+    '''
+    cache = get_cache()
+    version = cache.get(version_key(model, pk))
+    if version is not None:
+        data = cache.get(body_key(model, pk, version))
+        if data is not None:
+            return make_etag(model, pk, version), data
+
+    try:
+        instance = serializer_class.setup_eager_loading(model.objects.all()).get(pk=pk)
+    except model.DoesNotExist:
+        return None
+
+    version = get_version(instance, serializer_class)
+    data = serializer_class(instance).data
+    cache.set_many({
+        version_key(model, pk): version,
+        body_key(model, pk, version): data
+    })
+    return make_etag(model, pk, version), data
+
+
+def invalidate(model, pks):
+    '''
+    Drop the version pointers so the next read reloads from the database
+    '''
+    keys = [version_key(model, pk) for pk in pks if pk is not None]
+    if keys:
+        get_cache().delete_many(keys)
+
+
+class LRUCache:
+    '''
+    Thread-safe in-process LRU with a per-entry time to live. Other worker
+    processes do not see local invalidations, so the TTL bounds how stale
+    their copies can get.
+    '''
+    missing = object()
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return self.missing
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return self.missing
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+tracking_cache = LRUCache(settings.TRACKING_CACHE_SIZE, settings.TRACKING_CACHE_TIMEOUT)
+
+
+def get_tracking(tracking_number):
+    '''
+    Minimal status projection of an order by tracking number, or None.
+    Unknown numbers are cached too so repeated misses stay off the database.
+    '''
+    tracking = tracking_cache.get(tracking_number)
+    if tracking is not LRUCache.missing:
+        return tracking
+
+    tracking = Order.objects.filter(tracking_number=tracking_number).values(
+        'tracking_number',
+        'order_status',
+        'updated_ts',
+        'quote__location_from',
+        'quote__location_to',
+        'quote__estimated_delivery'
+    ).first()
+    if tracking is not None:
+        tracking = {
+            'tracking_number': tracking['tracking_number'],
+            'order_status': tracking['order_status'],
+            'order_status_display': dict(Order.DELIVERY_CHOICES).get(tracking['order_status']),
+            'location_from': tracking['quote__location_from'],
+            'location_to': tracking['quote__location_to'],
+            'estimated_delivery': tracking['quote__estimated_delivery'],
+            'updated_ts': tracking['updated_ts']
+        }
+    tracking_cache.set(tracking_number, tracking)
+    return tracking
+
+
+class CachedDetailMixin:
+    '''
+    GET handling for detail views served from the versioned detail cache,
+    with strong ETags and 304 answers to a matching If-None-Match
+    '''
+    model = None
+    serializer_class = None
+
+    def get_cached_response(self, request, id):
+        entry = get_detail(self.model, self.serializer_class, id)
+        if entry is None:
+            return self.error_response()
+
+        etag, data = entry
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in etags or '*' in etags:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .jobs import enqueue
+from .ledger import apply_invoice_changes, invoice_state
+from .models import Order, Invoice, PaymentCallback, Checkpoint
+
+
+def invoiceable_orders():
+    '''
+    Orders without an invoice whose quote has been priced. Orders already
+    marked paid are left out: they were settled without an invoice, see
+    api.payments.process_callbacks.
+    '''
+    return Order.objects.filter(
+        orderinvoice__isnull=True,
+        quote__quoteinvoice__isnull=True,
+        quote__estimated_cost__isnull=False,
+        payment_complete_status=False
+    )
+
+
+def generate_invoice(order_id):
+    '''
+    Invoice one order for its quote's estimated cost, through Invoice.save
+    so the ledger rollups follow. The order row is locked first, so this
+    and the backfill never both invoice it. Payment callbacks waiting for
+    the invoice are queued again. Returns the invoice, or None if the order
+    is already invoiced or cannot be yet.
+    '''
+    with transaction.atomic():
+        order = invoiceable_orders().select_for_update(of=('self',)).select_related('quote').filter(pk=order_id).first()
+        if order is None:
+            return None
+        invoice = Invoice.objects.create(order=order, quote=order.quote, total_amount=order.quote.estimated_cost)
+        release_callbacks([order.pk])
+        return invoice
+
+
+def release_callbacks(order_ids):
+    '''
+    Queue again the payment callbacks that waited for these orders' invoices
+    '''
+    PaymentCallback.objects.filter(
+        order_id__in=order_ids,
+        outcome=PaymentCallback.UNINVOICED,
+        processed_ts__isnull=True
+    ).update(outcome='')
+
+
+def enqueue_invoice(order_id):
+    '''
+    Have a worker run generate_invoice; queued once however often it is asked for
+    '''
+    enqueue('generate_invoice', {'order_id': order_id}, key=f'generate_invoice:{order_id}')
+
+
+def checkpoint_name(partition, partitions):
+    return f'generate_invoices:{partition}/{partitions}'
+
+
+def generate_invoices(partition=0, partitions=1, chunk_size=None, restart=False):
+    '''
+    Backfill invoices for every invoiceable order whose id falls in this
+    partition (id modulo partitions), in id order, one chunk per
+    transaction: the chunk's orders are locked, invoiced with one bulk
+    insert, added to the ledger rollups in one netted pass, and the
+    partition's checkpoint moves past them, all in that transaction.
+    Partitions never share an order, so they can run in parallel, in
+    processes or on different hosts; a partition that is stopped resumes
+    from its checkpoint. Returns the number of invoices created.
+    '''
+    chunk_size = chunk_size or settings.INVOICE_CHUNK_SIZE
+    name = checkpoint_name(partition, partitions)
+    if restart:
+        Checkpoint.objects.filter(name=name).delete()
+
+    created = 0
+    while True:
+        try:
+            count = invoice_chunk(name, partition, partitions, chunk_size)
+        except IntegrityError:
+            # Invoiced meanwhile by a path that does not lock the order, read the chunk again
+            continue
+        if count is None:
+            break
+        created += count
+    return created
+
+
+def invoice_chunk(name, partition, partitions, chunk_size):
+    '''
+    One chunk of generate_invoices. Returns the invoices created, or None
+    once the partition has nothing left past its checkpoint.
+    '''
+    with transaction.atomic():
+        checkpoint, _ = Checkpoint.objects.select_for_update().get_or_create(name=name)
+        orders = list(
+            invoiceable_orders()
+            .annotate(partition=F('id') % partitions)
+            .filter(partition=partition, id__gt=checkpoint.position)
+            .select_for_update(of=('self',))
+            .select_related('quote')
+            .order_by('id')[:chunk_size]
+        )
+        if not orders:
+            return None
+
+        invoices = [
+            Invoice(
+                order=order,
+                quote=order.quote,
+                total_amount=order.quote.estimated_cost,
+                amount_paid=0,
+                amount_due=order.quote.estimated_cost,
+                payment_status=Invoice.UNPAID
+            )
+            for order in orders
+        ]
+        # Bulk inserts skip Invoice.save, so the rollups are applied here
+        Invoice.objects.bulk_create(invoices, batch_size=settings.BULK_BATCH_SIZE)
+        apply_invoice_changes([(None, invoice_state(invoice)) for invoice in invoices])
+        release_callbacks([order.pk for order in orders])
+
+        checkpoint.position = orders[-1].pk
+        checkpoint.save(update_fields=['position', 'updated_ts'])
+        return len(invoices)
@@ -0,0 +1,196 @@
+import logging
+import os
+import random
+import socket
+import traceback
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('api.jobs')
+
+# Task name to function, filled by the task decorator as api.tasks is imported
+TASKS = {}
+
+
+def task(name):
+    '''
+    Register a function as the task run for jobs of this name
+    '''
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, payload=None, priority=Job.NORMAL, delay=None, key='', max_attempts=None):
+    '''
+    Queue a job and return at once. Inside a transaction the job is only
+    visible to workers once that commits, and is dropped if it rolls back.
+    With a key, nothing is queued while a job with the same key is still
+    waiting to run; returns None then.
+    '''
+    job = Job(
+        task=name,
+        payload=payload or {},
+        key=key,
+        priority=priority,
+        run_at=timezone.now() + (delay or timedelta()),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS
+    )
+    if not key:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return None
+    return job
+
+
+def backoff(attempts):
+    '''
+    Seconds before retrying a job that failed its attempts-th time: doubling
+    from JOB_BACKOFF_SECONDS up to JOB_BACKOFF_MAX_SECONDS, with a quarter of
+    jitter either way so jobs that failed together do not retry together
+    '''
+    delay = min(settings.JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.JOB_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def claim_jobs(batch_size=None):
+    '''
+    Claim up to batch_size due jobs, highest priority first. Candidates are
+    read with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers pass
+    over each other's rows, and taken with an UPDATE conditional on the job
+    still being queued, which keeps backends without row locks correct too.
+    '''
+    batch_size = batch_size or settings.JOB_BATCH_SIZE
+    now = timezone.now()
+    claim = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    with transaction.atomic():
+        pks = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(job_status=Job.QUEUED, run_at__lte=now)
+            .order_by('-priority', 'run_at', 'id')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return []
+        Job.objects.filter(pk__in=pks, job_status=Job.QUEUED).update(
+            job_status=Job.RUNNING,
+            worker=claim,
+            started_ts=now,
+            attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(pk__in=pks, worker=claim, job_status=Job.RUNNING).order_by('-priority', 'run_at', 'id'))
+
+
+def retry(job, error):
+    '''
+    Queue a failed job again after its backoff, or give up on its last attempt
+    '''
+    now = timezone.now()
+    job.last_error = error[-settings.JOB_ERROR_MAX_LENGTH:]
+    job.finished_ts = now
+    if job.attempts >= job.max_attempts:
+        job.job_status = Job.FAILED
+    else:
+        job.job_status = Job.QUEUED
+        job.run_at = now + timedelta(seconds=backoff(job.attempts))
+    try:
+        with transaction.atomic():
+            job.save(update_fields=['job_status', 'run_at', 'last_error', 'finished_ts'])
+    except IntegrityError:
+        # The same work was queued again meanwhile, and will run instead of this retry
+        job.job_status = Job.DONE
+        job.save(update_fields=['job_status', 'last_error', 'finished_ts'])
+
+
+def run_job(job):
+    '''
+    Run one claimed job. Returns its new status.
+    '''
+    function = TASKS.get(job.task)
+    if function is None:
+        job.attempts = job.max_attempts
+        retry(job, f'No task is registered as {job.task}')
+        return job.job_status
+    try:
+        function(**job.payload)
+    except Exception:
+        retry(job, traceback.format_exc())
+        return job.job_status
+    job.job_status = Job.DONE
+    job.finished_ts = timezone.now()
+    job.save(update_fields=['job_status', 'finished_ts'])
+    return job.job_status
+
+
+def run_jobs(batch_size=None):
+    '''
+    Claim and run one batch of jobs. Returns a Counter of their new statuses.
+    '''
+    return Counter(run_job(job) for job in claim_jobs(batch_size))
+
+
+def requeue_stale_jobs(timeout=None):
+    '''
+    Jobs still running JOB_TIMEOUT_SECONDS after they were claimed belong
+    to a worker that died; queue them again, or fail them on their last
+    attempt. Returns how many were found.
+    '''
+    timeout = settings.JOB_TIMEOUT_SECONDS if timeout is None else timeout
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    jobs = list(Job.objects.filter(job_status=Job.RUNNING, started_ts__lt=cutoff))
+    for job in jobs:
+        retry(job, f'Timed out after {timeout} seconds on {job.worker}')
+    return len(jobs)
+
+
+def purge_jobs(days=None):
+    '''
+    Delete finished jobs older than JOB_RETENTION_DAYS; failed ones are kept for inspection
+    '''
+    days = settings.JOB_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Job.objects.filter(job_status=Job.DONE, finished_ts__lt=cutoff).delete()
+    return deleted
+
+
+def work(stop, batch_size=None, interval=1, drain=False):
+    '''
+    A worker's loop: run batches until stop is set, or until the queue is
+    empty when draining. Idle workers look for stale jobs, then sleep for
+    interval seconds. Connections are recycled around every batch
+    the way the request cycle would per CONN_MAX_AGE.
+    Returns a Counter of the statuses of the jobs run.
+    '''
+    totals = Counter()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            statuses = run_jobs(batch_size)
+            if not statuses:
+                requeue_stale_jobs()
+        except DatabaseError:
+            # A lost connection or lock contention; jobs claimed so far are requeued once stale
+            logger.exception('Claiming jobs failed')
+            stop.wait(interval)
+            continue
+        finally:
+            close_old_connections()
+        totals.update(statuses)
+        if not statuses:
+            if drain:
+                break
+            stop.wait(interval)
+    return totals
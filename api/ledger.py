@@ -0,0 +1,258 @@
+from collections import namedtuple
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Quote, Invoice, Payment, UserLedger, DailyLedger, StatusLedger
+
+InvoiceState = namedtuple('InvoiceState', ['user_id', 'day', 'status', 'total', 'paid', 'due'])
+
+
+def invoice_state(invoice):
+    '''
+    What an invoice contributes to the rollups
+    '''
+    if Invoice.quote.is_cached(invoice):
+        user_id = invoice.quote.user_id
+    else:
+        user_id = Quote.objects.values_list('user_id', flat=True).filter(pk=invoice.quote_id).first()
+    return InvoiceState(
+        user_id=user_id,
+        day=timezone.localdate(invoice.created_ts),
+        status=invoice.payment_status,
+        total=invoice.total_amount or 0,
+        paid=invoice.amount_paid,
+        due=invoice.amount_due
+    )
+
+
+def bump(model, key, deltas):
+    '''
+    Add deltas to one rollup row with a single UPDATE, creating the row
+    the first time its key is seen
+    '''
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    now = timezone.now()
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**key).update(updated_ts=now, **changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Created concurrently since the update
+        model.objects.filter(**key).update(updated_ts=now, **changes)
+
+
+def apply_invoice_change(before, after):
+    '''
+    Move an invoice's contribution to the rollups from its before state
+    to its after state; either may be None for a created or deleted
+    invoice.
+    '''
+    apply_invoice_changes([(before, after)])
+
+
+def apply_invoice_changes(changes):
+    '''
+    apply_invoice_change for many (before, after) pairs at once. Deltas
+    are netted per rollup row, so a batch costs one write per distinct
+    key and unchanged keys are not written at all.
+    '''
+    users, statuses, days = {}, {}, {}
+    for state, sign in ((state, sign) for before, after in changes for state, sign in ((before, -1), (after, 1))):
+        if state is None:
+            continue
+        amounts = {'invoice_count': sign, 'invoiced': sign * state.total, 'paid': sign * state.paid, 'due': sign * state.due}
+        for rows, key in ((users, state.user_id), (statuses, state.status)):
+            row = rows.setdefault(key, dict.fromkeys(amounts, 0))
+            for field, value in amounts.items():
+                row[field] += value
+        day = days.setdefault(state.day, {'invoice_count': 0, 'invoiced': 0})
+        day['invoice_count'] += sign
+        day['invoiced'] += sign * state.total
+
+    for user_id, deltas in users.items():
+        if user_id is not None:
+            bump(UserLedger, {'user_id': user_id}, deltas)
+    for status, deltas in statuses.items():
+        bump(StatusLedger, {'status': status}, deltas)
+    for day, deltas in days.items():
+        bump(DailyLedger, {'day': day}, deltas)
+
+
+def apply_payment(invoice, amount):
+    invoice.amount_paid += amount
+    invoice.amount_due = (invoice.total_amount or 0) - invoice.amount_paid
+    invoice.payment_status = Invoice.get_payment_status(invoice.total_amount, invoice.amount_paid)
+    invoice.updated_ts = timezone.now()
+
+
+class PaymentReferenceTaken(Exception):
+    def __init__(self, reference, invoice_id):
+        self.reference = reference
+        self.invoice_id = invoice_id
+        super().__init__(f'Payment reference {reference} is already recorded against another invoice')
+
+
+def recorded_payment(invoice_id, reference):
+    '''
+    The payment already recorded under reference, if any. Raises
+    PaymentReferenceTaken if it was recorded against another invoice.
+    '''
+    existing = Payment.objects.filter(reference=reference).first()
+    if existing is not None and existing.invoice_id != invoice_id:
+        raise PaymentReferenceTaken(reference, existing.invoice_id)
+    return existing
+
+
+def record_payment(invoice_id, amount, reference='', user=None):
+    '''
+    Append a payment and update the invoice's amount_paid, amount_due,
+    payment_status and the rollups in one transaction. Returns
+    (payment, created); a reference that was already recorded against this
+    invoice returns the existing payment, one recorded against another
+    invoice raises PaymentReferenceTaken.
+    '''
+    from .signals import invalidate_instances
+
+    with transaction.atomic():
+        invoice = Invoice.objects.select_for_update().get(pk=invoice_id)
+        if reference:
+            existing = recorded_payment(invoice.pk, reference)
+            if existing is not None:
+                return existing, False
+
+        before = invoice_state(invoice)
+        try:
+            with transaction.atomic():
+                payment = Payment.objects.create(invoice=invoice, amount=amount, reference=reference, user=user)
+        except IntegrityError:
+            # Recorded concurrently under the same reference
+            return recorded_payment(invoice.pk, reference), False
+        apply_payment(invoice, amount)
+        # Not save(), which leaves amount_paid alone
+        Invoice.objects.filter(pk=invoice.pk).update(
+            amount_paid=invoice.amount_paid,
+            amount_due=invoice.amount_due,
+            payment_status=invoice.payment_status,
+            updated_ts=invoice.updated_ts
+        )
+        apply_invoice_change(before, invoice_state(invoice))
+        bump(DailyLedger, {'day': timezone.localdate(payment.created_ts)}, {'payment_count': 1, 'collected': amount})
+
+    invalidate_instances(Invoice, [invoice])
+    return payment, True
+
+
+def record_payments(payments):
+    '''
+    record_payment for a batch of unsaved Payment instances, with one
+    query per step instead of one per payment: the invoices are locked
+    together, the payments inserted with bulk_create, the invoices written
+    with bulk_update and the rollup deltas netted across the batch.
+    Payments whose reference was already recorded, or whose invoice no
+    longer exists, are skipped. Must run inside a transaction; returns
+    (created payments, updated invoices by pk).
+    '''
+    from .signals import invalidate_instances
+
+    invoices = {
+        invoice.pk: invoice for invoice in
+        Invoice.objects.select_for_update(of=('self',)).select_related('quote')
+        .filter(pk__in={payment.invoice_id for payment in payments}).order_by('pk')
+    }
+    recorded = set(Payment.objects.filter(
+        reference__in=[payment.reference for payment in payments if payment.reference]
+    ).values_list('reference', flat=True))
+
+    created, before = [], {}
+    for payment in payments:
+        invoice = invoices.get(payment.invoice_id)
+        if invoice is None or (payment.reference and payment.reference in recorded):
+            continue
+        if payment.reference:
+            recorded.add(payment.reference)
+        before.setdefault(invoice.pk, invoice_state(invoice))
+        apply_payment(invoice, payment.amount)
+        payment.invoice = invoice
+        created.append(payment)
+    if not created:
+        return [], {}
+
+    updated = {pk: invoices[pk] for pk in before}
+    Payment.objects.bulk_create(created, batch_size=settings.BULK_BATCH_SIZE)
+    Invoice.objects.bulk_update(
+        updated.values(), ['amount_paid', 'amount_due', 'payment_status', 'updated_ts'],
+        batch_size=settings.BULK_BATCH_SIZE
+    )
+    apply_invoice_changes([(before[pk], invoice_state(invoice)) for pk, invoice in updated.items()])
+
+    days = {}
+    for payment in created:
+        day = days.setdefault(timezone.localdate(payment.created_ts), {'payment_count': 0, 'collected': 0})
+        day['payment_count'] += 1
+        day['collected'] += payment.amount
+    for day, deltas in days.items():
+        bump(DailyLedger, {'day': day}, deltas)
+
+    invalidate_instances(Invoice, list(updated.values()))
+    return created, updated
+
+
+def rebuild_ledger(get_model=django_apps.get_model):
+    '''
+    Recompute every invoice's amounts from its payments and rebuild the
+    rollup tables from scratch with a few aggregate queries. For backfills
+    and repairs; get_model lets migrations pass their historical models.
+    '''
+    Invoice = get_model('api', 'Invoice')
+    Payment = get_model('api', 'Payment')
+    UserLedger = get_model('api', 'UserLedger')
+    DailyLedger = get_model('api', 'DailyLedger')
+    StatusLedger = get_model('api', 'StatusLedger')
+
+    with transaction.atomic():
+        paid = Payment.objects.filter(invoice=OuterRef('pk')).values('invoice').annotate(total=Sum('amount')).values('total')
+        Invoice.objects.update(amount_paid=Coalesce(Subquery(paid), Value(0)))
+        Invoice.objects.update(amount_due=Coalesce(F('total_amount'), Value(0)) - F('amount_paid'))
+        # Literals, historical models have no status constants
+        Invoice.objects.filter(amount_paid__lte=0).update(payment_status='UNPAID')
+        Invoice.objects.filter(amount_paid__gt=0, amount_due__gt=0).update(payment_status='PARTIAL')
+        Invoice.objects.filter(amount_paid__gt=0, amount_due__lte=0).update(payment_status='PAID')
+
+        totals = {
+            'invoice_count': Count('id'),
+            'invoiced': Coalesce(Sum('total_amount'), Value(0)),
+            'paid': Sum('amount_paid'),
+            'due': Sum('amount_due'),
+        }
+        UserLedger.objects.all().delete()
+        UserLedger.objects.bulk_create([
+            UserLedger(user_id=row.pop('quote__user'), **row)
+            for row in Invoice.objects.order_by().values('quote__user').annotate(**totals)
+            if row['quote__user'] is not None
+        ])
+        StatusLedger.objects.all().delete()
+        StatusLedger.objects.bulk_create([
+            StatusLedger(status=row.pop('payment_status'), **row)
+            for row in Invoice.objects.order_by().values('payment_status').annotate(**totals)
+        ])
+
+        days = {}
+        for row in Invoice.objects.order_by().annotate(day=TruncDate('created_ts')).values('day').annotate(
+            invoice_count=Count('id'), invoiced=Coalesce(Sum('total_amount'), Value(0))
+        ):
+            days.setdefault(row.pop('day'), {}).update(row)
+        for row in Payment.objects.order_by().annotate(day=TruncDate('created_ts')).values('day').annotate(
+            payment_count=Count('id'), collected=Sum('amount')
+        ):
+            days.setdefault(row.pop('day'), {}).update(row)
+        DailyLedger.objects.all().delete()
+        DailyLedger.objects.bulk_create([DailyLedger(day=day, **row) for day, row in days.items()])
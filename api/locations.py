@@ -0,0 +1,315 @@
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Location, LocationAlias, Route
+
+
+def normalize_location(location):
+    '''
+    Case and whitespace insensitive form of a free-text location
+    '''
+    return ' '.join((location or '').lower().split())
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class LocationIndex:
+    '''
+    In-process index from normalized location names and aliases to
+    Location ids. resolve() tries an exact match first, then a fuzzy one:
+    names sharing trigrams with the input are scored by trigram overlap
+    (Dice coefficient) and the best one wins if it scores at least
+    LOCATION_MATCH_THRESHOLD. Results are memoized per input until the
+    index reloads, after a Location change in this process or every
+    LOCATION_INDEX_MAX_AGE seconds.
+    '''
+    def __init__(self, max_age, threshold, cache_size):
+        self.max_age = max_age
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.index = None
+        self.loaded = None
+
+    def load(self):
+        '''
+        Returns (keys, postings, names, resolve): normalized name to id,
+        trigram to the names containing it, id to canonical name, and the
+        memoized resolver, swapped in as one tuple
+        '''
+        index = self.index
+        if index is not None and time.monotonic() - self.loaded <= self.max_age:
+            return index
+        with self.lock:
+            if self.index is not None and time.monotonic() - self.loaded <= self.max_age:
+                return self.index
+            names = dict(Location.objects.values_list('id', 'name'))
+            keys = {normalize_location(name): pk for pk, name in names.items()}
+            for alias, pk in LocationAlias.objects.values_list('alias', 'location_id'):
+                keys.setdefault(normalize_location(alias), pk)
+            postings, sizes = {}, {}
+            for key in keys:
+                key_trigrams = trigrams(key)
+                sizes[key] = len(key_trigrams)
+                for trigram in key_trigrams:
+                    postings.setdefault(trigram, []).append(key)
+
+            resolve = lru_cache(maxsize=self.cache_size)(lambda text: self.match(keys, postings, sizes, text))
+            self.index = (keys, postings, names, resolve)
+            self.loaded = time.monotonic()
+            return self.index
+
+    def match(self, keys, postings, sizes, text):
+        if text in keys:
+            return keys[text]
+        wanted = trigrams(text)
+        shared = Counter(key for trigram in wanted for key in postings.get(trigram, ()))
+        best, best_score = None, self.threshold
+        for key, count in shared.items():
+            score = 2 * count / (len(wanted) + sizes[key])
+            if score > best_score or (score == best_score and best is None):
+                best, best_score = key, score
+        return keys[best] if best is not None else None
+
+    def resolve(self, location):
+        '''
+        Location id for a free-text location, or None if nothing is close enough
+        '''
+        text = normalize_location(location)
+        return self.load()[3](text) if text else None
+
+    def name(self, pk):
+        return self.load()[2].get(pk)
+
+    def clear(self):
+        with self.lock:
+            self.index = None
+
+
+location_index = LocationIndex(
+    settings.LOCATION_INDEX_MAX_AGE, settings.LOCATION_MATCH_THRESHOLD, settings.LOCATION_MATCH_CACHE_SIZE
+)
+
+
+def haversine_km(latitudes_from, longitudes_from, latitudes_to, longitudes_to):
+    '''
+    Great-circle distances in kilometres, element-wise over broadcast arrays
+    '''
+    latitudes_from, longitudes_from, latitudes_to, longitudes_to = map(
+        np.radians, (latitudes_from, longitudes_from, latitudes_to, longitudes_to)
+    )
+    a = (
+        np.sin((latitudes_to - latitudes_from) / 2) ** 2
+        + np.cos(latitudes_from) * np.cos(latitudes_to) * np.sin((longitudes_to - longitudes_from) / 2) ** 2
+    )
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class DistanceMatrix:
+    '''
+    Pairwise road distance and travel time between every two locations,
+    precomputed by build_distance_matrix into one float32 array of shape
+    (2, n, n) and memory-mapped read-only, so every process shares the
+    same pages and a lookup is two dict gets and an array index.
+
+    Each build is written under a new version and the CURRENT file is
+    swapped to point at it, so readers never see a half-written matrix.
+    Readers check CURRENT every LOCATION_MATRIX_MAX_AGE seconds.
+    '''
+    def __init__(self, directory, max_age):
+        self.directory = directory
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.matrix = None
+        self.loaded = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def current_version(self):
+        try:
+            with open(self.path('CURRENT')) as current:
+                return current.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        '''
+        Returns (version, positions, values) with positions mapping a
+        Location id to its row and column, or None before the first build
+        '''
+        matrix = self.matrix
+        if self.loaded is not None and time.monotonic() - self.loaded <= self.max_age:
+            return matrix
+        with self.lock:
+            if self.loaded is not None and time.monotonic() - self.loaded <= self.max_age:
+                return self.matrix
+            version = self.current_version()
+            if version is None:
+                self.matrix = None
+            elif self.matrix is None or self.matrix[0] != version:
+                try:
+                    ids = np.load(self.path(f'locations-{version}.npy'))
+                    values = np.load(self.path(f'matrix-{version}.npy'), mmap_mode='r')
+                except FileNotFoundError:
+                    # Replaced by a newer build since CURRENT was read, try again next time
+                    return self.matrix
+                self.matrix = (version, {int(pk): position for position, pk in enumerate(ids)}, values)
+            self.loaded = time.monotonic()
+            return self.matrix
+
+    def lookup(self, origin_id, destination_id):
+        '''
+        (distance_km, duration_minutes) between two locations, or
+        (None, None) if either was added since the last build
+        '''
+        matrix = self.load()
+        if matrix is None:
+            return None, None
+        _, positions, values = matrix
+        origin, destination = positions.get(origin_id), positions.get(destination_id)
+        if origin is None or destination is None:
+            return None, None
+        return float(values[0, origin, destination]), int(round(float(values[1, origin, destination])))
+
+    def write(self, ids, values):
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self.current_version()
+        version = uuid.uuid4().hex
+        np.save(self.path(f'locations-{version}.npy'), np.asarray(ids, dtype=np.int64))
+        np.save(self.path(f'matrix-{version}.npy'), values.astype(np.float32))
+
+        pointer = self.path(f'CURRENT.{version}')
+        with open(pointer, 'w') as current:
+            current.write(version)
+        os.replace(pointer, self.path('CURRENT'))
+        # Processes still mapping the old files keep them until they reload
+        if previous is not None:
+            for name in (f'locations-{previous}.npy', f'matrix-{previous}.npy'):
+                try:
+                    os.remove(self.path(name))
+                except FileNotFoundError:
+                    pass
+        self.clear()
+        return version
+
+    def clear(self):
+        with self.lock:
+            self.matrix = None
+            self.loaded = None
+
+
+distance_matrix = DistanceMatrix(settings.LOCATION_MATRIX_DIR, settings.LOCATION_MATRIX_MAX_AGE)
+
+
+def build_distance_matrix():
+    '''
+    Recompute the matrix from every Location's coordinates with one
+    vectorized haversine, write it, and refresh the distances copied onto
+    routes. Road distance is the great-circle distance times
+    LOCATION_ROAD_FACTOR, travel time assumes LOCATION_AVERAGE_SPEED_KMH.
+    Returns the number of locations.
+    '''
+    ids, latitudes, longitudes = [], [], []
+    for pk, latitude, longitude in Location.objects.order_by('id').values_list('id', 'latitude', 'longitude'):
+        ids.append(pk)
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+    latitudes, longitudes = np.array(latitudes, dtype=np.float64), np.array(longitudes, dtype=np.float64)
+
+    distances = haversine_km(latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :])
+    distances *= settings.LOCATION_ROAD_FACTOR
+    durations = distances / settings.LOCATION_AVERAGE_SPEED_KMH * 60
+    distance_matrix.write(ids, np.stack([distances, durations]))
+
+    routes = list(Route.objects.all())
+    now = timezone.now()
+    for route in routes:
+        route.distance_km, route.duration_minutes = distance_matrix.lookup(route.origin_id, route.destination_id)
+        route.updated_ts = now
+    Route.objects.bulk_update(routes, ['distance_km', 'duration_minutes', 'updated_ts'], batch_size=settings.BULK_BATCH_SIZE)
+    return len(ids)
+
+
+def resolve_routes(pairs):
+    '''
+    Map (location_from, location_to) free-text pairs to their Route, or
+    None where either side does not resolve to a Location. Routes seen for
+    the first time are created in one bulk insert.
+    '''
+    pairs = set(pairs)
+    keys = {pair: (location_index.resolve(pair[0]), location_index.resolve(pair[1])) for pair in pairs}
+    wanted = {key for key in keys.values() if None not in key}
+    if not wanted:
+        return dict.fromkeys(pairs)
+
+    def existing():
+        origins, destinations = zip(*wanted)
+        return {
+            (route.origin_id, route.destination_id): route
+            for route in Route.objects.filter(origin_id__in=set(origins), destination_id__in=set(destinations))
+            if (route.origin_id, route.destination_id) in wanted
+        }
+
+    routes = existing()
+    missing = wanted - routes.keys()
+    if missing:
+        new_routes = []
+        for origin_id, destination_id in missing:
+            distance_km, duration_minutes = distance_matrix.lookup(origin_id, destination_id)
+            new_routes.append(Route(
+                origin_id=origin_id,
+                destination_id=destination_id,
+                distance_km=distance_km,
+                duration_minutes=duration_minutes
+            ))
+        # Created concurrently elsewhere is fine, the rows are read back either way
+        with transaction.atomic():
+            Route.objects.bulk_create(new_routes, batch_size=settings.BULK_BATCH_SIZE, ignore_conflicts=True)
+        routes = existing()
+    return {pair: routes.get(key) for pair, key in keys.items()}
+
+
+def assign_quote_routes(queryset, chunk_size=None):
+    '''
+    Set the route of quotes in chunks, resolving each distinct pair of
+    locations once per chunk. Returns (routed, unrouted) counts.
+    '''
+    from .signals import invalidate_instances
+
+    chunk_size = chunk_size or settings.PRICING_CHUNK_SIZE
+    rows = queryset.order_by('id').values_list('id', 'location_from', 'location_to').iterator(chunk_size=chunk_size)
+
+    routed = unrouted = 0
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            break
+        routes = resolve_routes((location_from, location_to) for _, location_from, location_to in chunk)
+        by_route = {}
+        for pk, location_from, location_to in chunk:
+            route = routes[(location_from, location_to)]
+            by_route.setdefault(route.pk if route is not None else None, []).append(pk)
+        # One UPDATE per distinct route, rather than one per quote
+        now = timezone.now()
+        with transaction.atomic():
+            for route_id, pks in by_route.items():
+                queryset.model.objects.filter(pk__in=pks).update(route_id=route_id, updated_ts=now)
+        invalidate_instances(queryset.model, [queryset.model(pk=pk) for pk, _, _ in chunk])
+
+        unrouted += len(by_route.get(None, []))
+        routed += len(chunk) - len(by_route.get(None, []))
+    return routed, unrouted
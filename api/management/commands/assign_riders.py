@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.assignment import assign_riders
+
+
+class Command(BaseCommand):
+    help = 'Assign free riders to RELEASED orders, once or continuously'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Orders claimed per pass')
+        parser.add_argument('--loop', action='store_true', help='Keep assigning until interrupted')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep when a pass assigns nothing')
+
+    def handle(self, *args, **options):
+        while True:
+            assignments = assign_riders(batch_size=options['batch_size'])
+            for order, rider in assignments:
+                self.stdout.write(f'order {order.pk} -> rider {rider.pk}')
+            self.stdout.write(self.style.SUCCESS(f'Assigned {len(assignments)} orders'))
+
+            if not options['loop']:
+                break
+            if not assignments:
+                time.sleep(options['interval'])
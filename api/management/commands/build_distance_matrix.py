@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.locations import build_distance_matrix, distance_matrix
+
+
+class Command(BaseCommand):
+    help = 'Precompute the memory-mapped distance and travel time matrix between every two locations'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = build_distance_matrix()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built a {count}x{count} matrix in {distance_matrix.directory} in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from project.db.pool import pools
+
+ACTIVITY_QUERY = '''
+    SELECT coalesce(application_name, ''), coalesce(state, 'unknown'), count(*),
+           coalesce(max(extract(epoch FROM now() - backend_start)), 0)
+    FROM pg_stat_activity
+    WHERE datname = current_database()
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+'''
+
+
+class Command(BaseCommand):
+    help = 'Show the connection settings for a database and the connections the server sees'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to report on')
+
+    def handle(self, *args, **options):
+        database = options['database']
+        connection = connections[database]
+        settings_dict = connection.settings_dict
+
+        self.stdout.write(f'{database} ({connection.vendor}, {settings_dict["ENGINE"]})')
+        self.stdout.write(f'  CONN_MAX_AGE   {settings_dict["CONN_MAX_AGE"]}')
+        self.stdout.write(f'  HEALTH_CHECKS  {settings_dict.get("HEALTH_CHECKS", False)}')
+        self.stdout.write(f'  POOL_SIZE      {settings_dict.get("POOL_SIZE") or 0}')
+        self.stdout.write(f'  POOL_TIMEOUT   {settings_dict.get("POOL_TIMEOUT", "-")}')
+        for name, value in settings_dict['OPTIONS'].items():
+            self.stdout.write(f'  {name:<14} {value}')
+
+        # Pools live in the web workers, this only shows one when called in-process
+        pool = pools.get(database)
+        if pool is not None:
+            self.stdout.write('Pool in this process')
+            for name, value in pool.stats().items():
+                self.stdout.write(f'  {name:<14} {value}')
+
+        if connection.vendor != 'postgresql':
+            self.stdout.write('Server connection stats are only available on PostgreSQL')
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW max_connections')
+            max_connections = cursor.fetchone()[0]
+            cursor.execute(ACTIVITY_QUERY)
+            rows = cursor.fetchall()
+
+        total = sum(row[2] for row in rows)
+        self.stdout.write(f'Server connections to this database: {total} (max_connections {max_connections})')
+        self.stdout.write(f'  {"application":<24} {"state":<30} {"count":>6} {"oldest":>10}')
+        for application_name, state, count, oldest in rows:
+            self.stdout.write(f'  {application_name:<24} {state:<30} {count:>6} {float(oldest):>9.0f}s')
@@ -0,0 +1,59 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.invoicing import generate_invoices
+
+
+def run_partition(partition, partitions, chunk_size, restart, results):
+    results.put((partition, generate_invoices(partition, partitions, chunk_size, restart)))
+
+
+class Command(BaseCommand):
+    help = 'Invoice every priced order that has no invoice yet, in resumable chunks, on several processes or hosts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partitions', type=int, default=1, help='Orders are split by id modulo this many partitions')
+        parser.add_argument('--partition', type=int, help='Run only this partition, to spread them over hosts; all by default')
+        parser.add_argument('--chunk-size', type=int, help='Orders invoiced per transaction')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoints and scan from the first order')
+
+    def handle(self, *args, **options):
+        partitions, partition = options['partitions'], options['partition']
+        if partitions < 1 or (partition is not None and not 0 <= partition < partitions):
+            raise CommandError('--partition must be between 0 and --partitions - 1')
+        arguments = (partitions, options['chunk_size'], options['restart'])
+
+        started = time.perf_counter()
+        if partition is not None or partitions == 1:
+            created = generate_invoices(partition or 0, *arguments)
+        else:
+            created = self.run_pool(arguments)
+        self.stdout.write(self.style.SUCCESS(f'Created {created} invoices in {time.perf_counter() - started:.2f}s'))
+
+    def run_pool(self, arguments):
+        # One process per partition; forked processes must open their own connections
+        connections.close_all()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=run_partition, args=(partition,) + arguments + (results,))
+            for partition in range(arguments[0])
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        created, finished = 0, set()
+        while not results.empty():
+            partition, count = results.get()
+            created += count
+            finished.add(partition)
+        failed = set(range(arguments[0])) - finished
+        if failed:
+            raise CommandError(
+                f'Partitions {sorted(failed)} stopped early after {created} invoices; run again to resume them'
+            )
+        return created
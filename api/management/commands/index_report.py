@@ -0,0 +1,80 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from rest_framework.settings import api_settings
+
+from api.models import Rider, Quote, Order, Invoice
+from api.serializers import RiderSerializer, QuoteSerializer, OrderSerializer, InvoiceSerializer
+
+# Postgres prints "Seq Scan on <table>", SQLite "SCAN <table>" or "SCAN TABLE <table>"
+# when it walks a table without an index
+SEQUENTIAL_SCAN = re.compile(r'Seq Scan on (\w+)|\bSCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)')
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the queries behind the API list views and flag sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to explain against')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan for every query')
+        parser.add_argument('--fail-on-seq-scan', action='store_true', help='Exit with an error if any query scans a table')
+
+    def get_queries(self, database):
+        '''
+        The querysets the list views paginate, plus the hot filters used by reports
+        '''
+        keyset = ('-created_ts', '-id')
+        limit = (api_settings.PAGE_SIZE or 50) + 1
+        user_id = 0
+
+        return [
+            ('riders', RiderSerializer.setup_eager_loading(Rider.objects.using(database)).order_by(*keyset)[:limit]),
+            ('staff_quotes', QuoteSerializer.setup_eager_loading(Quote.objects.using(database)).order_by(*keyset)[:limit]),
+            ('quotes', QuoteSerializer.setup_eager_loading(
+                Quote.objects.using(database).filter(user_id=user_id)
+            ).order_by(*keyset)[:limit]),
+            ('staff_orders', OrderSerializer.setup_eager_loading(Order.objects.using(database)).order_by(*keyset)[:limit]),
+            ('orders', OrderSerializer.setup_eager_loading(
+                Order.objects.using(database).filter(quote__user_id=user_id)
+            ).order_by(*keyset)[:limit]),
+            ('staff_invoice', InvoiceSerializer.setup_eager_loading(Invoice.objects.using(database)).order_by(*keyset)[:limit]),
+            ('invoices', InvoiceSerializer.setup_eager_loading(
+                Invoice.objects.using(database).filter(quote__user_id=user_id)
+            ).order_by(*keyset)[:limit]),
+            ('orders_by_status', Order.objects.using(database).filter(
+                order_status=Order.TRA
+            ).order_by('-updated_ts')[:limit]),
+            ('unpaid_orders', Order.objects.using(database).filter(
+                payment_complete_status=False
+            ).order_by('-created_ts')[:limit]),
+            ('outstanding_invoices', Invoice.objects.using(database).filter(
+                amount_due__gt=0
+            ).order_by('-created_ts')[:limit]),
+        ]
+
+    def handle(self, *args, **options):
+        database = options['database']
+        vendor = connections[database].vendor
+        flagged = []
+
+        for name, queryset in self.get_queries(database):
+            plan = queryset.explain()
+            scans = sorted({table for match in SEQUENTIAL_SCAN.finditer(plan) for table in match.groups() if table})
+            if scans:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(f'{name}: sequential scan on {", ".join(scans)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+
+            if options['verbose_plans'] or scans:
+                self.stdout.write(f'    {plan}'.replace('\n', '\n    '))
+
+        if flagged and vendor == 'postgresql':
+            self.stdout.write(
+                'Postgres prefers sequential scans on small tables; run ANALYZE on a realistically sized '
+                'database before acting on this report.'
+            )
+        if flagged and options['fail_on_seq_scan']:
+            raise CommandError(f'{len(flagged)} of the list queries scan a table: {", ".join(flagged)}')
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Location
+from api.planning import plan_delivery_runs, planning_depots
+
+
+class Command(BaseCommand):
+    help = 'Plan multi-stop delivery runs for RELEASED orders, per depot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('depots', nargs='*', help='Depot location names, every depot with waiting orders by default')
+        parser.add_argument('--processes', type=int, help='Depots planned in parallel on a process pool')
+
+    def handle(self, *args, **options):
+        if options['depots']:
+            depots = dict(Location.objects.filter(name__in=options['depots']).values_list('name', 'id'))
+            missing = set(options['depots']) - set(depots)
+            if missing:
+                raise CommandError(f'Unknown depots: {", ".join(sorted(missing))}')
+            depot_ids = list(depots.values())
+        else:
+            depot_ids = planning_depots()
+
+        started = time.perf_counter()
+        runs, unplanned = plan_delivery_runs(depot_ids, processes=options['processes'])
+        elapsed = time.perf_counter() - started
+
+        stops = sum(run.stops.count() for run in runs)
+        self.stdout.write(self.style.SUCCESS(
+            f'Planned {len(runs)} runs with {stops} stops over {len(depot_ids)} depots in {elapsed:.2f}s'
+        ))
+        if unplanned:
+            self.stdout.write(self.style.WARNING(
+                f'{unplanned} orders could not be planned: no distance matrix row, or no run can meet their limits'
+            ))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.payments import process_callbacks, purge_callbacks
+
+
+class Command(BaseCommand):
+    help = 'Apply queued payment provider callbacks to orders and invoices, once or continuously'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Callbacks claimed per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep processing until interrupted')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--purge', action='store_true', help='Delete processed callbacks past their retention first')
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            self.stdout.write(f'Purged {purge_callbacks()} processed callbacks')
+
+        while True:
+            started = time.perf_counter()
+            outcomes = process_callbacks(batch_size=options['batch_size'])
+            processed = sum(outcomes.values())
+            if processed:
+                summary = ', '.join(f'{count} {outcome.lower()}' for outcome, count in sorted(outcomes.items()))
+                self.stdout.write(self.style.SUCCESS(
+                    f'Processed {processed} callbacks in {time.perf_counter() - started:.2f}s: {summary}'
+                ))
+
+            if not processed:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
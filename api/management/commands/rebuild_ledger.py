@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.ledger import rebuild_ledger
+from api.models import UserLedger, DailyLedger, StatusLedger
+
+
+class Command(BaseCommand):
+    help = 'Recompute invoice amounts from the payments ledger and rebuild the ledger rollup tables'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rebuild_ledger()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {UserLedger.objects.count()} user, {DailyLedger.objects.count()} daily '
+            f'and {StatusLedger.objects.count()} status rollups in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Quote
+from api.pricing import reprice_quotes
+
+
+class Command(BaseCommand):
+    help = 'Fill estimated_cost and estimated_delivery from the route rate table in vectorized batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprice every quote, not only those without an order')
+        parser.add_argument('--chunk-size', type=int, help='Quotes priced per vectorized batch')
+
+    def handle(self, *args, **options):
+        queryset = Quote.objects.all() if options['all'] else None
+        started = time.perf_counter()
+        priced, unpriced = reprice_quotes(queryset, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'Repriced {priced} quotes in {elapsed:.2f}s'))
+        if unpriced:
+            self.stdout.write(self.style.WARNING(f'{unpriced} quotes have no route rate and were left unchanged'))
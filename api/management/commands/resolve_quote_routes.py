@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.locations import assign_quote_routes
+from api.models import Quote
+
+
+class Command(BaseCommand):
+    help = 'Resolve the free-text locations of quotes to canonical locations and set their route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Resolve every quote, not only those without a route')
+        parser.add_argument('--chunk-size', type=int, help='Quotes resolved per batch')
+
+    def handle(self, *args, **options):
+        queryset = Quote.objects.all() if options['all'] else Quote.objects.filter(route__isnull=True)
+        started = time.perf_counter()
+        routed, unrouted = assign_quote_routes(queryset, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'Routed {routed} quotes in {elapsed:.2f}s'))
+        if unrouted:
+            self.stdout.write(self.style.WARNING(f'{unrouted} quotes have a location that matches no Location'))
@@ -0,0 +1,76 @@
+import multiprocessing
+import queue
+import signal
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import purge_jobs, work
+
+
+def run_worker(stop, results, batch_size, interval, drain):
+    '''
+    A pool process: interrupts are the parent's to handle, a terminate finishes the current batch first
+    '''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    results.put(work(stop, batch_size, interval, drain))
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs on a pool of worker processes until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker processes, 1 runs jobs in this process')
+        parser.add_argument('--batch-size', type=int, help='Jobs a worker claims at a time')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds an idle worker sleeps')
+        parser.add_argument('--drain', action='store_true', help='Exit once no job is due')
+        parser.add_argument('--purge', action='store_true', help='Delete finished jobs past their retention first')
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            self.stdout.write(f'Purged {purge_jobs()} finished jobs')
+
+        stop = multiprocessing.Event()
+        previous = {signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+        started = time.perf_counter()
+        try:
+            arguments = (options['batch_size'], options['interval'], options['drain'])
+            if options['concurrency'] <= 1:
+                totals = work(stop, *arguments)
+            else:
+                totals = self.run_pool(options['concurrency'], stop, arguments)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+        summary = ', '.join(f'{count} {status.lower()}' for status, count in sorted(totals.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Ran {sum(totals.values())} jobs in {time.perf_counter() - started:.2f}s' + (f': {summary}' if summary else '')
+        ))
+
+    def run_pool(self, concurrency, stop, arguments):
+        # Forked workers must open their own connections rather than share this one
+        connections.close_all()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(stop, results) + arguments)
+            for _ in range(concurrency)
+        ]
+        for process in processes:
+            process.start()
+
+        totals, reported = Counter(), 0
+        while reported < len(processes):
+            try:
+                totals.update(results.get(timeout=1))
+                reported += 1
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    self.stderr.write(f'{len(processes) - reported} workers exited without reporting')
+                    break
+        for process in processes:
+            process.join()
+        return totals
@@ -0,0 +1,243 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.ledger import rebuild_ledger
+from api.locations import assign_quote_routes, location_index
+from api.models import Rider, Location, Quote, RouteRate, Order, OrderStatusEvent, Invoice, Payment
+from api.pricing import pricing_table, reprice_quotes
+User = get_user_model()
+
+PREFIX = 'synthetic-'
+
+TOWNS = ['Nairobi', 'Mombasa', 'Kisumu', 'Nakuru', 'Eldoret', 'Thika', 'Malindi', 'Kitale', 'Garissa', 'Nyeri']
+# Latitude and longitude of each town
+COORDINATES = {
+    'Nairobi': (-1.2864, 36.8172),
+    'Mombasa': (-4.0435, 39.6682),
+    'Kisumu': (-0.0917, 34.7680),
+    'Nakuru': (-0.3031, 36.0800),
+    'Eldoret': (0.5143, 35.2698),
+    'Thika': (-1.0333, 37.0693),
+    'Malindi': (-3.2192, 40.1169),
+    'Kitale': (1.0157, 35.0062),
+    'Garissa': (-0.4532, 39.6461),
+    'Nyeri': (-0.4201, 36.9476),
+}
+ITEMS = ['Parcel', 'Documents', 'Electronics', 'Furniture', 'Clothing', 'Groceries', 'Spare parts', 'Books']
+MOTORS = ['Honda', 'Yamaha', 'Bajaj', 'TVS', 'Suzuki']
+# Statuses synthetic orders are spread over, in lifecycle order
+STATUS_PATH = [Order.PLA, Order.WAR, Order.REL, Order.TRA, Order.DEL]
+
+
+class Command(BaseCommand):
+    help = 'Bulk insert a reproducible synthetic data set of users, riders, quotes, orders and invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Client users')
+        parser.add_argument('--staff', type=int, default=1, help='Staff users')
+        parser.add_argument('--riders', type=int, default=50, help='Riders')
+        parser.add_argument('--quotes', type=int, default=1000, help='Quotes, spread over the client users')
+        parser.add_argument('--orders', type=int, default=500, help='Orders, one per quote')
+        parser.add_argument('--invoices', type=int, default=250, help='Invoices, one per order')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--password', default='synthetic', help='Password of every synthetic user')
+        parser.add_argument('--batch-size', type=int, default=settings.BULK_BATCH_SIZE, help='Rows per bulk insert')
+        parser.add_argument('--clear', action='store_true', help='Delete earlier synthetic data first')
+
+    def handle(self, *args, **options):
+        if options['orders'] > options['quotes'] or options['invoices'] > options['orders']:
+            raise CommandError('Need quotes >= orders >= invoices')
+        if options['quotes'] and not options['users']:
+            raise CommandError('Quotes need at least one client user')
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            if options['clear']:
+                clear()
+            elif User.objects.filter(username__startswith=PREFIX).exists():
+                raise CommandError('Synthetic data already exists, pass --clear to replace it')
+            counts = Seeder(random.Random(options['seed']), options['batch_size']).seed(options)
+        elapsed = time.perf_counter() - started
+
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary} in {elapsed:.2f}s'))
+
+
+def clear():
+    '''
+    Quotes, orders, invoices and events go with their users
+    '''
+    User.objects.filter(username__startswith=PREFIX).delete()
+    Rider.objects.filter(rider_name__startswith=PREFIX).delete()
+
+
+class Seeder:
+    def __init__(self, rng, batch_size):
+        self.rng = rng
+        self.batch_size = batch_size
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def seed(self, options):
+        locations = self.seed_locations()
+        routes = self.seed_routes()
+        users, staff = self.seed_users(options['users'], options['staff'], options['password'])
+        riders = self.seed_riders(options['riders'])
+        quotes = self.seed_quotes(users, options['quotes'])
+        orders = self.seed_orders(quotes[:options['orders']], riders)
+        invoices = self.seed_invoices(orders[:options['invoices']])
+        return {
+            'locations': locations,
+            'routes': routes,
+            'users': len(users),
+            'staff': len(staff),
+            'riders': len(riders),
+            'quotes': len(quotes),
+            'orders': len(orders),
+            'invoices': invoices,
+        }
+
+    def seed_locations(self):
+        before = Location.objects.count()
+        Location.objects.bulk_create([
+            Location(name=town, latitude=latitude, longitude=longitude)
+            for town, (latitude, longitude) in COORDINATES.items()
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+        location_index.clear()
+        return Location.objects.count() - before
+
+    def seed_routes(self):
+        rates = [
+            RouteRate(
+                location_from=location_from,
+                location_to=location_to,
+                base_cost=self.rng.randrange(200, 2000, 50),
+                cost_per_kg=self.rng.randrange(10, 100, 5),
+                delivery_hours=self.rng.randrange(6, 72, 6)
+            )
+            for location_from in TOWNS for location_to in TOWNS if location_from != location_to
+        ]
+        before = RouteRate.objects.count()
+        RouteRate.objects.bulk_create(rates, batch_size=self.batch_size, ignore_conflicts=True)
+        pricing_table.clear()
+        return RouteRate.objects.count() - before
+
+    def seed_users(self, count, staff_count, password):
+        # Hashing is deliberately slow, every synthetic user shares one hash
+        password = make_password(password)
+        users = [
+            User(username=f'{PREFIX}{n}', email=f'{PREFIX}{n}@example.com', password=password)
+            for n in range(count)
+        ] + [
+            User(username=f'{PREFIX}staff-{n}', email=f'{PREFIX}staff-{n}@example.com', password=password, is_staff=True)
+            for n in range(staff_count)
+        ]
+        User.objects.bulk_create(users, batch_size=self.batch_size)
+        # Not every backend returns primary keys from bulk inserts, read them back
+        created = list(User.objects.filter(username__startswith=PREFIX).order_by('id'))
+        return [user for user in created if not user.is_staff], [user for user in created if user.is_staff]
+
+    def seed_riders(self, count):
+        Rider.objects.bulk_create([
+            Rider(
+                rider_name=f'{PREFIX}{n}',
+                rider_motor=self.rng.choice(MOTORS),
+                location=self.rng.choice(TOWNS)
+            )
+            for n in range(count)
+        ], batch_size=self.batch_size)
+        return list(Rider.objects.filter(rider_name__startswith=PREFIX).order_by('id'))
+
+    def seed_quotes(self, users, count):
+        quotes = []
+        for n in range(count):
+            location_from, location_to = self.rng.sample(TOWNS, 2)
+            quotes.append(Quote(
+                item_name=self.rng.choice(ITEMS),
+                item_description=f'Synthetic quote {n}',
+                location_from=location_from,
+                location_to=location_to,
+                item_weight=round(self.rng.uniform(0.1, 40), 1),
+                client_review_status=self.rng.random() < 0.5,
+                user=self.rng.choice(users)
+            ))
+        Quote.objects.bulk_create(quotes, batch_size=self.batch_size)
+        quotes = Quote.objects.filter(user__username__startswith=PREFIX)
+        reprice_quotes(quotes)
+        assign_quote_routes(quotes)
+        return list(quotes.order_by('id'))
+
+    def seed_orders(self, quotes, riders):
+        now = timezone.now()
+        free_riders = list(riders)
+        self.rng.shuffle(free_riders)
+        orders = []
+        for quote in quotes:
+            status = self.rng.choice(STATUS_PATH)
+            rider = None
+            if STATUS_PATH.index(status) >= STATUS_PATH.index(Order.REL) and free_riders:
+                rider = free_riders.pop()
+            paid = status != Order.PLA and self.rng.random() < 0.8
+            orders.append(Order(
+                tracking_number=self.uuid(),
+                payment_ref=f'SYN{self.rng.getrandbits(40):012X}',
+                payment_complete_status=paid,
+                order_status=status,
+                status_changed_ts=now - timedelta(hours=self.rng.randrange(0, 240)),
+                rider=rider,
+                quote=quote
+            ))
+        Order.objects.bulk_create(orders, batch_size=self.batch_size)
+
+        tracking = {order.tracking_number: order for order in orders}
+        created = list(Order.objects.select_related('quote').filter(tracking_number__in=tracking).order_by('id'))
+        events = []
+        for order in created:
+            # Walk the lifecycle up to the order's status, one event per step
+            steps = STATUS_PATH[:STATUS_PATH.index(order.order_status) + 1]
+            for position, status in enumerate(steps):
+                events.append(OrderStatusEvent(
+                    order=order,
+                    from_status=steps[position - 1] if position else '',
+                    to_status=status,
+                    created_ts=order.status_changed_ts - timedelta(hours=len(steps) - 1 - position)
+                ))
+        OrderStatusEvent.objects.bulk_create(events, batch_size=self.batch_size)
+        return created
+
+    def seed_invoices(self, orders):
+        '''
+        Invoices and their payments go in with bulk inserts, which skip the
+        ledger, so the invoice amounts and rollups are rebuilt afterwards
+        '''
+        invoices = [
+            Invoice(total_amount=order.quote.estimated_cost or 0, order=order, quote_id=order.quote_id)
+            for order in orders
+        ]
+        Invoice.objects.bulk_create(invoices, batch_size=self.batch_size)
+
+        created = Invoice.objects.filter(order__in=orders).select_related('order').order_by('id')
+        payments = []
+        for invoice in created:
+            total = invoice.total_amount
+            paid = total if invoice.order.payment_complete_status else self.rng.choice([0, total // 2])
+            if paid:
+                payments.append(Payment(
+                    invoice=invoice,
+                    amount=paid,
+                    reference=invoice.order.payment_ref if paid == total else f'SYN{self.rng.getrandbits(40):012X}',
+                    created_ts=invoice.order.status_changed_ts
+                ))
+        Payment.objects.bulk_create(payments, batch_size=self.batch_size)
+        rebuild_ledger()
+        return len(invoices)
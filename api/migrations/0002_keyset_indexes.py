@@ -0,0 +1,29 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_ts', 'id'], name='invoice_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_ts', 'id'], name='order_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quote',
+            index=models.Index(fields=['created_ts', 'id'], name='quote_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rider',
+            index=models.Index(fields=['created_ts', 'id'], name='rider_created_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:20
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_status_events(apps, schema_editor):
+    '''
+    Seed the history with each existing order's current status
+    '''
+    Order = apps.get_model('api', 'Order')
+    OrderStatusEvent = apps.get_model('api', 'OrderStatusEvent')
+    Order.objects.update(status_changed_ts=models.F('updated_ts'))
+
+    events = (
+        OrderStatusEvent(order_id=pk, to_status=status, created_ts=updated_ts)
+        for pk, status, updated_ts in Order.objects.values_list('pk', 'order_status', 'updated_ts').iterator()
+    )
+    while True:
+        batch = list(islice(events, 1000))
+        if not batch:
+            break
+        OrderStatusEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='status_changed_ts',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('PLACED', 'Order Placed'), ('WAREHOUSE', 'In the warehouse'), ('RELEASED', 'Released to rider'), ('TRANSIT', 'On transit'), ('DELIVERED', 'Delivered')], max_length=10)),
+                ('to_status', models.CharField(choices=[('PLACED', 'Order Placed'), ('WAREHOUSE', 'In the warehouse'), ('RELEASED', 'Released to rider'), ('TRANSIT', 'On transit'), ('DELIVERED', 'Delivered')], max_length=10)),
+                ('created_ts', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='api.order')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='status_events', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='orderstatusevent',
+            index=models.Index(fields=['order', 'created_ts'], name='status_event_order_idx'),
+        ),
+        migrations.RunPython(backfill_status_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_order_status_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rider',
+            name='location',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
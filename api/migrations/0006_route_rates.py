@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_rider_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_from', models.CharField(max_length=32)),
+                ('location_to', models.CharField(max_length=32)),
+                ('base_cost', models.IntegerField()),
+                ('cost_per_kg', models.IntegerField(default=0)),
+                ('delivery_hours', models.IntegerField()),
+                ('created_ts', models.DateTimeField(auto_now_add=True)),
+                ('updated_ts', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='quote',
+            name='item_weight',
+            field=models.FloatField(blank=True, help_text='Weight in kilograms', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='routerate',
+            constraint=models.UniqueConstraint(fields=('location_from', 'location_to'), name='unique_route_rate'),
+        ),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+from api.ledger import rebuild_ledger
+
+
+def backfill_ledger(apps, schema_editor):
+    '''
+    Amounts paid so far become one opening payment per invoice, then the
+    invoice amounts and the rollups are rebuilt from the ledger
+    '''
+    Invoice = apps.get_model('api', 'Invoice')
+    Payment = apps.get_model('api', 'Payment')
+    Payment.objects.bulk_create([
+        Payment(invoice_id=pk, amount=amount_paid, created_ts=updated_ts)
+        for pk, amount_paid, updated_ts in Invoice.objects.filter(amount_paid__gt=0).values_list('pk', 'amount_paid', 'updated_ts').iterator()
+    ], batch_size=1000)
+    rebuild_ledger(apps.get_model)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_route_rates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLedger',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('invoiced', models.BigIntegerField(default=0)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('collected', models.BigIntegerField(default=0)),
+                ('updated_ts', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('reference', models.CharField(blank=True, max_length=64)),
+                ('created_ts', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatusLedger',
+            fields=[
+                ('status', models.CharField(choices=[('UNPAID', 'Unpaid'), ('PARTIAL', 'Partially paid'), ('PAID', 'Paid')], max_length=10, primary_key=True, serialize=False)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('invoiced', models.BigIntegerField(default=0)),
+                ('paid', models.BigIntegerField(default=0)),
+                ('due', models.BigIntegerField(default=0)),
+                ('updated_ts', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserLedger',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger', serialize=False, to='api.user')),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('invoiced', models.BigIntegerField(default=0)),
+                ('paid', models.BigIntegerField(default=0)),
+                ('due', models.BigIntegerField(default=0)),
+                ('updated_ts', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='payment_status',
+            field=models.CharField(choices=[('UNPAID', 'Unpaid'), ('PARTIAL', 'Partially paid'), ('PAID', 'Paid')], default='UNPAID', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='userledger',
+            index=models.Index(fields=['-due'], name='user_ledger_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='invoice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='api.invoice'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['invoice', 'created_ts'], name='payment_invoice_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(_negated=True, reference=''), fields=('reference',), name='unique_payment_reference'),
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='invoice',
+            name='amount_due',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='amount_paid',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_invoice_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentCallback',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=64, unique=True)),
+                ('payment_ref', models.CharField(max_length=32)),
+                ('amount', models.IntegerField()),
+                ('succeeded', models.BooleanField()),
+                ('received_ts', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_ts', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, choices=[('APPLIED', 'Applied to the order'), ('DUPLICATE', 'Payment already recorded'), ('FAILED', 'Payment failed at the provider'), ('UNMATCHED', 'No order has this payment reference'), ('AMBIGUOUS', 'Several orders have this payment reference')], max_length=10)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_ref'], name='order_payment_ref_idx'),
+        ),
+        migrations.AddField(
+            model_name='paymentcallback',
+            name='order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_callbacks', to='api.order'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentcallback',
+            index=models.Index(condition=models.Q(processed_ts__isnull=True), fields=['id'], name='callback_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.7 on 2026-10-18 19:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_locations_routes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_status', models.CharField(choices=[('PLANNED', 'Planned'), ('ACTIVE', 'On the road'), ('DONE', 'Completed')], default='PLANNED', max_length=10)),
+                ('departure_ts', models.DateTimeField()),
+                ('distance_km', models.FloatField()),
+                ('duration_minutes', models.IntegerField()),
+                ('created_ts', models.DateTimeField(auto_now_add=True)),
+                ('updated_ts', models.DateTimeField(auto_now=True)),
+                ('depot', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='delivery_runs', to='api.location')),
+                ('rider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='delivery_runs', to='api.rider')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DeliveryStop',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.IntegerField()),
+                ('eta', models.DateTimeField()),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_stop', to='api.order')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stops', to='api.deliveryrun')),
+            ],
+            options={
+                'ordering': ['run', 'sequence'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='deliverystop',
+            constraint=models.UniqueConstraint(fields=('run', 'sequence'), name='unique_run_sequence'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrun',
+            index=models.Index(fields=['created_ts', 'id'], name='run_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryrun',
+            index=models.Index(fields=['depot', 'run_status'], name='run_depot_status_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.1.7 on 2026-10-18 20:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_delivery_runs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('key', models.CharField(blank=True, max_length=100)),
+                ('priority', models.SmallIntegerField(default=0)),
+                ('job_status', models.CharField(choices=[('QUEUED', 'Waiting to run'), ('RUNNING', 'Claimed by a worker'), ('DONE', 'Finished'), ('FAILED', 'Gave up after the last attempt')], default='QUEUED', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_ts', models.DateTimeField(auto_now_add=True)),
+                ('started_ts', models.DateTimeField(blank=True, null=True)),
+                ('finished_ts', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(job_status='QUEUED'), fields=['-priority', 'run_at', 'id'], name='job_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(job_status='RUNNING'), fields=['started_ts'], name='job_running_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('job_status', 'QUEUED'), models.Q(_negated=True, key='')), fields=('key',), name='unique_queued_job_key'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentcallback',
+            name='outcome',
+            field=models.CharField(blank=True, choices=[('APPLIED', 'Applied to the order'), ('DUPLICATE', 'Payment already recorded'), ('FAILED', 'Payment failed at the provider'), ('UNMATCHED', 'No order has this payment reference'), ('AMBIGUOUS', 'Several orders have this payment reference'), ('UNINVOICED', 'Waiting for the order to be invoiced')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-18 20:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_payment_callback_uninvoiced'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='rider',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='api.rider'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(_negated=True, order_status='DELIVERED'), fields=('rider',), name='order_one_active_per_rider'),
+        ),
+    ]
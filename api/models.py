@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 from phonenumber_field.modelfields import PhoneNumberField
 
@@ -15,24 +16,104 @@ class Rider(models.Model):
     rider_name = models.CharField(max_length=32, blank=False, null=False)
     rider_motor = models.CharField(max_length=32, blank=False, null=False)
     rider_phone = PhoneNumberField(null=True, blank=True, unique=True)
+    location = models.CharField(max_length=32, blank=True, default='')
     created_ts = models.DateTimeField(auto_now_add=True)
     updated_ts = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_ts', 'id'], name='rider_created_keyset_idx'),
+        ]
+
+class Location(models.Model):
+    '''
+    Canonical place that free-text quote locations are resolved to, see api.locations
+    '''
+    name = models.CharField(max_length=32, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    created_ts = models.DateTimeField(auto_now_add=True)
+    updated_ts = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+class LocationAlias(models.Model):
+    '''
+    Another spelling of a location, stored normalized
+    '''
+    alias = models.CharField(max_length=64, unique=True)
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='aliases')
+    created_ts = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.alias} -> {self.location_id}'
+
+class Route(models.Model):
+    '''
+    A pair of canonical locations quotes are grouped by. distance_km and
+    duration_minutes are copied from the distance matrix when the route is
+    created, and refreshed when the matrix is rebuilt.
+    '''
+    origin = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='routes_from')
+    destination = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='routes_to')
+    distance_km = models.FloatField(blank=True, null=True)
+    duration_minutes = models.IntegerField(blank=True, null=True)
+    created_ts = models.DateTimeField(auto_now_add=True)
+    updated_ts = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['origin', 'destination'], name='unique_route'),
+        ]
+
+    def __str__(self):
+        return f'{self.origin_id} - {self.destination_id}'
+
 class Quote(models.Model):
     item_name = models.CharField(max_length=32, blank=False, null=False)
     item_description = models.TextField(max_length=300, blank=False, null=False)    
     location_from = models.CharField(max_length=32, blank=False, null=False)
     location_to = models.CharField(max_length=32, blank=False, null=False)
+    item_weight = models.FloatField(blank=True, null=True, help_text='Weight in kilograms')
     estimated_delivery = models.DateTimeField(blank=True, null=True)
     estimated_cost = models.IntegerField(blank=True, null=True)
     client_review_status = models.BooleanField(default=False)
     created_ts = models.DateTimeField(auto_now_add=True)
     updated_ts = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='poster')
+    # Resolved from location_from and location_to, null when either is unknown
+    route = models.ForeignKey(Route, on_delete=models.SET_NULL, related_name='quotes', blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_ts', 'id'], name='quote_created_keyset_idx'),
+            models.Index(fields=['user', 'created_ts'], name='quote_user_created_idx'),
+        ]
 
     def __str__(self):
         return self.item_name
 
+class RouteRate(models.Model):
+    '''
+    Price and lead time for shipping between two locations
+    '''
+    location_from = models.CharField(max_length=32, blank=False, null=False)
+    location_to = models.CharField(max_length=32, blank=False, null=False)
+    base_cost = models.IntegerField()
+    cost_per_kg = models.IntegerField(default=0)
+    delivery_hours = models.IntegerField()
+    created_ts = models.DateTimeField(auto_now_add=True)
+    updated_ts = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['location_from', 'location_to'], name='unique_route_rate'),
+        ]
+
+    def __str__(self):
+        return f'{self.location_from} - {self.location_to}'
+
 class Order(models.Model):
     PLA = "PLACED"
     WAR = "WAREHOUSE"
@@ -48,21 +129,398 @@ class Order(models.Model):
         (DEL, "Delivered")
     )
 
+    TRANSITIONS = {
+        PLA: [WAR],
+        WAR: [REL],
+        REL: [TRA],
+        TRA: [DEL],
+        DEL: []
+    }
+
     tracking_number = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     payment_ref = models.CharField(max_length=32, blank=True)
     payment_complete_status = models.BooleanField(default=False)
     order_status = models.CharField(max_length=10, choices=DELIVERY_CHOICES, default=PLA)
+    status_changed_ts = models.DateTimeField(default=timezone.now)
     created_ts = models.DateTimeField(auto_now_add=True)
     updated_ts = models.DateTimeField(auto_now=True)
-    rider = models.OneToOneField(Rider, on_delete=models.CASCADE, related_name='riderorder', blank=True, null=True)
+    rider = models.ForeignKey(Rider, on_delete=models.CASCADE, related_name='orders', blank=True, null=True)
     quote = models.OneToOneField(Quote, on_delete=models.CASCADE, related_name='order')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_ts', 'id'], name='order_created_keyset_idx'),
+            models.Index(fields=['order_status', 'updated_ts'], name='order_status_updated_idx'),
+            models.Index(
+                fields=['created_ts'],
+                name='order_unpaid_idx',
+                condition=models.Q(payment_complete_status=False)
+            ),
+            models.Index(fields=['payment_ref'], name='order_payment_ref_idx'),
+        ]
+        constraints = [
+            # A rider keeps their delivered orders, but carries one order at a time
+            models.UniqueConstraint(
+                fields=['rider'],
+                name='order_one_active_per_rider',
+                condition=~models.Q(order_status='DELIVERED')
+            ),
+        ]
+
+    @classmethod
+    def can_transition(cls, from_status, to_status):
+        return to_status in cls.TRANSITIONS.get(from_status, [])
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                OrderStatusEvent.objects.create(
+                    order=self,
+                    to_status=self.order_status,
+                    created_ts=self.status_changed_ts
+                )
+
+    def transition_to(self, status, user=None):
+        '''
+        Move the order to a new status and append the event in the same transaction
+        '''
+        with transaction.atomic():
+            current = Order.objects.select_for_update().values_list('order_status', flat=True).get(pk=self.pk)
+            if not self.can_transition(current, status):
+                raise InvalidStatusTransition(current, status)
+
+            self.order_status = status
+            self.status_changed_ts = timezone.now()
+            self.save(update_fields=['order_status', 'status_changed_ts', 'updated_ts'])
+            OrderStatusEvent.objects.create(
+                order=self,
+                from_status=current,
+                to_status=status,
+                user=user,
+                created_ts=self.status_changed_ts
+            )
+
+
+class InvalidStatusTransition(Exception):
+    def __init__(self, from_status, to_status):
+        self.from_status = from_status
+        self.to_status = to_status
+        super().__init__(f'Cannot move an order from {from_status} to {to_status}')
+
+
+class OrderStatusEvent(models.Model):
+    '''
+    Append-only history of order status changes. The latest status is kept
+    on Order itself (order_status, status_changed_ts) so list views never
+    aggregate over this table.
+    '''
+    from_status = models.CharField(max_length=10, choices=Order.DELIVERY_CHOICES, blank=True)
+    to_status = models.CharField(max_length=10, choices=Order.DELIVERY_CHOICES)
+    created_ts = models.DateTimeField(default=timezone.now)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='status_events', blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'created_ts'], name='status_event_order_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Order status events are append-only')
+        super().save(*args, **kwargs)
+
+
+class DeliveryRun(models.Model):
+    '''
+    A multi-stop trip from a depot, planned by api.planning. One rider can
+    drive many runs and one run carries many orders, in stop order.
+    '''
+    PLANNED = "PLANNED"
+    ACTIVE = "ACTIVE"
+    DONE = "DONE"
+
+    RUN_STATUS_CHOICES = (
+        (PLANNED, "Planned"),
+        (ACTIVE, "On the road"),
+        (DONE, "Completed")
+    )
+
+    depot = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='delivery_runs')
+    rider = models.ForeignKey(Rider, on_delete=models.SET_NULL, related_name='delivery_runs', blank=True, null=True)
+    run_status = models.CharField(max_length=10, choices=RUN_STATUS_CHOICES, default=PLANNED)
+    departure_ts = models.DateTimeField()
+    distance_km = models.FloatField()
+    duration_minutes = models.IntegerField()
+    created_ts = models.DateTimeField(auto_now_add=True)
+    updated_ts = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_ts', 'id'], name='run_created_keyset_idx'),
+            models.Index(fields=['depot', 'run_status'], name='run_depot_status_idx'),
+        ]
+
+
+class DeliveryStop(models.Model):
+    '''
+    An order's place in a delivery run and its planned arrival
+    '''
+    run = models.ForeignKey(DeliveryRun, on_delete=models.CASCADE, related_name='stops')
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='delivery_stop')
+    sequence = models.IntegerField()
+    eta = models.DateTimeField()
+
+    class Meta:
+        ordering = ['run', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'sequence'], name='unique_run_sequence'),
+        ]
+
 
 class Invoice(models.Model):
+    UNPAID = "UNPAID"
+    PARTIAL = "PARTIAL"
+    PAID = "PAID"
+
+    PAYMENT_STATUS_CHOICES = (
+        (UNPAID, "Unpaid"),
+        (PARTIAL, "Partially paid"),
+        (PAID, "Paid")
+    )
+
     total_amount = models.IntegerField(blank=True, null=True)
-    amount_paid = models.IntegerField(blank=True, null=True)
-    amount_due = models.IntegerField(blank=True, null=True)
+    # Maintained from the payments ledger, see api.ledger
+    amount_paid = models.IntegerField(default=0)
+    amount_due = models.IntegerField(default=0)
+    payment_status = models.CharField(max_length=10, choices=PAYMENT_STATUS_CHOICES, default=UNPAID)
     created_ts = models.DateTimeField(auto_now_add=True)
     updated_ts = models.DateTimeField(auto_now=True)
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='orderinvoice')
     quote = models.OneToOneField(Quote, on_delete=models.CASCADE, related_name='quoteinvoice')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_ts', 'id'], name='invoice_created_keyset_idx'),
+            models.Index(
+                fields=['created_ts'],
+                name='invoice_outstanding_idx',
+                condition=models.Q(amount_due__gt=0)
+            ),
+        ]
+
+    @classmethod
+    def get_payment_status(cls, total_amount, amount_paid):
+        if amount_paid <= 0:
+            return cls.UNPAID
+        return cls.PAID if (total_amount or 0) - amount_paid <= 0 else cls.PARTIAL
+
+    def save(self, *args, **kwargs):
+        '''
+        amount_paid only changes through the payments ledger; amount_due,
+        payment_status and the rollups follow total_amount here
+        '''
+        from .ledger import apply_invoice_change, invoice_state
+
+        with transaction.atomic():
+            before = None
+            if not self._state.adding:
+                previous = Invoice.objects.select_for_update().filter(pk=self.pk).first()
+                if previous is not None:
+                    before = invoice_state(previous)
+                    self.amount_paid = previous.amount_paid
+            if self._state.adding:
+                self.amount_paid = 0
+            self.amount_due = (self.total_amount or 0) - self.amount_paid
+            self.payment_status = self.get_payment_status(self.total_amount, self.amount_paid)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'amount_paid', 'amount_due', 'payment_status'}
+            super().save(*args, **kwargs)
+            apply_invoice_change(before, invoice_state(self))
+
+
+class Payment(models.Model):
+    '''
+    Append-only ledger of money received against an invoice; refunds are
+    negative amounts. A non-empty reference is unique, so recording the
+    same provider payment twice is a no-op.
+    '''
+    amount = models.IntegerField()
+    reference = models.CharField(max_length=64, blank=True)
+    created_ts = models.DateTimeField(default=timezone.now)
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='payments')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='payments', blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['invoice', 'created_ts'], name='payment_invoice_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['reference'],
+                name='unique_payment_reference',
+                condition=~models.Q(reference='')
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Payments are append-only')
+        super().save(*args, **kwargs)
+
+
+class PaymentCallback(models.Model):
+    '''
+    Queue of payment provider callbacks. The webhook only validates and
+    inserts them; api.payments.process_callbacks drains the queue in
+    batches and records the outcome. event_id is the provider's id for
+    the event, so a redelivered callback is never queued twice. Callbacks
+    for an order that cannot be invoiced yet wait, still unprocessed, as
+    UNINVOICED until its invoice is created.
+    '''
+    APPLIED = "APPLIED"
+    DUPLICATE = "DUPLICATE"
+    FAILED = "FAILED"
+    UNMATCHED = "UNMATCHED"
+    AMBIGUOUS = "AMBIGUOUS"
+    UNINVOICED = "UNINVOICED"
+
+    OUTCOME_CHOICES = (
+        (APPLIED, "Applied to the order"),
+        (DUPLICATE, "Payment already recorded"),
+        (FAILED, "Payment failed at the provider"),
+        (UNMATCHED, "No order has this payment reference"),
+        (AMBIGUOUS, "Several orders have this payment reference"),
+        (UNINVOICED, "Waiting for the order to be invoiced")
+    )
+
+    event_id = models.CharField(max_length=64, unique=True)
+    payment_ref = models.CharField(max_length=32)
+    amount = models.IntegerField()
+    succeeded = models.BooleanField()
+    received_ts = models.DateTimeField(default=timezone.now)
+    processed_ts = models.DateTimeField(blank=True, null=True)
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES, blank=True)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, related_name='payment_callbacks', blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='callback_pending_idx',
+                condition=models.Q(processed_ts__isnull=True)
+            ),
+        ]
+
+
+class UserLedger(models.Model):
+    '''
+    Running invoice totals per client
+    '''
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='ledger')
+    invoice_count = models.IntegerField(default=0)
+    invoiced = models.BigIntegerField(default=0)
+    paid = models.BigIntegerField(default=0)
+    due = models.BigIntegerField(default=0)
+    updated_ts = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-due'], name='user_ledger_due_idx'),
+        ]
+
+
+class DailyLedger(models.Model):
+    '''
+    Invoiced amounts by the day invoices were raised, collections by the day they were paid
+    '''
+    day = models.DateField(primary_key=True)
+    invoice_count = models.IntegerField(default=0)
+    invoiced = models.BigIntegerField(default=0)
+    payment_count = models.IntegerField(default=0)
+    collected = models.BigIntegerField(default=0)
+    updated_ts = models.DateTimeField(auto_now=True)
+
+
+class StatusLedger(models.Model):
+    '''
+    Running invoice totals per payment status
+    '''
+    status = models.CharField(max_length=10, choices=Invoice.PAYMENT_STATUS_CHOICES, primary_key=True)
+    invoice_count = models.IntegerField(default=0)
+    invoiced = models.BigIntegerField(default=0)
+    paid = models.BigIntegerField(default=0)
+    due = models.BigIntegerField(default=0)
+    updated_ts = models.DateTimeField(auto_now=True)
+
+
+class Job(models.Model):
+    '''
+    Database-backed queue of background work. Views and signals enqueue
+    jobs with api.jobs.enqueue; run_workers claims them by priority and
+    runs the task registered under their name with the payload as keyword
+    arguments, retrying failures with exponential backoff. A non-empty key
+    is unique among queued jobs, so the same work is never queued twice.
+    '''
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+    STATUS_CHOICES = (
+        (QUEUED, "Waiting to run"),
+        (RUNNING, "Claimed by a worker"),
+        (DONE, "Finished"),
+        (FAILED, "Gave up after the last attempt")
+    )
+
+    HIGH = 10
+    NORMAL = 0
+    LOW = -10
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    key = models.CharField(max_length=100, blank=True)
+    priority = models.SmallIntegerField(default=NORMAL)
+    job_status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_ts = models.DateTimeField(auto_now_add=True)
+    started_ts = models.DateTimeField(blank=True, null=True)
+    finished_ts = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-priority', 'run_at', 'id'],
+                name='job_queued_idx',
+                condition=models.Q(job_status='QUEUED')
+            ),
+            models.Index(
+                fields=['started_ts'],
+                name='job_running_idx',
+                condition=models.Q(job_status='RUNNING')
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                name='unique_queued_job_key',
+                condition=models.Q(job_status='QUEUED') & ~models.Q(key='')
+            ),
+        ]
+
+
+class Checkpoint(models.Model):
+    '''
+    Where a resumable backfill got to, saved in the same transaction as
+    each chunk it covers so a restart neither skips nor repeats work
+    '''
+    name = models.CharField(max_length=100, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_ts = models.DateTimeField(auto_now=True)
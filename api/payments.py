@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .invoicing import generate_invoice
+from .ledger import record_payments
+from .models import Order, Invoice, Payment, PaymentCallback
+
+
+def sign_callback(body, secret=None):
+    '''
+    Hex HMAC-SHA256 of a raw callback body, as sent in the signature header
+    '''
+    secret = settings.PAYMENT_WEBHOOK_SECRET if secret is None else secret
+    return hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def verify_callback(body, signature):
+    return bool(settings.PAYMENT_WEBHOOK_SECRET) and hmac.compare_digest(sign_callback(body), signature or '')
+
+
+def enqueue_callbacks(callbacks):
+    '''
+    Queue validated callbacks with one INSERT; redelivered events are
+    dropped by the unique event_id
+    '''
+    PaymentCallback.objects.bulk_create(
+        [PaymentCallback(**callback) for callback in callbacks],
+        batch_size=settings.BULK_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def match_orders(payment_refs):
+    orders = {}
+    queryset = Order.objects.select_related('orderinvoice').filter(payment_ref__in=payment_refs)
+    for order in queryset.select_for_update(of=('self',)).order_by('pk'):
+        orders.setdefault(order.payment_ref, []).append(order)
+    return orders
+
+
+def invoice_for(order):
+    '''
+    The id of the order's invoice, invoicing it now if it has none yet,
+    or None if it cannot be invoiced
+    '''
+    try:
+        return order.orderinvoice.pk
+    except Invoice.DoesNotExist:
+        invoice = generate_invoice(order.pk)
+        if invoice is None:
+            return None
+        # Later callbacks of the batch for this order find it
+        order.orderinvoice = invoice
+        return invoice.pk
+
+
+def process_callbacks(batch_size=None):
+    '''
+    Process one batch of queued callbacks. Successful payments are matched
+    to an order by payment_ref and recorded against its invoice with
+    record_payments, using the event id as the payment reference so a
+    callback can never be applied twice. An order not invoiced yet is
+    invoiced first; one that cannot be, as its quote is unpriced, keeps
+    its callbacks waiting as UNINVOICED until generate_invoice releases
+    them. Orders whose invoice is settled are marked paid. Callbacks are
+    claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several workers can
+    run at once. Returns a Counter of outcomes.
+    '''
+    from .signals import invalidate_instances
+
+    batch_size = batch_size or settings.PAYMENT_CALLBACK_BATCH_SIZE
+    with transaction.atomic():
+        callbacks = list(
+            PaymentCallback.objects.select_for_update(skip_locked=True)
+            .filter(processed_ts__isnull=True)
+            .exclude(outcome=PaymentCallback.UNINVOICED)
+            .order_by('id')[:batch_size]
+        )
+        if not callbacks:
+            return Counter()
+
+        orders = match_orders({callback.payment_ref for callback in callbacks if callback.succeeded})
+        payments = {}
+        for callback in callbacks:
+            matches = orders.get(callback.payment_ref, []) if callback.succeeded else []
+            if not callback.succeeded:
+                callback.outcome = PaymentCallback.FAILED
+            elif not matches:
+                callback.outcome = PaymentCallback.UNMATCHED
+            elif len(matches) > 1:
+                callback.outcome = PaymentCallback.AMBIGUOUS
+            else:
+                callback.order = matches[0]
+                invoice_id = invoice_for(callback.order)
+                if invoice_id is None:
+                    callback.outcome = PaymentCallback.UNINVOICED
+                    continue
+                callback.outcome = PaymentCallback.APPLIED
+                payments[callback.pk] = Payment(invoice_id=invoice_id, amount=callback.amount, reference=callback.event_id)
+
+        created, invoices = record_payments(list(payments.values()))
+        created = {payment.reference for payment in created}
+        settled = {invoice.order_id for invoice in invoices.values() if invoice.payment_status == Invoice.PAID}
+
+        now = timezone.now()
+        paid_orders = {}
+        for callback in callbacks:
+            if callback.outcome == PaymentCallback.UNINVOICED:
+                continue
+            callback.processed_ts = now
+            if callback.outcome != PaymentCallback.APPLIED:
+                continue
+            if payments[callback.pk].reference not in created:
+                callback.outcome = PaymentCallback.DUPLICATE
+            elif callback.order_id in settled:
+                paid_orders[callback.order_id] = callback.order
+
+        paid_orders = [order for order in paid_orders.values() if not order.payment_complete_status]
+        for order in paid_orders:
+            order.payment_complete_status = True
+            order.updated_ts = now
+        Order.objects.bulk_update(paid_orders, ['payment_complete_status', 'updated_ts'], batch_size=settings.BULK_BATCH_SIZE)
+        PaymentCallback.objects.bulk_update(callbacks, ['processed_ts', 'outcome', 'order'], batch_size=settings.BULK_BATCH_SIZE)
+        invalidate_instances(Order, paid_orders)
+
+    return Counter(callback.outcome for callback in callbacks)
+
+
+def purge_callbacks(days=None):
+    '''
+    Delete processed callbacks older than PAYMENT_CALLBACK_RETENTION_DAYS.
+    A redelivery after that is still caught by the payment reference.
+    '''
+    days = settings.PAYMENT_CALLBACK_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = PaymentCallback.objects.filter(processed_ts__lt=cutoff).delete()
+    return deleted
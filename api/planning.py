@@ -0,0 +1,253 @@
+import math
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .locations import distance_matrix
+from .models import Order, DeliveryRun, DeliveryStop
+
+# nodes, weights and deadlines are per stop; node is a row of distances and durations,
+# the depot's included, and deadlines are minutes after departure (inf for none)
+RunProblem = namedtuple('RunProblem', ['depot', 'nodes', 'weights', 'deadlines', 'distances', 'durations'])
+RunLimits = namedtuple('RunLimits', ['capacity_kg', 'max_stops', 'max_minutes', 'stop_minutes'])
+# stops index into the problem's per-stop arrays, arrivals are minutes after departure
+PlannedRun = namedtuple('PlannedRun', ['stops', 'arrivals', 'distance_km', 'duration_minutes'])
+
+
+def get_limits():
+    return RunLimits(
+        capacity_kg=settings.RUN_CAPACITY_KG,
+        max_stops=settings.RUN_MAX_STOPS,
+        max_minutes=settings.RUN_MAX_MINUTES,
+        stop_minutes=settings.RUN_STOP_MINUTES
+    )
+
+
+def plan_runs(problem, limits):
+    '''
+    Split a depot's stops into runs and order each run's stops.
+
+    Runs are built one at a time by nearest neighbour: from the last stop,
+    drive to the closest stop that still fits the run's capacity, its
+    deadline, and the run's time limit including the drive back to the
+    depot. Each step is one vectorized pass over the remaining stops.
+    Every finished run is then improved with 2-opt, see two_opt.
+
+    Returns (runs, unplanned stop indices); a stop is unplanned when it
+    cannot be served even by a run of its own.
+    '''
+    depot, nodes, weights, deadlines, distances, durations = problem
+    nodes = np.asarray(nodes, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+    deadlines = np.asarray(deadlines, dtype=np.float64)
+    to_depot = durations[nodes, depot]
+    remaining = np.ones(len(nodes), dtype=bool)
+
+    runs = []
+    while remaining.any():
+        stops, load, clock, here = [], 0.0, 0.0, depot
+        while len(stops) < limits.max_stops:
+            arrivals = clock + durations[here, nodes]
+            feasible = (
+                remaining
+                & (load + weights <= limits.capacity_kg)
+                & (arrivals <= deadlines)
+                & (arrivals + limits.stop_minutes + to_depot <= limits.max_minutes)
+            )
+            if not feasible.any():
+                break
+            stop = int(np.argmin(np.where(feasible, distances[here, nodes], np.inf)))
+            stops.append(stop)
+            remaining[stop] = False
+            load += weights[stop]
+            clock = arrivals[stop] + limits.stop_minutes
+            here = nodes[stop]
+
+        if not stops:
+            # Nothing left fits a run starting empty from the depot
+            break
+        runs.append(two_opt(stops, problem, limits))
+
+    return runs, [int(stop) for stop in np.flatnonzero(remaining)]
+
+
+def two_opt(stops, problem, limits):
+    '''
+    Reverse segments of a run while that shortens it and keeps every
+    stop within its deadline, until no reversal helps. Works on plain
+    lists over the run's own stops, which are few, rather than the arrays.
+    '''
+    depot, nodes, _, deadlines, distances, durations = problem
+    # Position 0 is the depot, position i the run's i-th stop
+    local = [depot] + [int(nodes[stop]) for stop in stops]
+    index = np.array(local)
+    distance = distances[np.ix_(index, index)].tolist()
+    duration = durations[np.ix_(index, index)].tolist()
+    deadline = [math.inf] + [float(deadlines[stop]) for stop in stops]
+
+    def schedule(route):
+        '''
+        Arrival at every stop and the return time, or None if a deadline is missed
+        '''
+        arrivals, clock, here = [], 0.0, 0
+        for position in route:
+            clock += duration[here][position]
+            if clock > deadline[position]:
+                return None
+            arrivals.append(clock)
+            clock += limits.stop_minutes
+            here = position
+        clock += duration[here][0]
+        return (arrivals, clock) if clock <= limits.max_minutes else None
+
+    route = list(range(1, len(local)))
+    improved = True
+    while improved:
+        improved = False
+        # The tour is depot, route..., depot; edges (a, a + 1) and (b, b + 1) are swapped
+        tour = [0] + route + [0]
+        for a in range(len(tour) - 3):
+            for b in range(a + 2, len(tour) - 1):
+                delta = (
+                    distance[tour[a]][tour[b]] + distance[tour[a + 1]][tour[b + 1]]
+                    - distance[tour[a]][tour[a + 1]] - distance[tour[b]][tour[b + 1]]
+                )
+                if delta < -1e-9:
+                    candidate = tour[1:a + 1] + tour[a + 1:b + 1][::-1] + tour[b + 1:-1]
+                    if schedule(candidate) is not None:
+                        route, tour = candidate, [0] + candidate + [0]
+                        improved = True
+
+    arrivals, duration_minutes = schedule(route)
+    tour = [0] + route + [0]
+    return PlannedRun(
+        stops=[stops[position - 1] for position in route],
+        arrivals=arrivals,
+        distance_km=sum(distance[tour[i]][tour[i + 1]] for i in range(len(tour) - 1)),
+        duration_minutes=duration_minutes
+    )
+
+
+def solve(problems, limits, processes=1):
+    '''
+    plan_runs over independent problems, on a process pool when processes > 1
+    '''
+    if processes > 1 and len(problems) > 1:
+        with ProcessPoolExecutor(max_workers=min(processes, len(problems))) as pool:
+            return list(pool.map(plan_runs, problems, [limits] * len(problems)))
+    return [plan_runs(problem, limits) for problem in problems]
+
+
+def plannable_orders(depot_id):
+    '''
+    RELEASED orders picked up at the depot, with a routed quote and not in a run yet
+    '''
+    return Order.objects.filter(
+        order_status=Order.REL,
+        delivery_stop__isnull=True,
+        quote__route__origin_id=depot_id
+    )
+
+
+def planning_depots():
+    '''
+    Depots with orders waiting to be planned
+    '''
+    return list(
+        Order.objects.filter(order_status=Order.REL, delivery_stop__isnull=True, quote__route__isnull=False)
+        .order_by().values_list('quote__route__origin_id', flat=True).distinct()
+    )
+
+
+def build_problem(depot_id, orders, departure):
+    '''
+    The RunProblem for a depot's orders, over the rows of the distance
+    matrix those orders touch. Returns (problem, orders) with the orders
+    the matrix does not cover left out.
+    '''
+    matrix = distance_matrix.load()
+    if matrix is None:
+        return None, []
+    _, positions, values = matrix
+    if depot_id not in positions:
+        return None, []
+
+    orders = [order for order in orders if order.quote.route.destination_id in positions]
+    rows = sorted({positions[depot_id]} | {positions[order.quote.route.destination_id] for order in orders})
+    local = {row: position for position, row in enumerate(rows)}
+    # Copied out of the memory map, small and picklable for the process pool
+    distances = np.array(values[0][np.ix_(rows, rows)], dtype=np.float64)
+    durations = np.array(values[1][np.ix_(rows, rows)], dtype=np.float64)
+
+    deadlines = [
+        (order.quote.estimated_delivery - departure).total_seconds() / 60
+        if order.quote.estimated_delivery is not None else math.inf
+        for order in orders
+    ]
+    problem = RunProblem(
+        depot=local[positions[depot_id]],
+        nodes=[local[positions[order.quote.route.destination_id]] for order in orders],
+        weights=[order.quote.item_weight or 0 for order in orders],
+        deadlines=deadlines,
+        distances=distances,
+        durations=durations
+    )
+    return problem, orders
+
+
+def plan_delivery_runs(depot_ids, departure=None, processes=None, limits=None):
+    '''
+    Plan runs for every depot's RELEASED orders and save them. Each depot
+    is an independent problem; with processes > 1 they are solved on a
+    process pool while this process only reads and writes the database.
+    The orders are locked with SKIP LOCKED until the runs are saved, so
+    concurrent planners never put one order in two runs.
+    Returns (created runs, unplanned order count).
+    '''
+    departure = departure or timezone.now()
+    processes = processes or settings.RUN_PLANNING_PROCESSES
+    limits = limits or get_limits()
+
+    with transaction.atomic():
+        problems = []
+        unplanned = 0
+        for depot_id in depot_ids:
+            orders = list(
+                plannable_orders(depot_id).select_for_update(skip_locked=True, of=('self',))
+                .select_related('quote__route').order_by('id')
+            )
+            problem, covered = build_problem(depot_id, orders, departure)
+            unplanned += len(orders) - len(covered)
+            if covered:
+                problems.append((depot_id, problem, covered))
+
+        solutions = solve([problem for _, problem, _ in problems], limits, processes)
+
+        created, stops = [], []
+        for (depot_id, _, orders), (runs, skipped) in zip(problems, solutions):
+            unplanned += len(skipped)
+            for planned in runs:
+                # One at a time, not every backend returns primary keys from bulk inserts
+                run = DeliveryRun.objects.create(
+                    depot_id=depot_id,
+                    departure_ts=departure,
+                    distance_km=round(planned.distance_km, 3),
+                    duration_minutes=int(round(planned.duration_minutes))
+                )
+                created.append(run)
+                for sequence, (stop, arrival) in enumerate(zip(planned.stops, planned.arrivals), 1):
+                    stops.append(DeliveryStop(
+                        run=run,
+                        order=orders[stop],
+                        sequence=sequence,
+                        eta=departure + timedelta(minutes=arrival)
+                    ))
+        DeliveryStop.objects.bulk_create(stops, batch_size=settings.BULK_BATCH_SIZE)
+
+    return created, unplanned
@@ -0,0 +1,149 @@
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .locations import normalize_location
+from .models import Quote, RouteRate
+
+
+class PricingTable:
+    '''
+    RouteRate rows precomputed two ways: a dict from the normalized
+    (location_from, location_to) pair to its rate for single quotes, and
+    parallel NumPy arrays indexed by route for vectorized batches.
+    Rebuilt lazily after a RouteRate change in this process, and every
+    PRICING_TABLE_MAX_AGE seconds to pick up changes made elsewhere.
+    '''
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.table = None
+        self.loaded = None
+
+    def load(self):
+        '''
+        Returns (routes, index, base_cost, cost_per_kg, delivery_hours),
+        swapped in as one tuple so readers never see a half-built table
+        '''
+        table = self.table
+        if table is not None and time.monotonic() - self.loaded <= self.max_age:
+            return table
+        with self.lock:
+            if self.table is not None and time.monotonic() - self.loaded <= self.max_age:
+                return self.table
+            rates = RouteRate.objects.values_list(
+                'location_from', 'location_to', 'base_cost', 'cost_per_kg', 'delivery_hours'
+            ).order_by('id')
+            routes = {}
+            for location_from, location_to, base_cost, cost_per_kg, delivery_hours in rates:
+                routes[(normalize_location(location_from), normalize_location(location_to))] = (
+                    base_cost, cost_per_kg, delivery_hours
+                )
+
+            index = {route: position for position, route in enumerate(routes)}
+            # One extra trailing row of NaN stands for routes without a rate
+            columns = np.array(list(routes.values()) + [(np.nan, np.nan, np.nan)], dtype=np.float64)
+            self.table = (routes, index, columns[:, 0], columns[:, 1], columns[:, 2])
+            self.loaded = time.monotonic()
+            return self.table
+
+    def clear(self):
+        with self.lock:
+            self.table = None
+
+    def price(self, location_from, location_to, item_weight, created_ts):
+        '''
+        Price one quote from the lookup dict. Returns (estimated_cost,
+        estimated_delivery), or (None, None) when the route has no rate.
+        '''
+        routes = self.load()[0]
+        rate = routes.get((normalize_location(location_from), normalize_location(location_to)))
+        if rate is None:
+            return None, None
+        base_cost, cost_per_kg, delivery_hours = rate
+        return base_cost + cost_per_kg * billable_kg(item_weight), created_ts + timedelta(hours=delivery_hours)
+
+    def price_batch(self, locations_from, locations_to, item_weights):
+        '''
+        Price many quotes at once. Returns an int64 cost array, a
+        timedelta64 lead time array and a mask of the rows that had a rate.
+        '''
+        _, index, base_cost, cost_per_kg, delivery_hours = self.load()
+        missing = len(index)
+        positions = np.fromiter(
+            (
+                index.get((normalize_location(location_from), normalize_location(location_to)), missing)
+                for location_from, location_to in zip(locations_from, locations_to)
+            ),
+            dtype=np.int64,
+            count=len(locations_from)
+        )
+        weights = np.array([weight if weight is not None else np.nan for weight in item_weights], dtype=np.float64)
+        kilograms = np.ceil(np.clip(np.nan_to_num(weights, nan=0.0), 0, None))
+
+        costs = base_cost[positions] + cost_per_kg[positions] * kilograms
+        hours = delivery_hours[positions]
+        priced = ~np.isnan(costs)
+        lead_times = (np.nan_to_num(hours) * 3600).astype('timedelta64[s]')
+        return np.nan_to_num(costs).astype(np.int64), lead_times, priced
+
+
+def billable_kg(item_weight):
+    return int(np.ceil(max(item_weight or 0, 0)))
+
+
+pricing_table = PricingTable(settings.PRICING_TABLE_MAX_AGE)
+
+
+def pending_quotes():
+    '''
+    Quotes that have not been turned into an order yet
+    '''
+    return Quote.objects.filter(order__isnull=True)
+
+
+def reprice_quotes(queryset=None, chunk_size=None):
+    '''
+    Reprice quotes in chunks: read the columns with values_list, price the
+    chunk with one vectorized call, write it back with bulk_update.
+    Returns (priced, unpriced) counts.
+    '''
+    from .signals import invalidate_instances
+
+    queryset = pending_quotes() if queryset is None else queryset
+    chunk_size = chunk_size or settings.PRICING_CHUNK_SIZE
+    rows = queryset.order_by('id').values_list(
+        'id', 'location_from', 'location_to', 'item_weight', 'created_ts'
+    ).iterator(chunk_size=chunk_size)
+
+    priced = unpriced = 0
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            break
+        ids, locations_from, locations_to, item_weights, created_ts = zip(*chunk)
+        costs, lead_times, mask = pricing_table.price_batch(locations_from, locations_to, item_weights)
+
+        now = timezone.now()
+        quotes = [
+            Quote(
+                id=ids[row],
+                estimated_cost=int(costs[row]),
+                estimated_delivery=created_ts[row] + lead_times[row].item(),
+                updated_ts=now
+            )
+            for row in np.flatnonzero(mask)
+        ]
+        with transaction.atomic():
+            Quote.objects.bulk_update(quotes, ['estimated_cost', 'estimated_delivery', 'updated_ts'], batch_size=settings.BULK_BATCH_SIZE)
+        invalidate_instances(Quote, quotes)
+
+        priced += len(quotes)
+        unpriced += len(chunk) - len(quotes)
+    return priced, unpriced
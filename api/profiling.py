@@ -0,0 +1,199 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('api.slow_requests')
+
+current_profile = ContextVar('current_profile', default=None)
+
+# Upper bounds in seconds of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.queries.append((context['connection'].alias, sql, elapsed))
+
+
+class EndpointStats:
+    def __init__(self):
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+
+
+class Metrics:
+    '''
+    Per-endpoint request histograms of this process, keyed by
+    (method, route, status class)
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def observe(self, key, duration, profile, response_bytes):
+        with self.lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = EndpointStats()
+            stats.buckets[bisect.bisect_left(DURATION_BUCKETS, duration)] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += len(profile.queries)
+            stats.db_time += profile.db_time
+            stats.serializer_time += profile.serializer_time
+            stats.response_bytes += response_bytes
+
+    def clear(self):
+        with self.lock:
+            self.endpoints = {}
+
+    def render(self):
+        '''
+        The metrics in the Prometheus text exposition format
+        '''
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = [
+                '# HELP api_request_duration_seconds Request wall time',
+                '# TYPE api_request_duration_seconds histogram',
+            ]
+            for (method, route, status), stats in endpoints:
+                labels = f'method="{method}",endpoint="{escape(route)}",status="{status}"'
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + ('+Inf',), stats.buckets):
+                    cumulative += count
+                    lines.append(f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'api_request_duration_seconds_sum{{{labels}}} {stats.duration:.6f}')
+                lines.append(f'api_request_duration_seconds_count{{{labels}}} {stats.count}')
+
+            for name, kind, help_text, attribute, fmt in (
+                ('api_db_queries_total', 'counter', 'Database queries run', 'queries', 'd'),
+                ('api_db_seconds_total', 'counter', 'Time spent in database queries', 'db_time', '.6f'),
+                ('api_serializer_seconds_total', 'counter', 'Time spent serializing', 'serializer_time', '.6f'),
+                ('api_response_bytes_total', 'counter', 'Response body bytes', 'response_bytes', 'd'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for (method, route, status), stats in endpoints:
+                    labels = f'method="{method}",endpoint="{escape(route)}",status="{status}"'
+                    lines.append(f'{name}{{{labels}}} {getattr(stats, attribute):{fmt}}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+def timed_data(data):
+    '''
+    Wraps BaseSerializer.data so the time spent building representations
+    is added to the current request's profile. Serializer.data and
+    ListSerializer.data both go through it, nested calls count once.
+    '''
+    def wrapper(serializer):
+        profile = current_profile.get()
+        if profile is None:
+            return data(serializer)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data(serializer)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_time += time.perf_counter() - started
+    wrapper.profiled = True
+    return wrapper
+
+
+def install_serializer_timing():
+    if not getattr(BaseSerializer.data.fget, 'profiled', False):
+        BaseSerializer.data = property(timed_data(BaseSerializer.data.fget))
+
+
+class ProfilingMiddleware:
+    '''
+    Opt-in with PROFILING_ENABLED. Records wall time, database query count
+    and time, serializer time and response size of every request, adds
+    them as a Server-Timing header, feeds the per-endpoint histograms
+    served at /api/_metrics, and logs requests slower than
+    PROFILING_SLOW_REQUEST_MS with their SQL to the slow request log.
+    Only queries made on the request thread are counted.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_serializer_timing()
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+
+        duration = time.perf_counter() - profile.started
+        response_bytes = 0 if response.streaming else len(response.content)
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={duration * 1000:.1f}',
+            f'db;dur={profile.db_time * 1000:.1f};desc="{len(profile.queries)} queries"',
+            f'serialize;dur={profile.serializer_time * 1000:.1f}',
+        ])
+
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        metrics.observe((request.method, route, f'{response.status_code // 100}xx'), duration, profile, response_bytes)
+
+        if duration * 1000 >= settings.PROFILING_SLOW_REQUEST_MS:
+            self.log_slow_request(request, response, route, duration, profile, response_bytes)
+        return response
+
+    def log_slow_request(self, request, response, route, duration, profile, response_bytes):
+        logger.warning(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'db_ms': round(profile.db_time * 1000, 3),
+            'serializer_ms': round(profile.serializer_time * 1000, 3),
+            'response_bytes': response_bytes,
+            'queries': [
+                {'database': alias, 'sql': sql, 'ms': round(elapsed * 1000, 3)}
+                for alias, sql, elapsed in profile.queries[:settings.PROFILING_SLOW_REQUEST_MAX_QUERIES]
+            ],
+            'query_count': len(profile.queries),
+        }))
@@ -0,0 +1,108 @@
+import csv
+import json
+
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+
+class Echo:
+    '''
+    File-like object whose write hands the row straight back, so a
+    csv.writer can produce one line at a time for streaming
+    '''
+    def write(self, value):
+        return value
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(self.render_row(row) for row in rows).encode(self.charset)
+
+    def render_row(self, row):
+        return json.dumps(row, cls=encoders.JSONEncoder, ensure_ascii=False) + '\n'
+
+    def stream(self, rows, header=None):
+        for row in rows:
+            yield self.render_row(row)
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, str):
+            # Error responses
+            data = json.dumps(data, cls=encoders.JSONEncoder)
+        return data.encode(self.charset)
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        header = get_header(rows[0]) if rows else []
+        writer = csv.writer(Echo())
+        lines = [writer.writerow(header)]
+        lines.extend(writer.writerow(flatten_row(row, header)) for row in rows)
+        return ''.join(lines).encode(self.charset)
+
+    def stream(self, rows, header):
+        writer = csv.writer(Echo())
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(flatten_row(row, header))
+
+
+def get_header(data, prefix=''):
+    '''
+    Flattened column names for a representation, nested dicts joined by a dot
+    '''
+    header = []
+    for key, value in data.items():
+        if isinstance(value, dict):
+            header.extend(get_header(value, f'{prefix}{key}.'))
+        else:
+            header.append(prefix + key)
+    return header
+
+
+def get_serializer_header(serializer, prefix=''):
+    '''
+    Flattened column names for a serializer, so nullable nested objects
+    still get their columns
+    '''
+    header = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if hasattr(field, 'fields'):
+            header.extend(get_serializer_header(field, f'{prefix}{name}.'))
+        else:
+            header.append(prefix + name)
+    return header
+
+
+def flatten_row(data, header):
+    values = []
+    for column in header:
+        value = data
+        for key in column.split('.'):
+            value = value.get(key) if isinstance(value, dict) else None
+        values.append('' if value is None else value)
+    return values
@@ -0,0 +1,98 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Set while a reporting view runs for a user who may read from a replica
+replica_reads = ContextVar('replica_reads', default=False)
+# Per-request record of whether anything was written, shared with the router
+request_writes = ContextVar('request_writes', default=None)
+
+
+def pin_key(user):
+    return f'replica-pin:{user.pk}'
+
+
+def pin_user(user):
+    '''
+    Keep the user's reads on the primary until replicas have caught up with their write
+    '''
+    caches[settings.REPLICA_PIN_CACHE_ALIAS].set(pin_key(user), True, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    if not user or not user.is_authenticated:
+        return False
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS].get(pin_key(user), False)
+
+
+class ReplicaRouter:
+    '''
+    Sends reads made inside ReplicaReadMixin views to a random replica from
+    DATABASE_REPLICAS and everything else to the primary. Writes always go
+    to the primary and are recorded so ReplicaPinMiddleware can pin the
+    writer to the primary for a while (read-your-writes).
+    '''
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related lookups stay on the database the instance came from
+            return instance._state.db
+        if settings.DATABASE_REPLICAS and replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        writes = request_writes.get()
+        if writes is not None:
+            writes['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    '''
+    Serve an APIView's reads from a replica, unless the user wrote within
+    the last REPLICA_PIN_SECONDS. Querysets evaluated after the view
+    returns, like streamed exports, must be bound with
+    .using(router.db_for_read(model)) inside the view.
+    '''
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not is_pinned(request.user):
+            self.replica_token = replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'replica_token', None)
+        if token is not None:
+            replica_reads.reset(token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaPinMiddleware:
+    '''
+    Pins users who wrote to the primary during the request
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writes = {'wrote': False}
+        token = request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_writes.reset(token)
+        # DRF sets the authenticated user on the underlying request as well
+        user = getattr(request, 'user', None)
+        if writes['wrote'] and user is not None and user.is_authenticated:
+            pin_user(user)
+        return response
@@ -1,10 +1,17 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
 
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .models import Rider, Quote, Order, Invoice
+from .invoicing import enqueue_invoice
+from .locations import resolve_routes
+from .pricing import pricing_table
+from .streams import stream_hub
+from .models import Rider, Quote, Order, OrderStatusEvent, DeliveryRun, DeliveryStop, Invoice, Payment, UserLedger, DailyLedger, StatusLedger
 User = get_user_model()
 
 class UserRegisterSerializer(serializers.Serializer):
@@ -28,7 +35,7 @@ class UserRegisterSerializer(serializers.Serializer):
 class UserModelSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['id', 'username', 'first_name', 'last_name', 'email', 'date_joined', 'bio', 'location']
+        fields = ['id', 'username', 'first_name', 'last_name', 'email', 'date_joined']
 
 class ObtainTokenPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
@@ -46,33 +53,395 @@ class ObtainTokenPairSerializer(TokenObtainPairSerializer):
 
         return user_data
 
-class RiderSerializer(serializers.ModelSerializer):
+class EagerLoadingMixin:
+    '''
+    Declares the relations a serializer reads so list views can build
+    their querysets with select_related/prefetch_related up front.
+    Nested serializers using the mixin contribute their own relations
+    under the nesting field's prefix.
+    '''
+    select_related_fields = []
+    prefetch_related_fields = []
+
+    @classmethod
+    def get_related_fields(cls, prefix=''):
+        select_related = [prefix + field for field in cls.select_related_fields]
+        prefetch_related = [prefix + field for field in cls.prefetch_related_fields]
+
+        for name, field in cls._declared_fields.items():
+            many = isinstance(field, serializers.ListSerializer)
+            nested = field.child if many else field
+            if not isinstance(nested, EagerLoadingMixin):
+                continue
+            source = field.source or name
+            nested_select, nested_prefetch = nested.get_related_fields(f'{prefix}{source}__')
+            if many:
+                prefetch_related.append(prefix + source)
+                prefetch_related.extend(nested_select + nested_prefetch)
+            else:
+                select_related.append(prefix + source)
+                select_related.extend(nested_select)
+                prefetch_related.extend(nested_prefetch)
+
+        return select_related, prefetch_related
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        select_related, prefetch_related = cls.get_related_fields()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+class BatchPrimaryKeyField(serializers.IntegerField):
+    '''
+    Stands in for a PrimaryKeyRelatedField so BulkListSerializer can
+    resolve the keys of the whole batch with one query
+    '''
+    def to_representation(self, value):
+        return value.pk
+
+class BulkListSerializer(serializers.ListSerializer):
+    '''
+    many=True serializer that writes with bulk_create/bulk_update.
+    Unique checks and primary key lookups run once per field for the
+    whole batch instead of once per item, and failures are reported
+    against the item that caused them.
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.unique_fields = []
+        self.related_fields = {}
+
+        for name, field in list(self.child.fields.items()):
+            if field.read_only:
+                continue
+            validators = [validator for validator in field.validators if not isinstance(validator, UniqueValidator)]
+            if len(validators) != len(field.validators):
+                field.validators = validators
+                self.unique_fields.append(name)
+            if isinstance(field, serializers.PrimaryKeyRelatedField):
+                self.related_fields[name] = field.get_queryset()
+                self.child.fields[name] = BatchPrimaryKeyField(
+                    required=field.required,
+                    allow_null=field.allow_null,
+                    **({'source': field.source} if field.source != name else {})
+                )
+
+    def to_internal_value(self, data):
+        validated_data = super().to_internal_value(data)
+        instances = self.instance if isinstance(self.instance, list) else [None] * len(validated_data)
+        errors = [{} for _ in validated_data]
+
+        for name in self.unique_fields:
+            self.check_unique(name, validated_data, instances, errors)
+        for name, queryset in self.related_fields.items():
+            self.resolve_related(name, queryset, validated_data, errors)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated_data
+
+    def check_unique(self, name, validated_data, instances, errors):
+        source = self.child.fields[name].source
+        model = self.child.Meta.model
+        values = {
+            index: str(attrs[source]) for index, attrs in enumerate(validated_data)
+            if attrs.get(source) not in (None, '')
+        }
+        changing = [instances[index].pk for index in values if instances[index] is not None]
+        taken = {
+            str(value) for value in model.objects.filter(
+                **{f'{source}__in': set(values.values())}
+            ).exclude(pk__in=changing).values_list(source, flat=True)
+        }
+
+        seen = set()
+        message = f'{model._meta.verbose_name} with this {name.replace("_", " ")} already exists.'
+        for index, value in values.items():
+            if value in taken or value in seen:
+                errors[index].setdefault(name, []).append(message)
+            seen.add(value)
+
+    def resolve_related(self, name, queryset, validated_data, errors):
+        source = self.child.fields[name].source
+        pks = {attrs[source] for attrs in validated_data if attrs.get(source) is not None}
+        related = queryset.in_bulk(pks)
+
+        for index, attrs in enumerate(validated_data):
+            if attrs.get(source) is None:
+                continue
+            if attrs[source] in related:
+                attrs[source] = related[attrs[source]]
+            else:
+                errors[index].setdefault(name, []).append(f'Invalid pk "{attrs[source]}" - object does not exist.')
+
+    def create(self, validated_data):
+        from .signals import apply_bulk_write
+
+        model = self.child.Meta.model
+        instances = [model(**attrs) for attrs in validated_data]
+        if connection.features.can_return_rows_from_bulk_insert:
+            instances = model.objects.bulk_create(instances, batch_size=settings.BULK_BATCH_SIZE)
+        else:
+            # One at a time, so the response carries the new primary keys on this backend too.
+            # Their post_save receivers repeat apply_bulk_write, which is idempotent.
+            with transaction.atomic():
+                for instance in instances:
+                    instance.save(force_insert=True)
+        apply_bulk_write(model, instances, created=True)
+        return instances
+
+    def update(self, instances, validated_data):
+        from .signals import apply_bulk_write
+
+        model = self.child.Meta.model
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+            fields.update(attrs)
+
+        # bulk_update does not run auto_now
+        if fields and hasattr(model, 'updated_ts'):
+            now = timezone.now()
+            for instance in instances:
+                instance.updated_ts = now
+            fields.add('updated_ts')
+
+        if fields:
+            model.objects.bulk_update(instances, fields, batch_size=settings.BULK_BATCH_SIZE)
+            apply_bulk_write(model, instances)
+        return instances
+
+class RiderSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Rider
         fields = '__all__'
         read_only_fields = ['created_ts', 'updated_ts']
+        list_serializer_class = BulkListSerializer
+
 
+class QuoteBulkListSerializer(BulkListSerializer):
+    '''
+    Bulk quote creation that resolves the routes of the whole batch at once
+    and prices its quotes with one vectorized call
+    '''
+    def create(self, validated_data):
+        routes = resolve_routes((attrs['location_from'], attrs['location_to']) for attrs in validated_data)
+        for attrs in validated_data:
+            attrs['route'] = routes[(attrs['location_from'], attrs['location_to'])]
 
-class QuoteSerializer(serializers.ModelSerializer):
+        unpriced = [attrs for attrs in validated_data if attrs.get('estimated_cost') is None]
+        if unpriced:
+            costs, lead_times, priced = pricing_table.price_batch(
+                [attrs['location_from'] for attrs in unpriced],
+                [attrs['location_to'] for attrs in unpriced],
+                [attrs.get('item_weight') for attrs in unpriced]
+            )
+            now = timezone.now()
+            for attrs, cost, lead_time, has_rate in zip(unpriced, costs, lead_times, priced):
+                if has_rate:
+                    attrs['estimated_cost'] = int(cost)
+                    attrs['estimated_delivery'] = now + lead_time.item()
+        return super().create(validated_data)
+
+
+class QuoteSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(required=False, read_only=True)
     class Meta:
         model = Quote
         fields = '__all__'
-        read_only_fields = ['user', 'created_ts', 'updated_ts']
+        read_only_fields = ['user', 'route', 'created_ts', 'updated_ts']
+        list_serializer_class = QuoteBulkListSerializer
+
+    def resolve_route(self, validated_data, instance=None):
+        location_from = validated_data.get('location_from', getattr(instance, 'location_from', None))
+        location_to = validated_data.get('location_to', getattr(instance, 'location_to', None))
+        validated_data['route'] = resolve_routes([(location_from, location_to)])[(location_from, location_to)]
+
+    def create(self, validated_data):
+        self.resolve_route(validated_data)
+        if validated_data.get('estimated_cost') is None:
+            estimated_cost, estimated_delivery = pricing_table.price(
+                validated_data['location_from'],
+                validated_data['location_to'],
+                validated_data.get('item_weight'),
+                timezone.now()
+            )
+            if estimated_cost is not None:
+                validated_data.update(estimated_cost=estimated_cost, estimated_delivery=estimated_delivery)
+        return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        if 'location_from' in validated_data or 'location_to' in validated_data:
+            self.resolve_route(validated_data, instance)
+        return super().update(instance, validated_data)
 
-class OrderSerializer(serializers.ModelSerializer):
+
+class OrderSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     rider = RiderSerializer(required=False)
     quote = QuoteSerializer(required=False)
     class Meta:
         model = Order
         fields = '__all__'
-        read_only_fields = ['quote', 'created_ts', 'updated_ts']
+        read_only_fields = ['quote', 'status_changed_ts', 'created_ts', 'updated_ts']
+
+    def update(self, instance, validated_data):
+        # The status only changes through Order.transition_to, so it is never written back from here
+        serializers.raise_errors_on_nested_writes('update', self, validated_data)
+        validated_data.pop('order_status', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_ts'])
+        return instance
+
+class OrderBulkListSerializer(BulkListSerializer):
+    '''
+    Bulk order updates that check status transitions and append the
+    status events with one bulk insert
+    '''
+    def to_internal_value(self, data):
+        validated_data = super().to_internal_value(data)
+        errors = [{} for _ in validated_data]
+        for index, (instance, attrs) in enumerate(zip(self.instance, validated_data)):
+            status = attrs.get('order_status', instance.order_status)
+            if status != instance.order_status and not Order.can_transition(instance.order_status, status):
+                errors[index]['order_status'] = [f'Cannot move an order from {instance.order_status} to {status}']
+        self.check_riders(validated_data, errors)
 
-class InvoiceSerializer(serializers.ModelSerializer):
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated_data
+
+    def check_riders(self, validated_data, errors):
+        '''
+        A rider keeps their delivered orders but carries one order at a
+        time: not one already on another undelivered order, nor one given
+        to two orders of the batch
+        '''
+        booked, released = {}, []
+        for index, (instance, attrs) in enumerate(zip(self.instance, validated_data)):
+            delivered = attrs.get('order_status', instance.order_status) == Order.DEL
+            if 'rider' in attrs or delivered:
+                released.append(instance.pk)
+            if attrs.get('rider') is not None and not delivered:
+                booked[index] = attrs['rider'].pk
+        busy = set(
+            Order.objects.filter(rider_id__in=set(booked.values()))
+            .exclude(order_status=Order.DEL).exclude(pk__in=released)
+            .values_list('rider_id', flat=True)
+        )
+
+        seen = set()
+        for index, rider_id in booked.items():
+            if rider_id in busy or rider_id in seen:
+                errors[index].setdefault('rider', []).append('This rider is already on an undelivered order.')
+            seen.add(rider_id)
+
+    def update(self, instances, validated_data):
+        request = self.context.get('request')
+        user = request.user if request and request.user.is_authenticated else None
+        now = timezone.now()
+        events = []
+        for instance, attrs in zip(instances, validated_data):
+            status = attrs.get('order_status', instance.order_status)
+            if status != instance.order_status:
+                events.append(OrderStatusEvent(
+                    order=instance,
+                    from_status=instance.order_status,
+                    to_status=status,
+                    user=user,
+                    created_ts=now
+                ))
+                attrs['status_changed_ts'] = now
+
+        instances = super().update(instances, validated_data)
+        OrderStatusEvent.objects.bulk_create(events, batch_size=settings.BULK_BATCH_SIZE)
+        if events:
+            transaction.on_commit(stream_hub.notify)
+        for event in events:
+            if event.to_status == Order.DEL:
+                enqueue_invoice(event.order_id)
+        return instances
+
+class OrderBulkUpdateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Order
+        fields = ['id', 'payment_ref', 'payment_complete_status', 'order_status', 'rider']
+        list_serializer_class = OrderBulkListSerializer
+
+class OrderStatusEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderStatusEvent
+        fields = ['id', 'from_status', 'to_status', 'user', 'created_ts']
+
+class DeliveryStopSerializer(serializers.ModelSerializer):
+    tracking_number = serializers.UUIDField(source='order.tracking_number', read_only=True)
+    class Meta:
+        model = DeliveryStop
+        fields = ['sequence', 'order', 'tracking_number', 'eta']
+
+class DeliveryRunSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    stops = DeliveryStopSerializer(many=True, read_only=True)
+    prefetch_related_fields = ['stops__order']
+    class Meta:
+        model = DeliveryRun
+        fields = ['id', 'depot', 'rider', 'run_status', 'departure_ts', 'distance_km', 'duration_minutes', 'stops', 'created_ts']
+
+class InvoiceSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     order = OrderSerializer(required=False)
     quote = QuoteSerializer(required=False)
     class Meta:
         model = Invoice
         fields = '__all__'
-        read_only_fields = ['quote', 'created_ts', 'updated_ts']
+        read_only_fields = ['quote', 'amount_paid', 'amount_due', 'payment_status', 'created_ts', 'updated_ts']
+
+class PaymentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ['id', 'invoice', 'amount', 'reference', 'user', 'created_ts']
+        read_only_fields = ['invoice', 'user', 'created_ts']
+
+    def validate_amount(self, value):
+        if value == 0:
+            raise serializers.ValidationError('A payment must have a non-zero amount')
+        return value
+
+class UserLedgerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserLedger
+        fields = ['user', 'invoice_count', 'invoiced', 'paid', 'due', 'updated_ts']
+
+class DailyLedgerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyLedger
+        fields = ['day', 'invoice_count', 'invoiced', 'payment_count', 'collected']
+
+class StatusLedgerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StatusLedger
+        fields = ['status', 'invoice_count', 'invoiced', 'paid', 'due']
+
+class PaymentCallbackSerializer(serializers.Serializer):
+    '''
+    A payment provider callback. A plain Serializer rather than a
+    ModelSerializer: uniqueness of the event id is left to the INSERT, so
+    validating a callback never touches the database.
+    '''
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    id = serializers.CharField(max_length=64)
+    payment_ref = serializers.CharField(max_length=32)
+    amount = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=[SUCCEEDED, FAILED])
+
+    def validate(self, attrs):
+        return {
+            'event_id': attrs['id'],
+            'payment_ref': attrs['payment_ref'],
+            'amount': attrs['amount'],
+            'succeeded': attrs['status'] == self.SUCCEEDED,
+        }
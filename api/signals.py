@@ -0,0 +1,175 @@
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.dispatch import receiver
+
+from .assignment import availability_index
+from .cache import invalidate, tracking_cache
+from .invoicing import enqueue_invoice
+from .jobs import enqueue
+from .ledger import apply_invoice_change, invoice_state
+from .locations import location_index
+from .models import Rider, Quote, Location, LocationAlias, RouteRate, Order, OrderStatusEvent, Invoice, Job
+from .pricing import pricing_table
+from .streams import stream_hub
+
+
+def invalidate_riders(riders):
+    '''
+    Riders are nested in order and invoice details
+    '''
+    pks = [rider.pk for rider in riders]
+    invalidate(Rider, pks)
+    invalidate(Order, Order.objects.filter(rider_id__in=pks).values_list('pk', flat=True))
+    invalidate(Invoice, Invoice.objects.filter(order__rider_id__in=pks).values_list('pk', flat=True))
+
+
+def invalidate_quotes(quotes):
+    '''
+    Quotes are nested in order and invoice details, and their locations
+    and estimated delivery are served by tracking
+    '''
+    pks = [quote.pk for quote in quotes]
+    invalidate(Quote, pks)
+    orders = list(Order.objects.filter(quote_id__in=pks).values_list('pk', 'tracking_number'))
+    invalidate(Order, [pk for pk, _ in orders])
+    invalidate(Invoice, Invoice.objects.filter(quote_id__in=pks).values_list('pk', flat=True))
+    for _, tracking_number in orders:
+        tracking_cache.delete(tracking_number)
+
+
+def invalidate_orders(orders):
+    '''
+    Orders are nested in invoice details, and their status is served by tracking
+    '''
+    pks = [order.pk for order in orders]
+    invalidate(Order, pks)
+    invalidate(Invoice, Invoice.objects.filter(order_id__in=pks).values_list('pk', flat=True))
+    for order in orders:
+        tracking_cache.delete(order.tracking_number)
+
+
+def invalidate_invoices(invoices):
+    invalidate(Invoice, [invoice.pk for invoice in invoices])
+
+
+INVALIDATORS = {
+    Rider: invalidate_riders,
+    Quote: invalidate_quotes,
+    Order: invalidate_orders,
+    Invoice: invalidate_invoices,
+}
+
+
+def invalidate_instances(model, instances):
+    '''
+    Invalidate cached representations after writes that skip signals,
+    like bulk_update and queryset.update. Deferred until the transaction
+    commits: a reader between an earlier invalidation and the commit would
+    cache the old row again under the new version.
+    '''
+    invalidator = INVALIDATORS.get(model)
+    if invalidator is not None and instances:
+        instances = list(instances)
+        transaction.on_commit(lambda: invalidator(instances))
+
+
+def index_riders(riders, created=False):
+    '''
+    New riders are free; known free riders may have moved
+    '''
+    for rider in riders:
+        if created or rider.pk in availability_index.riders:
+            availability_index.mark_free(rider.pk, rider.location)
+
+
+def index_order_riders(orders):
+    for order in orders:
+        if order.rider_id is None:
+            continue
+        if order.order_status == Order.DEL:
+            availability_index.mark_free(order.rider_id, order.rider.location)
+        else:
+            availability_index.mark_busy(order.rider_id)
+
+
+def apply_bulk_write(model, instances, created=False):
+    '''
+    What the post_save receivers do for each instance, for writes that
+    send no signals: bulk_create and bulk_update. Orders delivered by a
+    bulk update are invoiced by the serializer, which sees the transition.
+    '''
+    instances = list(instances)
+    if model is Rider:
+        index_riders(instances, created)
+    elif model is Order:
+        index_order_riders(instances)
+        if created:
+            for order in instances:
+                enqueue_invoice(order.pk)
+    invalidate_instances(model, instances)
+
+
+@receiver(post_save, sender=Rider)
+def index_rider(sender, instance, created, **kwargs):
+    index_riders([instance], created)
+
+
+@receiver(post_delete, sender=Rider)
+def unindex_rider(sender, instance, **kwargs):
+    availability_index.mark_busy(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def index_order_rider(sender, instance, **kwargs):
+    index_order_riders([instance])
+
+
+@receiver(post_save, sender=Order)
+def invoice_order(sender, instance, created, update_fields=None, **kwargs):
+    '''
+    Orders are invoiced in the background when placed, and again on
+    delivery for those whose quote was only priced later
+    '''
+    delivered = instance.order_status == Order.DEL and 'order_status' in (update_fields or ())
+    if created or delivered:
+        enqueue_invoice(instance.pk)
+
+
+@receiver(post_save, sender=OrderStatusEvent)
+def stream_status_event(sender, instance, created, **kwargs):
+    '''
+    Open streams in this process hear about the change once it commits
+    '''
+    if created:
+        transaction.on_commit(stream_hub.notify)
+
+
+@receiver(post_delete, sender=Invoice)
+def unroll_invoice(sender, instance, **kwargs):
+    '''
+    Take a deleted invoice back out of the ledger rollups
+    '''
+    apply_invoice_change(invoice_state(instance), None)
+
+
+@receiver([post_save, post_delete], sender=RouteRate)
+def reload_pricing(sender, instance, **kwargs):
+    '''
+    Pending quotes follow the rates; one repricing job covers a burst of changes
+    '''
+    pricing_table.clear()
+    enqueue('reprice_quotes', priority=Job.LOW, key='reprice_quotes')
+
+
+@receiver([post_save, post_delete], sender=Location)
+@receiver([post_save, post_delete], sender=LocationAlias)
+def reload_locations(sender, instance, **kwargs):
+    location_index.clear()
+
+
+@receiver([post_save, post_delete], sender=Rider)
+@receiver([post_save, post_delete], sender=Quote)
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=Invoice)
+def invalidate_instance(sender, instance, **kwargs):
+    invalidate_instances(sender, [instance])
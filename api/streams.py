@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict, namedtuple
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import reverse
+
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .models import OrderStatusEvent
+
+logger = logging.getLogger('api.streams')
+
+# owner is the user whose order changed, data the event serialized once for every subscriber
+StreamEvent = namedtuple('StreamEvent', ['id', 'owner', 'data'])
+
+EVENT_FIELDS = (
+    'id', 'order__quote__user_id', 'order_id', 'order__tracking_number', 'from_status', 'to_status', 'created_ts'
+)
+
+
+def run_query(function, *args):
+    '''
+    Run ORM work on the executor's thread pool, so a slow query never holds
+    up the event loop, with the connections recycled the way executor_view does
+    '''
+    def run():
+        close_old_connections()
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+def fetch_events(after, owner=None, limit=None):
+    '''
+    Status events with an id above after, oldest first, optionally only for one user's orders
+    '''
+    events = OrderStatusEvent.objects.filter(id__gt=after).order_by('id')
+    if owner is not None:
+        events = events.filter(order__quote__user_id=owner)
+    rows = events.values_list(*EVENT_FIELDS)
+    if limit is not None:
+        rows = rows[:limit]
+    return [
+        StreamEvent(pk, user_id, json.dumps({
+            'id': pk,
+            'order': order_id,
+            'tracking_number': str(tracking_number),
+            'from_status': from_status,
+            'to_status': to_status,
+            'created_ts': created_ts.isoformat(),
+        }))
+        for pk, user_id, order_id, tracking_number, from_status, to_status, created_ts in rows
+    ]
+
+
+def latest_event_ids(count):
+    return list(OrderStatusEvent.objects.order_by('-id').values_list('id', flat=True)[:count])
+
+
+class Subscription:
+    '''
+    One stream's bounded queue. A subscriber that falls SSE_QUEUE_SIZE
+    events behind is marked overflowed instead of buffering without limit;
+    its stream is then closed and the client resumes from its Last-Event-ID.
+    '''
+    def __init__(self, owner, size):
+        self.owner = owner
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def offer(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class StreamHub:
+    '''
+    In-process fan-out of order status events to the open streams of one
+    worker. Subscriptions are indexed by the user whose orders they follow
+    (None for staff, who follow every order), so an event only touches the
+    streams that want it.
+
+    One poller per worker reads new OrderStatusEvent rows, however they were
+    written: immediately when a status change commits in this process (see
+    notify), otherwise every SSE_POLL_SECONDS for changes made by other
+    processes. Each poll re-reads the last SSE_POLL_OVERLAP ids so events
+    committed out of id order are not skipped, and drops those already seen.
+    The poller only runs while the worker has subscribers.
+    '''
+    def __init__(self, queue_size, poll_seconds, poll_overlap, poll_limit):
+        self.queue_size = queue_size
+        self.poll_seconds = poll_seconds
+        self.poll_overlap = poll_overlap
+        self.poll_limit = poll_limit
+        self.reset(None)
+
+    def reset(self, loop):
+        self.loop = loop
+        self.subscribers = {}
+        self.poller = None
+        self.wake = None
+        self.ready = None
+        self.last_id = None
+        self.seen = OrderedDict()
+
+    def subscribe(self, owner):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.reset(loop)
+            self.wake = asyncio.Event()
+            self.ready = asyncio.Event()
+        subscription = Subscription(owner, self.queue_size)
+        self.subscribers.setdefault(owner, set()).add(subscription)
+        if self.poller is None:
+            self.ready.clear()
+            self.poller = loop.create_task(self.poll())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self.subscribers.get(subscription.owner)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscribers[subscription.owner]
+
+    def notify(self):
+        '''
+        Wake the poller; safe to call from any thread
+        '''
+        loop = self.loop
+        if loop is not None and self.subscribers and not loop.is_closed():
+            loop.call_soon_threadsafe(self.wake.set)
+
+    def dispatch(self, events):
+        for event in events:
+            if event.id in self.seen:
+                continue
+            self.seen[event.id] = None
+            for owner in (event.owner, None):
+                for subscription in self.subscribers.get(owner, ()):
+                    subscription.offer(event)
+            self.last_id = max(self.last_id, event.id)
+        while len(self.seen) > self.poll_overlap * 2:
+            self.seen.popitem(last=False)
+
+    async def poll(self):
+        task = asyncio.current_task()
+        try:
+            # Streams start from now, so what the first poll re-reads counts as seen
+            seen = await run_query(latest_event_ids, self.poll_overlap)
+            self.seen.update(dict.fromkeys(reversed(seen)))
+            self.last_id = seen[0] if seen else 0
+            self.ready.set()
+            while self.subscribers:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+                try:
+                    events = await run_query(
+                        fetch_events, max(self.last_id - self.poll_overlap, 0), None, self.poll_limit
+                    )
+                except Exception:
+                    logger.exception('Polling order status events failed')
+                    continue
+                self.dispatch(events)
+                if len(events) == self.poll_limit:
+                    # More waiting, read on without sleeping
+                    self.wake.set()
+        finally:
+            self.ready.set()
+            if self.poller is task:
+                self.poller = None
+
+
+stream_hub = StreamHub(
+    settings.SSE_QUEUE_SIZE, settings.SSE_POLL_SECONDS, settings.SSE_POLL_OVERLAP, settings.SSE_REPLAY_LIMIT
+)
+
+
+def authenticate(raw_token):
+    '''
+    The user of a JWT access token, or None if it is invalid
+    '''
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def format_event(event):
+    return f'id: {event.id}\nevent: status\ndata: {event.data}\n\n'.encode('utf-8')
+
+
+async def respond(send, status, message):
+    body = json.dumps({'success': False, 'message': message, 'data': []}).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii'))],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_orders(scope, receive, send, staff):
+    '''
+    Server-Sent Events of order status changes: the user's own orders, or
+    every order on the staff stream. Authenticated with a JWT access token
+    in the Authorization header or, as EventSource cannot set headers, the
+    token query parameter. A client resuming with Last-Event-ID (header or
+    last_event_id parameter) first gets the events it missed, read from the
+    database; past SSE_REPLAY_LIMIT of them it gets a reset event instead
+    and should reload the orders. Idle streams get a comment every
+    SSE_HEARTBEAT_SECONDS so proxies keep them open.
+    '''
+    headers = dict(scope['headers'])
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    try:
+        raw_token = JWTAuthentication().get_raw_token(headers.get(b'authorization', b''))
+    except AuthenticationFailed:
+        raw_token = None
+    if raw_token is None and query.get('token'):
+        raw_token = query['token'][0].encode('utf-8')
+    user = await run_query(authenticate, raw_token) if raw_token else None
+    if user is None:
+        return await respond(send, 401, 'A valid access token is required')
+    if staff and not user.is_staff:
+        return await respond(send, 403, 'You do not have permission to perform this action.')
+
+    last_event_id = headers.get(b'last-event-id', b'').decode('latin-1') or query.get('last_event_id', [''])[0]
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return await respond(send, 400, 'Last-Event-ID must be an event id')
+
+    owner = None if staff else user.pk
+    # Subscribed before the replay is read, so nothing falls between the two
+    subscription = stream_hub.subscribe(owner)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        # Events committed from here on are past the poller's starting point
+        await stream_hub.ready.wait()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': f'retry: {settings.SSE_RETRY_MS}\n\n'.encode('ascii'), 'more_body': True})
+
+        replayed = set()
+        if last_event_id is not None:
+            events = await run_query(fetch_events, last_event_id, owner, settings.SSE_REPLAY_LIMIT + 1)
+            if len(events) > settings.SSE_REPLAY_LIMIT:
+                await send({'type': 'http.response.body', 'body': b'event: reset\ndata: {}\n\n', 'more_body': True})
+                return
+            replayed = {event.id for event in events}
+            if events:
+                await send({'type': 'http.response.body', 'body': b''.join(map(format_event, events)), 'more_body': True})
+
+        while not subscription.overflowed:
+            get = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {get, disconnect}, timeout=settings.SSE_HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnect in done:
+                get.cancel()
+                return
+            if get not in done:
+                get.cancel()
+                await send({'type': 'http.response.body', 'body': b': heartbeat\n\n', 'more_body': True})
+                continue
+
+            # Everything already queued goes out in one write
+            events = [get.result()]
+            while not subscription.queue.empty():
+                events.append(subscription.queue.get_nowait())
+            events = [event for event in events if event.id not in replayed]
+            if events and not subscription.overflowed:
+                await send({'type': 'http.response.body', 'body': b''.join(map(format_event, events)), 'more_body': True})
+    finally:
+        stream_hub.unsubscribe(subscription)
+        if not disconnect.done():
+            disconnect.cancel()
+            await send({'type': 'http.response.body', 'body': b''})
+
+
+class StreamRouter:
+    '''
+    ASGI application serving the order streams itself and passing every
+    other request to Django, which cannot stream from a coroutine before
+    Django 3.2. A stream then costs a coroutine and a queue, not a thread.
+    '''
+    def __init__(self, application):
+        self.application = application
+        self.routes = {reverse('order_stream'): False, reverse('staff_order_stream'): True}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] in self.routes:
+            return await stream_orders(scope, receive, send, staff=self.routes[scope['path']])
+        return await self.application(scope, receive, send)
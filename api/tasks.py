@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.mail import send_mail
+
+from .invoicing import generate_invoice
+from .jobs import task
+from .pricing import pricing_table, reprice_quotes
+User = get_user_model()
+
+
+@task('send_welcome_email')
+def send_welcome_email(user_id):
+    '''
+    Greet a newly registered user; users without an email address are skipped
+    '''
+    user = User.objects.filter(pk=user_id).values('username', 'first_name', 'email').first()
+    if user is None or not user['email']:
+        return
+    send_mail(
+        'Welcome aboard',
+        f"Hi {user['first_name'] or user['username']},\n\n"
+        'Your account is ready. Request a quote to send your first parcel.\n',
+        None,
+        [user['email']]
+    )
+
+
+@task('reprice_quotes')
+def reprice_pending_quotes():
+    '''
+    Reprice quotes without an order after the route rates changed. The
+    rate table is reloaded first, this worker may still hold the old rates.
+    '''
+    pricing_table.clear()
+    reprice_quotes()
+
+
+@task('generate_invoice')
+def invoice_order(order_id):
+    generate_invoice(order_id)
@@ -0,0 +1,22 @@
+from ..models import Quote, Order
+
+
+def create_quote(user, **kwargs):
+    '''
+    A Nairobi to Mombasa parcel quote for user; keyword arguments override its fields
+    '''
+    return Quote.objects.create(**{
+        'item_name': 'Parcel',
+        'item_description': 'Testing',
+        'location_from': 'Nairobi',
+        'location_to': 'Mombasa',
+        'user': user,
+        **kwargs
+    })
+
+
+def create_order(user, quote=None, **kwargs):
+    '''
+    An order for quote, or for a new create_quote quote of user
+    '''
+    return Order.objects.create(quote=quote or create_quote(user), **kwargs)
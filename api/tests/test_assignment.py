@@ -0,0 +1,80 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from ..assignment import assign_riders, availability_index
+from .factories import create_order, create_quote
+from ..models import Rider, Quote, Order
+User = get_user_model()
+
+
+class RiderAssignmentTestCase(TestCase):
+    def setUp(self):
+        availability_index.clear()
+        self.user = User.objects.create_user(username='test', password='test2020')
+
+    def create_order(self, location_from, order_status=Order.REL):
+        order = create_order(self.user, create_quote(self.user, location_from=location_from))
+        Order.objects.filter(pk=order.pk).update(order_status=order_status)
+        return order
+
+    def test_matches_riders_by_pickup_location(self):
+        nairobi = Rider.objects.create(rider_name='Nairobi', rider_motor='KAA', location='Nairobi')
+        kisumu = Rider.objects.create(rider_name='Kisumu', rider_motor='KAB', location='Kisumu')
+        first = self.create_order('kisumu ')
+        second = self.create_order('NAIROBI')
+
+        assignments = assign_riders()
+
+        self.assertEqual({(order.pk, rider.pk) for order, rider in assignments}, {(first.pk, kisumu.pk), (second.pk, nairobi.pk)})
+        self.assertEqual(Order.objects.get(pk=first.pk).rider, kisumu)
+
+    def test_never_double_books(self):
+        Rider.objects.create(rider_name='Only', rider_motor='KAA', location='Nairobi')
+        orders = [self.create_order('Nairobi') for _ in range(3)]
+
+        self.assertEqual(len(assign_riders()), 1)
+        self.assertEqual(assign_riders(), [])
+        self.assertEqual(Order.objects.filter(pk__in=[order.pk for order in orders], rider__isnull=False).count(), 1)
+
+    def test_skips_orders_not_released(self):
+        Rider.objects.create(rider_name='Rider', rider_motor='KAA', location='Nairobi')
+        self.create_order('Nairobi', order_status=Order.WAR)
+
+        self.assertEqual(assign_riders(), [])
+
+    def test_rider_freed_by_delivery_is_reused(self):
+        rider = Rider.objects.create(rider_name='Rider', rider_motor='KAA', location='Nairobi')
+        delivered = self.create_order('Nairobi', order_status=Order.DEL)
+        Order.objects.filter(pk=delivered.pk).update(rider=rider)
+        order = self.create_order('Nairobi')
+
+        assignments = assign_riders()
+
+        self.assertEqual([(o.pk, r.pk) for o, r in assignments], [(order.pk, rider.pk)])
+        # The delivered order keeps its rider
+        self.assertEqual(list(rider.orders.order_by('pk')), [delivered, order])
+
+    def test_stale_index_entries_are_rechecked(self):
+        busy = Rider.objects.create(rider_name='Busy', rider_motor='KAA', location='Nairobi')
+        availability_index.refresh()
+        taken = self.create_order('Nairobi', order_status=Order.TRA)
+        Order.objects.filter(pk=taken.pk).update(rider=busy)
+        self.create_order('Nairobi')
+
+        self.assertEqual(assign_riders(), [])
+        self.assertNotIn(busy.pk, availability_index.riders)
+
+    def test_custom_scoring_function(self):
+        Rider.objects.create(rider_name='Near', rider_motor='KAA', location='Kisumu')
+        far = Rider.objects.create(rider_name='Far', rider_motor='KAB', location='Mombasa')
+        self.create_order('Nairobi')
+
+        assignments = assign_riders(score=lambda rider, order: rider.rider_name != 'Far')
+        self.assertEqual(assignments[0][1], far)
+
+    def tearDown(self):
+        availability_index.clear()
+        Order.objects.all().delete()
+        Quote.objects.all().delete()
+        Rider.objects.all().delete()
+        User.objects.all().delete()
@@ -0,0 +1,39 @@
+from asgiref.sync import async_to_sync
+
+from django.test import TransactionTestCase, RequestFactory
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_quote
+from ..models import Quote
+from ..views import QuoteListView, QuoteDetailsView, executor_view
+User = get_user_model()
+
+
+class ExecutorViewTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test2020')
+        self.quote = create_quote(self.user)
+        access_token = RefreshToken.for_user(self.user).access_token
+        self.factory = RequestFactory(HTTP_AUTHORIZATION=f'Bearer {access_token}')
+
+    def tearDown(self):
+        Quote.objects.all().delete()
+        self.user.delete()
+
+    def test_list_view_runs_on_thread_pool(self):
+        view = executor_view(QuoteListView.as_view())
+        self.response = async_to_sync(view)(self.factory.get('/api/quotes'))
+
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.response.is_rendered)
+        self.assertEqual(self.response.data['results'][0]['item_name'], 'Parcel')
+
+    def test_detail_view_keeps_url_kwargs(self):
+        view = executor_view(QuoteDetailsView.as_view())
+        self.response = async_to_sync(view)(self.factory.get(f'/api/quote/{self.quote.id}'), id=self.quote.id)
+
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.data['id'], self.quote.id)
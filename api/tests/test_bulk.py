@@ -0,0 +1,154 @@
+import json
+
+from django.db.models.signals import post_save
+from django.shortcuts import reverse
+from django.test import TestCase, Client, skipUnlessDBFeature
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_order
+from ..assignment import availability_index
+from ..models import Rider, Quote, Order
+from ..signals import index_rider, index_order_rider
+User = get_user_model()
+
+
+class BulkViewTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+
+    def send(self, method, name, payload):
+        return getattr(self.client, method)(reverse(name), data=json.dumps(payload), content_type='application/json')
+
+    def rider_payload(self, count):
+        return [
+            {'rider_name': f'Rider {index}', 'rider_motor': f'KAA {index}', 'rider_phone': f'+2547000000{index:02d}'}
+            for index in range(count)
+        ]
+
+    @skipUnlessDBFeature('can_return_rows_from_bulk_insert')
+    def test_bulk_create_riders_in_constant_queries(self):
+        # JWT user, savepoint, one phone uniqueness query, one INSERT and savepoint release
+        with self.assertNumQueries(5):
+            self.response = self.send('post', 'riders_bulk', self.rider_payload(50))
+
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Rider.objects.count(), 50)
+
+    def test_bulk_create_returns_ids(self):
+        self.response = self.send('post', 'riders_bulk', self.rider_payload(3))
+
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [item['id'] for item in self.response.json()['data']],
+            list(Rider.objects.order_by('id').values_list('id', flat=True))
+        )
+
+    def test_bulk_create_reports_item_errors(self):
+        Rider.objects.create(rider_name='Rider', rider_motor='KAA 000', rider_phone='+254700000000')
+        riders = [
+            {'rider_name': 'Valid', 'rider_motor': 'KAA 001'},
+            {'rider_motor': 'KAA 002'},
+            {'rider_name': 'Taken', 'rider_motor': 'KAA 003', 'rider_phone': '+254700000000'},
+            {'rider_name': 'Twice', 'rider_motor': 'KAA 004', 'rider_phone': '+254700000001'},
+            {'rider_name': 'Twice', 'rider_motor': 'KAA 005', 'rider_phone': '+254700000001'},
+        ]
+        self.response = self.send('post', 'riders_bulk', riders)
+
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['index'] for error in self.response.json()['errors']], [1])
+        self.assertEqual(Rider.objects.count(), 1)
+
+        self.response = self.send('post', 'riders_bulk', [riders[0], riders[2], riders[3], riders[4]])
+        errors = self.response.json()['errors']
+        self.assertEqual([error['index'] for error in errors], [1, 3])
+        self.assertIn('rider_phone', errors[0]['errors'])
+        self.assertEqual(Rider.objects.count(), 1)
+
+    def test_bulk_create_quotes_for_client(self):
+        client = User.objects.create_user(username='client', password='test2020')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(client).access_token}')
+        quotes = [
+            {'item_name': f'Parcel {index}', 'item_description': 'Testing', 'location_from': 'Nairobi', 'location_to': 'Mombasa'}
+            for index in range(3)
+        ]
+        self.response = self.send('post', 'quotes_bulk', quotes)
+
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Quote.objects.filter(user=client).count(), 3)
+        self.assertEqual(
+            [item['id'] for item in self.response.json()['data']],
+            list(Quote.objects.filter(user=client).order_by('id').values_list('id', flat=True))
+        )
+
+    def test_bulk_update_orders(self):
+        riders = [Rider.objects.create(rider_name=f'Rider {index}', rider_motor='KAA') for index in range(2)]
+        orders = [create_order(self.staff) for _ in range(2)]
+        self.response = self.send('patch', 'staff_orders_bulk', [
+            {'id': orders[0].pk, 'order_status': Order.WAR, 'rider': riders[0].pk},
+            {'id': orders[1].pk, 'payment_complete_status': True},
+        ])
+
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        orders[0].refresh_from_db()
+        orders[1].refresh_from_db()
+        self.assertEqual(orders[0].order_status, Order.WAR)
+        self.assertEqual(orders[0].rider, riders[0])
+        self.assertTrue(orders[1].payment_complete_status)
+        self.assertEqual(orders[1].order_status, Order.PLA)
+
+    def test_bulk_writes_keep_the_rider_index(self):
+        # bulk_create and bulk_update send no post_save; the per-row fallback must not be what does it
+        for receiver, sender in ((index_rider, Rider), (index_order_rider, Order)):
+            post_save.disconnect(receiver, sender=sender)
+            self.addCleanup(post_save.connect, receiver, sender=sender)
+        availability_index.clear()
+        self.addCleanup(availability_index.clear)
+
+        self.response = self.send('post', 'riders_bulk', self.rider_payload(2))
+        riders = [item['id'] for item in self.response.json()['data']]
+        self.assertEqual(sorted(availability_index.riders), riders)
+
+        order = create_order(self.staff)
+        self.response = self.send('patch', 'staff_orders_bulk', [{'id': order.pk, 'rider': riders[0]}])
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(availability_index.riders), [riders[1]])
+
+    def test_bulk_update_rejects_double_booked_rider(self):
+        rider = Rider.objects.create(rider_name='Rider', rider_motor='KAA')
+        orders = [create_order(self.staff) for _ in range(2)]
+        self.response = self.send('patch', 'staff_orders_bulk', [
+            {'id': orders[0].pk, 'rider': rider.pk},
+            {'id': orders[1].pk, 'rider': rider.pk},
+            {'id': 0, 'order_status': Order.REL},
+        ])
+
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['index'] for error in self.response.json()['errors']], [2])
+
+        self.response = self.send('patch', 'staff_orders_bulk', [
+            {'id': orders[0].pk, 'rider': rider.pk},
+            {'id': orders[1].pk, 'rider': rider.pk},
+        ])
+        self.assertEqual([error['index'] for error in self.response.json()['errors']], [1])
+        self.assertFalse(Order.objects.filter(rider=rider).exists())
+
+        # Once on an undelivered order the rider can't be given another
+        self.send('patch', 'staff_orders_bulk', [{'id': orders[0].pk, 'rider': rider.pk}])
+        self.response = self.send('patch', 'staff_orders_bulk', [{'id': orders[1].pk, 'rider': rider.pk}])
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(Order.objects.filter(rider=rider)), [orders[0]])
+
+    def test_batch_limit(self):
+        with self.settings(BULK_MAX_ITEMS=2):
+            self.response = self.send('post', 'riders_bulk', [{'rider_name': 'Rider', 'rider_motor': 'KAA'}] * 3)
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def tearDown(self):
+        Order.objects.all().delete()
+        Quote.objects.all().delete()
+        Rider.objects.all().delete()
+        User.objects.all().delete()
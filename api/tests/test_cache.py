@@ -0,0 +1,87 @@
+import tempfile
+
+from django.shortcuts import reverse
+from django.db import transaction
+from django.test import TransactionTestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..cache import get_cache, version_key
+from .factories import create_order, create_quote
+from ..models import Rider, Quote, Order
+User = get_user_model()
+
+
+class DetailCacheTestCase(TransactionTestCase):
+    # Invalidation runs on commit, which a TestCase never reaches
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username='test', password='test2020')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.rider = Rider.objects.create(rider_name='Rider', rider_motor='KAA 001')
+        self.quote = create_quote(self.user)
+        self.order = create_order(self.user, self.quote, rider=self.rider)
+        self.url = reverse('order', kwargs={'id': self.order.pk})
+
+    def test_etag_and_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertTrue(first['ETag'].startswith('"'))
+
+        # Only the JWT user lookup hits the database
+        with self.assertNumQueries(1):
+            self.response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(self.response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.response['ETag'], first['ETag'])
+
+    def test_cache_hit_skips_database(self):
+        first = self.client.get(self.url).json()
+
+        with self.assertNumQueries(1):
+            self.response = self.client.get(self.url)
+        self.assertEqual(self.response.json(), first)
+
+    def test_nested_save_invalidates(self):
+        first = self.client.get(self.url)
+        self.rider.rider_name = 'New Rider'
+        self.rider.save()
+
+        self.response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(self.response['ETag'], first['ETag'])
+        self.assertEqual(self.response.json()['rider']['rider_name'], 'New Rider')
+
+    def test_invalidation_waits_for_commit(self):
+        self.client.get(self.url)
+        with transaction.atomic():
+            self.order.payment_ref = 'REF-1'
+            self.order.save()
+            # A reader now would cache the old row under a fresh version
+            self.assertIsNotNone(get_cache().get(version_key(Order, self.order.pk)))
+        self.assertIsNone(get_cache().get(version_key(Order, self.order.pk)))
+        self.assertEqual(self.client.get(self.url).json()['payment_ref'], 'REF-1')
+
+    def test_missing_object(self):
+        self.response = self.client.get(reverse('order', kwargs={'id': 0}))
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'detail': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+            }
+            with override_settings(CACHES=caches):
+                first = self.client.get(self.url)
+                with self.assertNumQueries(1):
+                    self.response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(self.response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def tearDown(self):
+        get_cache().clear()
+        Order.objects.all().delete()
+        Quote.objects.all().delete()
+        Rider.objects.all().delete()
+        User.objects.all().delete()
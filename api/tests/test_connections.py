@@ -0,0 +1,109 @@
+import threading
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.shortcuts import reverse
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from project.db.pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(FakeConnection, size=2, timeout=0.05)
+
+    def test_returned_connections_are_reused(self):
+        first, reused = self.pool.get()
+        self.assertFalse(reused)
+        self.pool.put(first)
+
+        second, reused = self.pool.get()
+        self.assertIs(second, first)
+        self.assertTrue(reused)
+        self.assertEqual(first.rollbacks, 1)
+        self.assertEqual(self.pool.stats()['created'], 1)
+
+    def test_exhausted_pool_times_out(self):
+        self.pool.get()
+        self.pool.get()
+
+        with self.assertRaises(OperationalError):
+            self.pool.get()
+        self.assertEqual(self.pool.stats()['timeouts'], 1)
+
+    def test_waiting_caller_gets_released_connection(self):
+        held, _ = self.pool.get()
+        self.pool.get()
+        self.pool.timeout = 2
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(self.pool.get()))
+        waiter.start()
+        self.pool.put(held)
+        waiter.join()
+
+        self.assertEqual(result, [(held, True)])
+        self.assertEqual(self.pool.stats()['waits'], 1)
+
+    def test_failed_ping_and_errors_discard_connections(self):
+        self.pool.ping = lambda connection: False
+        first, _ = self.pool.get()
+        self.pool.put(first)
+
+        second, reused = self.pool.get()
+        self.assertIsNot(second, first)
+        self.assertFalse(reused)
+        self.assertTrue(first.closed)
+
+        self.pool.put(second, discard=True)
+        self.assertTrue(second.closed)
+        self.assertEqual(self.pool.stats()['idle'], 0)
+
+
+    def test_returned_connections_are_reset(self):
+        resets = []
+        self.pool.reset = resets.append
+        first, _ = self.pool.get()
+        self.pool.put(first)
+        self.assertEqual(resets, [first])
+
+        def fail(connection):
+            raise OperationalError('cannot reset')
+        self.pool.reset = fail
+        second, _ = self.pool.get()
+        self.pool.put(second)
+        self.assertTrue(second.closed)
+        self.assertEqual(self.pool.stats()['idle'], 0)
+
+
+class ConnectionReuseMiddlewareTestCase(TestCase):
+    @override_settings(SQL_CONNECTION_HEADER=True)
+    def test_reports_held_connection(self):
+        connection.ensure_connection()
+        self.response = self.client.get(reverse('riders'))
+
+        self.assertEqual(self.response['X-DB-Connection'], 'default=reused')
+
+    @override_settings(SQL_CONNECTION_HEADER=False)
+    def test_header_is_opt_in(self):
+        self.response = self.client.get(reverse('riders'))
+
+        self.assertNotIn('X-DB-Connection', self.response)
+
+    def test_db_pool_stats(self):
+        out = StringIO()
+        call_command('db_pool_stats', stdout=out)
+
+        self.assertIn('CONN_MAX_AGE', out.getvalue())
@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+
+from django.shortcuts import reverse
+from django.test import TestCase, TransactionTestCase, Client
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_order, create_quote
+from .test_streams import StreamClient
+from ..models import Rider, Quote, Order, Invoice
+User = get_user_model()
+
+
+class StaffExportViewTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+        rider = Rider.objects.create(rider_name='Rider', rider_motor='KAA 001')
+        for index in range(3):
+            quote = create_quote(self.staff, item_name=f'Parcel {index}')
+            order = create_order(self.staff, quote, rider=rider if index == 0 else None)
+            Invoice.objects.create(order=order, quote=quote, total_amount=100, amount_paid=0, amount_due=100)
+
+    def export(self, name, format):
+        self.response = self.client.get(reverse(name) + f'?format={format}')
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.response.streaming)
+        return b''.join(self.response.streaming_content).decode('utf-8')
+
+    def test_export_invoices_ndjson(self):
+        lines = self.export('staff_invoices_export', 'ndjson').splitlines()
+
+        self.assertEqual(self.response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['order']['rider']['rider_name'], 'Rider')
+        self.assertIsNone(json.loads(lines[1])['order']['rider'])
+
+    def test_export_orders_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('staff_orders_export', 'csv'))))
+
+        self.assertIn('attachment; filename="orders.csv"', self.response['Content-Disposition'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['rider.rider_name'], 'Rider')
+        self.assertEqual(rows[1]['rider.rider_name'], '')
+        self.assertEqual(rows[2]['quote.item_name'], 'Parcel 2')
+
+    def test_export_requires_staff(self):
+        client = User.objects.create_user(username='client', password='test2020')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(client).access_token}')
+        self.response = self.client.get(reverse('staff_quotes_export') + '?format=csv')
+
+        self.assertEqual(self.response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def tearDown(self):
+        Invoice.objects.all().delete()
+        Order.objects.all().delete()
+        Quote.objects.all().delete()
+        Rider.objects.all().delete()
+        User.objects.all().delete()
+
+
+class ASGIExportTestCase(TransactionTestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        for index in range(3):
+            create_order(self.staff, create_quote(self.staff, item_name=f'Parcel {index}'))
+
+    async def test_export_streams_under_asgi(self):
+        token = str(RefreshToken.for_user(self.staff).access_token)
+        async with StreamClient(
+            reverse('staff_orders_export'), 'format=ndjson', [('authorization', f'Bearer {token}')]
+        ) as stream:
+            lines = (await stream.read_until('Parcel 2')).splitlines()
+
+        self.assertEqual(stream.start['status'], status.HTTP_200_OK)
+        self.assertEqual([json.loads(line)['quote']['item_name'] for line in lines], ['Parcel 0', 'Parcel 1', 'Parcel 2'])
@@ -0,0 +1,112 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+
+from ..invoicing import checkpoint_name, generate_invoices
+from ..jobs import run_jobs
+from ..ledger import rebuild_ledger
+from .factories import create_order, create_quote
+from ..models import Order, Invoice, Job, Checkpoint, UserLedger
+User = get_user_model()
+
+
+class InvoicingTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='client', password='test2020')
+
+    def test_placed_order_is_invoiced_in_the_background(self):
+        order = create_order(self.user, create_quote(self.user, estimated_cost=250))
+        self.assertFalse(Invoice.objects.exists())
+        self.assertEqual(Job.objects.get().task, 'generate_invoice')
+
+        self.assertEqual(run_jobs(), {Job.DONE: 1})
+        invoice = Invoice.objects.get(order=order)
+        self.assertEqual((invoice.total_amount, invoice.amount_due, invoice.payment_status), (250, 250, Invoice.UNPAID))
+        self.assertEqual(UserLedger.objects.get(user=self.user).due, 250)
+
+    def test_unpriced_order_is_invoiced_on_delivery(self):
+        quote = create_quote(self.user, estimated_cost=None)
+        order = create_order(self.user, quote)
+        run_jobs()
+        self.assertFalse(Invoice.objects.exists())
+
+        quote.estimated_cost = 80
+        quote.save()
+        for status in (Order.WAR, Order.REL, Order.TRA):
+            order.transition_to(status)
+        self.assertFalse(Job.objects.filter(job_status=Job.QUEUED).exists())
+        order.transition_to(Order.DEL)
+        run_jobs()
+        self.assertEqual(Invoice.objects.get(order=order).total_amount, 80)
+
+    def test_invoiced_order_is_not_invoiced_again(self):
+        quote = create_quote(self.user, estimated_cost=100)
+        order = create_order(self.user, quote)
+        Invoice.objects.create(order=order, quote=quote, total_amount=120)
+        self.assertEqual(run_jobs(), {Job.DONE: 1})
+        self.assertEqual(Invoice.objects.get().total_amount, 120)
+
+    def bulk_orders(self, count, **kwargs):
+        # Bulk inserts skip the signals, like orders from before invoicing was automatic
+        quotes = [create_quote(self.user, estimated_cost=100 + index) for index in range(count)]
+        Order.objects.bulk_create([Order(quote=quote, **kwargs) for quote in quotes])
+        return list(Order.objects.filter(quote__in=quotes).order_by('id'))
+
+    def test_backfill_in_chunks(self):
+        orders = self.bulk_orders(7)
+        self.bulk_orders(1, payment_complete_status=True)
+        Order.objects.bulk_create([Order(quote=create_quote(self.user, estimated_cost=None))])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(generate_invoices(chunk_size=3), 7)
+        # One insert per chunk
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "api_invoice"')]), 3)
+        self.assertEqual(
+            sorted(Invoice.objects.values_list('order_id', 'total_amount')),
+            [(order.pk, order.quote.estimated_cost) for order in orders]
+        )
+        self.assertEqual(Checkpoint.objects.get(name=checkpoint_name(0, 1)).position, orders[-1].pk)
+
+        # The rollups match a full rebuild
+        ledger = UserLedger.objects.values('invoice_count', 'invoiced', 'due').get(user=self.user)
+        rebuild_ledger()
+        self.assertEqual(ledger, UserLedger.objects.values('invoice_count', 'invoiced', 'due').get(user=self.user))
+        self.assertEqual(ledger['invoice_count'], 7)
+
+        self.assertEqual(generate_invoices(), 0)
+
+    def test_backfill_resumes_from_checkpoint(self):
+        orders = self.bulk_orders(6)
+        apply = 'api.invoicing.apply_invoice_changes'
+        with mock.patch(apply, side_effect=[None, RuntimeError('Stopped')]):
+            with self.assertRaises(RuntimeError):
+                generate_invoices(chunk_size=2)
+        # The failed chunk rolled back with its checkpoint
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(Checkpoint.objects.get().position, orders[1].pk)
+
+        self.assertEqual(generate_invoices(chunk_size=2), 4)
+        self.assertEqual(Invoice.objects.count(), 6)
+
+    def test_partitions_split_the_orders(self):
+        orders = self.bulk_orders(5)
+        self.assertEqual(generate_invoices(partition=1, partitions=2), len([o for o in orders if o.pk % 2 == 1]))
+        self.assertEqual(generate_invoices(partition=0, partitions=2), len([o for o in orders if o.pk % 2 == 0]))
+        self.assertEqual(Invoice.objects.count(), 5)
+
+    def test_command(self):
+        self.bulk_orders(3)
+        stdout = StringIO()
+        call_command('generate_invoices', '--partitions', '2', '--partition', '0', stdout=stdout)
+        call_command('generate_invoices', '--partitions', '2', '--partition', '1', stdout=stdout)
+        self.assertEqual(Invoice.objects.count(), 3)
+        self.assertIn('Created', stdout.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('generate_invoices', '--partitions', '2', '--partition', '2')
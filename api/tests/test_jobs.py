@@ -0,0 +1,139 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+
+from ..jobs import TASKS, claim_jobs, enqueue, requeue_stale_jobs, run_jobs, task, work
+from .factories import create_quote
+from ..models import RouteRate, Job
+User = get_user_model()
+
+calls = []
+
+
+@task('test_record')
+def record(value):
+    calls.append(value)
+
+
+@task('test_fail')
+def fail():
+    raise RuntimeError('Provider unavailable')
+
+
+@override_settings(JOB_BACKOFF_SECONDS=10, JOB_BACKOFF_MAX_SECONDS=60)
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_run_by_priority_then_age(self):
+        enqueue('test_record', {'value': 'normal'})
+        enqueue('test_record', {'value': 'low'}, priority=Job.LOW)
+        enqueue('test_record', {'value': 'high'}, priority=Job.HIGH)
+        enqueue('test_record', {'value': 'later'}, delay=timedelta(hours=1))
+
+        self.assertEqual(run_jobs(batch_size=2), {Job.DONE: 2})
+        self.assertEqual(run_jobs(batch_size=2), {Job.DONE: 1})
+        self.assertEqual(run_jobs(), {})
+        self.assertEqual(calls, ['high', 'normal', 'low'])
+        self.assertEqual(Job.objects.filter(job_status=Job.DONE, attempts=1).count(), 3)
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        enqueue('test_record', {'value': 1})
+        self.assertEqual(len(claim_jobs()), 1)
+        self.assertEqual(claim_jobs(), [])
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        job = enqueue('test_fail', max_attempts=3)
+        delays = []
+        for attempt in range(1, 4):
+            before = timezone.now()
+            self.assertEqual(run_jobs(), {Job.QUEUED if attempt < 3 else Job.FAILED: 1})
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('Provider unavailable', job.last_error)
+            delays.append((job.run_at - before).total_seconds())
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+
+        # 10s then 20s, give or take a quarter; no retry after the last attempt
+        self.assertTrue(7.5 <= delays[0] <= 12.5)
+        self.assertTrue(15 <= delays[1] <= 25)
+        self.assertEqual(job.job_status, Job.FAILED)
+
+    def test_unknown_task_fails_at_once(self):
+        job = enqueue('test_missing')
+        self.assertEqual(run_jobs(), {Job.FAILED: 1})
+        job.refresh_from_db()
+        self.assertIn('No task is registered', job.last_error)
+
+    def test_key_queues_work_once(self):
+        self.assertIsNotNone(enqueue('test_record', {'value': 1}, key='once'))
+        self.assertIsNone(enqueue('test_record', {'value': 2}, key='once'))
+        self.assertEqual(Job.objects.count(), 1)
+
+        # Running, so a change made now needs another run
+        claim_jobs()
+        self.assertIsNotNone(enqueue('test_record', {'value': 3}, key='once'))
+
+    def test_stale_jobs_are_requeued(self):
+        job = enqueue('test_record', {'value': 1})
+        claim_jobs()
+        self.assertEqual(requeue_stale_jobs(), 0)
+        Job.objects.filter(pk=job.pk).update(started_ts=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.job_status, Job.QUEUED)
+        self.assertIn('Timed out', job.last_error)
+
+    def test_work_drains_the_queue(self):
+        for value in range(7):
+            enqueue('test_record', {'value': value})
+        enqueue('test_fail')
+        self.assertEqual(work(threading.Event(), batch_size=3, drain=True), {Job.DONE: 7, Job.QUEUED: 1})
+        self.assertEqual(calls, list(range(7)))
+
+        stdout = StringIO()
+        enqueue('test_record', {'value': 'command'})
+        call_command('run_workers', '--drain', stdout=stdout)
+        self.assertIn('Ran 1 jobs', stdout.getvalue())
+
+
+class JobTaskTestCase(TestCase):
+    def test_welcome_email(self):
+        user = User.objects.create_user(username='client', first_name='Jane', email='jane@example.com', password='test2020')
+        enqueue('send_welcome_email', {'user_id': user.pk})
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(run_jobs(), {Job.DONE: 1})
+        self.assertEqual(mail.outbox[0].to, ['jane@example.com'])
+        self.assertIn('Hi Jane', mail.outbox[0].body)
+
+    def test_register_queues_welcome_email(self):
+        response = self.client.post(reverse('register'), data={'username': 'jane', 'email': 'jane@example.com', 'password': 'test2020'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = Job.objects.get(task='send_welcome_email')
+        self.assertEqual(job.payload, {'user_id': User.objects.get(username='jane').pk})
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_rate_changes_reprice_pending_quotes_once(self):
+        user = User.objects.create_user(username='client', password='test2020')
+        quote = create_quote(user, item_weight=2)
+        RouteRate.objects.create(location_from='Nairobi', location_to='Mombasa', base_cost=500, cost_per_kg=100, delivery_hours=24)
+        rate = RouteRate.objects.create(location_from='Nairobi', location_to='Kisumu', base_cost=400, delivery_hours=12)
+        rate.delete()
+        self.assertEqual(Job.objects.filter(task='reprice_quotes').count(), 1)
+
+        self.assertEqual(run_jobs(), {Job.DONE: 1})
+        quote.refresh_from_db()
+        self.assertEqual(quote.estimated_cost, 700)
+
+    def test_tasks_are_registered(self):
+        self.assertTrue({'send_welcome_email', 'reprice_quotes'} <= TASKS.keys())
@@ -0,0 +1,195 @@
+from unittest import mock
+
+from django.shortcuts import reverse
+from django.test import TestCase, Client
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..ledger import PaymentReferenceTaken, record_payment, rebuild_ledger
+from .factories import create_order
+from ..models import Invoice, Payment, UserLedger, DailyLedger, StatusLedger
+User = get_user_model()
+
+
+def ledger_snapshot():
+    return (
+        sorted(UserLedger.objects.values_list('user_id', 'invoice_count', 'invoiced', 'paid', 'due')),
+        sorted(StatusLedger.objects.filter(invoice_count__gt=0).values_list('status', 'invoice_count', 'invoiced', 'paid', 'due')),
+        sorted(DailyLedger.objects.values_list('day', 'invoice_count', 'invoiced', 'payment_count', 'collected')),
+    )
+
+
+class LedgerTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.user = User.objects.create_user(username='client', password='test2020')
+
+    def create_invoice(self, total_amount, user=None):
+        order = create_order(user or self.user)
+        return Invoice.objects.create(order=order, quote=order.quote, total_amount=total_amount)
+
+    def test_new_invoice_is_unpaid(self):
+        invoice = self.create_invoice(100)
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.amount_paid, invoice.amount_due, invoice.payment_status), (0, 100, Invoice.UNPAID))
+        self.assertEqual(UserLedger.objects.get(user=self.user).due, 100)
+        self.assertEqual(StatusLedger.objects.get(status=Invoice.UNPAID).invoice_count, 1)
+
+    def test_record_payment_updates_invoice_and_rollups(self):
+        invoice = self.create_invoice(100)
+        record_payment(invoice.pk, 40, reference='pay-1')
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.amount_paid, invoice.amount_due, invoice.payment_status), (40, 60, Invoice.PARTIAL))
+
+        record_payment(invoice.pk, 60, reference='pay-2')
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.payment_status, Invoice.PAID)
+
+        ledger = UserLedger.objects.get(user=self.user)
+        self.assertEqual((ledger.invoiced, ledger.paid, ledger.due), (100, 100, 0))
+        self.assertEqual(StatusLedger.objects.get(status=Invoice.PAID).invoice_count, 1)
+        self.assertEqual(StatusLedger.objects.get(status=Invoice.UNPAID).invoice_count, 0)
+        day = DailyLedger.objects.get(day=timezone.localdate())
+        self.assertEqual((day.payment_count, day.collected), (2, 100))
+
+    def test_duplicate_reference_is_recorded_once(self):
+        invoice = self.create_invoice(100)
+        first, created = record_payment(invoice.pk, 40, reference='pay-1')
+        self.assertTrue(created)
+        second, created = record_payment(invoice.pk, 40, reference='pay-1')
+        self.assertFalse(created)
+        self.assertEqual(first.pk, second.pk)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.amount_paid, 40)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_reference_of_another_invoice_is_refused(self):
+        first, second = self.create_invoice(100), self.create_invoice(50)
+        record_payment(first.pk, 40, reference='pay-1')
+        with self.assertRaises(PaymentReferenceTaken):
+            record_payment(second.pk, 40, reference='pay-1')
+        second.refresh_from_db()
+        self.assertEqual(second.amount_paid, 0)
+
+    def test_reference_recorded_concurrently(self):
+        invoice = self.create_invoice(100)
+        existing, _ = record_payment(invoice.pk, 40, reference='pay-1')
+        # The first look finds nothing, as when the other request had not committed yet
+        with mock.patch('api.ledger.recorded_payment', side_effect=[None, existing]):
+            payment, created = record_payment(invoice.pk, 40, reference='pay-1')
+        self.assertEqual((payment.pk, created), (existing.pk, False))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.amount_paid, 40)
+        self.assertEqual(DailyLedger.objects.get().payment_count, 1)
+
+    def test_payments_are_append_only(self):
+        invoice = self.create_invoice(100)
+        payment, _ = record_payment(invoice.pk, 40)
+        payment.amount = 10
+        with self.assertRaises(ValueError):
+            payment.save()
+
+    def test_save_keeps_amount_paid_and_follows_total(self):
+        invoice = self.create_invoice(100)
+        record_payment(invoice.pk, 100)
+        invoice.amount_paid = 0
+        invoice.total_amount = 150
+        invoice.save()
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.amount_paid, invoice.amount_due, invoice.payment_status), (100, 50, Invoice.PARTIAL))
+        self.assertEqual(UserLedger.objects.get(user=self.user).due, 50)
+        self.assertEqual(StatusLedger.objects.get(status=Invoice.PARTIAL).invoiced, 150)
+
+    def test_delete_removes_invoice_from_rollups(self):
+        invoice = self.create_invoice(100)
+        self.create_invoice(30)
+        invoice.delete()
+        ledger = UserLedger.objects.get(user=self.user)
+        self.assertEqual((ledger.invoice_count, ledger.due), (1, 30))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        first = self.create_invoice(100)
+        second = self.create_invoice(80, user=self.staff)
+        record_payment(first.pk, 100)
+        record_payment(second.pk, 30)
+        second.total_amount = 90
+        second.save()
+        incremental = ledger_snapshot()
+
+        rebuild_ledger()
+        self.assertEqual(ledger_snapshot(), incremental)
+
+
+class LedgerViewTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.user = User.objects.create_user(username='client', password='test2020')
+        self.staff_client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+        self.user_client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        order = create_order(self.user)
+        self.invoice = Invoice.objects.create(order=order, quote=order.quote, total_amount=100)
+
+    def test_staff_record_payment(self):
+        url = reverse('invoice_payments', args=[self.invoice.pk])
+        self.response = self.staff_client.post(url, {'amount': 25, 'reference': 'pay-1'}, content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.response = self.staff_client.post(url, {'amount': 25, 'reference': 'pay-1'}, content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+
+        self.response = self.user_client.get(url)
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.json()['amount_due'], 75)
+        self.assertEqual(len(self.response.json()['payments']), 1)
+
+    def test_payments_of_other_clients_are_hidden(self):
+        other = User.objects.create_user(username='other', password='test2020')
+        other_client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(other).access_token}')
+        self.response = other_client.get(reverse('invoice_payments', args=[self.invoice.pk]))
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.response.json()['success'])
+
+    def test_reference_of_another_invoice_is_a_bad_request(self):
+        record_payment(self.invoice.pk, 25, reference='pay-1')
+        order = create_order(self.user)
+        other = Invoice.objects.create(order=order, quote=order.quote, total_amount=50)
+        url = reverse('invoice_payments', args=[other.pk])
+        self.response = self.staff_client.post(url, {'amount': 25, 'reference': 'pay-1'}, content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_client_cannot_record_payment(self):
+        url = reverse('invoice_payments', args=[self.invoice.pk])
+        self.response = self.user_client.post(url, {'amount': 25}, content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_ledger_summary_reads_rollups(self):
+        record_payment(self.invoice.pk, 40)
+        # The user lookup for authentication, then the status rollup rows
+        with self.assertNumQueries(2):
+            self.response = self.staff_client.get(reverse('staff_ledger_summary'))
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.json()['totals'], {'invoice_count': 1, 'invoiced': 100, 'paid': 40, 'due': 60})
+
+    def test_ledger_daily(self):
+        record_payment(self.invoice.pk, 40)
+        self.response = self.staff_client.get(reverse('staff_ledger_daily'))
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        days = self.response.json()['days']
+        self.assertEqual(len(days), 1)
+        self.assertEqual((days[0]['invoiced'], days[0]['collected']), (100, 40))
+
+        self.response = self.staff_client.get(reverse('staff_ledger_daily') + '?start=2021-02-01&end=2021-01-01')
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ledger_users(self):
+        self.response = self.staff_client.get(reverse('staff_ledger_users') + '?limit=10')
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.json()['users'][0]['user'], self.user.pk)
+        self.assertEqual(self.response.json()['users'][0]['due'], 100)
+
+        self.response = self.user_client.get(reverse('staff_ledger_users'))
+        self.assertEqual(self.response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.shortcuts import reverse
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..locations import (
+    DistanceMatrix, assign_quote_routes, build_distance_matrix, distance_matrix, location_index, resolve_routes
+)
+from .factories import create_quote
+from ..models import Location, LocationAlias, Route, Quote
+User = get_user_model()
+
+
+class LocationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='client', password='test2020')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.nairobi = Location.objects.create(name='Nairobi', latitude=-1.2864, longitude=36.8172)
+        self.mombasa = Location.objects.create(name='Mombasa', latitude=-4.0435, longitude=39.6682)
+        self.kisumu = Location.objects.create(name='Kisumu', latitude=-0.0917, longitude=34.7680)
+        LocationAlias.objects.create(alias='nbo', location=self.nairobi)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = mock.patch.object(distance_matrix, 'directory', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The index and matrix outlive the test transaction
+        for cache in (location_index, distance_matrix):
+            cache.clear()
+            self.addCleanup(cache.clear)
+
+    def test_resolve_exact_alias_and_fuzzy(self):
+        self.assertEqual(location_index.resolve('  NAIROBI '), self.nairobi.pk)
+        self.assertEqual(location_index.resolve('NBO'), self.nairobi.pk)
+        self.assertEqual(location_index.resolve('Nairob'), self.nairobi.pk)
+        self.assertEqual(location_index.resolve('Mombasa Island'), self.mombasa.pk)
+        self.assertIsNone(location_index.resolve('Lodwar'))
+        self.assertIsNone(location_index.resolve(''))
+
+    def test_resolve_is_memoized(self):
+        location_index.resolve('Kisumuu')
+        with self.assertNumQueries(0):
+            self.assertEqual(location_index.resolve('kisumuu'), self.kisumu.pk)
+
+    def test_new_location_reloads_index(self):
+        self.assertIsNone(location_index.resolve('Lodwar'))
+        lodwar = Location.objects.create(name='Lodwar', latitude=3.1191, longitude=35.5973)
+        self.assertEqual(location_index.resolve('Lodwar'), lodwar.pk)
+
+    def test_distance_matrix(self):
+        self.assertEqual(distance_matrix.lookup(self.nairobi.pk, self.mombasa.pk), (None, None))
+        build_distance_matrix()
+        distance_km, duration_minutes = distance_matrix.lookup(self.nairobi.pk, self.mombasa.pk)
+        # About 440km as the crow flies, times the road factor
+        self.assertAlmostEqual(distance_km, 440 * 1.3, delta=15)
+        self.assertEqual(duration_minutes, round(distance_km / 50 * 60))
+        self.assertEqual(distance_matrix.lookup(self.nairobi.pk, self.nairobi.pk)[0], 0)
+        self.assertEqual(distance_matrix.lookup(self.mombasa.pk, self.nairobi.pk)[0], distance_km)
+
+        # Memory-mapped, and another reader sees the same build
+        reader = DistanceMatrix(distance_matrix.directory, max_age=60)
+        self.assertEqual(reader.lookup(self.nairobi.pk, self.mombasa.pk)[0], distance_km)
+        self.assertEqual(type(reader.load()[2]).__name__, 'memmap')
+
+    def test_rebuild_swaps_matrix_and_updates_routes(self):
+        build_distance_matrix()
+        route = resolve_routes([('Nairobi', 'Kisumu')])[('Nairobi', 'Kisumu')]
+        self.assertIsNotNone(route.distance_km)
+
+        self.kisumu.latitude = -1.2864
+        self.kisumu.longitude = 36.8172
+        self.kisumu.save()
+        build_distance_matrix()
+        route.refresh_from_db()
+        self.assertEqual(route.distance_km, 0)
+        # The previous build's files are removed
+        self.assertEqual(len([name for name in os.listdir(distance_matrix.directory) if name.endswith('.npy')]), 2)
+
+    def test_resolve_routes_creates_each_route_once(self):
+        routes = resolve_routes([('Nairobi', 'Mombasa'), ('nairobi', 'mombasa '), ('NBO', 'Kisumu'), ('Lodwar', 'Nairobi')])
+        self.assertEqual(routes[('Nairobi', 'Mombasa')], routes[('nairobi', 'mombasa ')])
+        self.assertEqual(routes[('NBO', 'Kisumu')].origin_id, self.nairobi.pk)
+        self.assertIsNone(routes[('Lodwar', 'Nairobi')])
+        self.assertEqual(Route.objects.count(), 2)
+        with self.assertNumQueries(1):
+            resolve_routes([('Nairobi', 'Mombasa')])
+
+    def create_quote(self, location_from, location_to, **kwargs):
+        return create_quote(self.user, location_from=location_from, location_to=location_to, **kwargs)
+
+    def test_quote_route_on_create(self):
+        self.response = self.client.post(reverse('quotes'), {
+            'item_name': 'Parcel',
+            'item_description': 'Testing',
+            'location_from': 'nairobi',
+            'location_to': 'Mombasa',
+        })
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        route = Route.objects.get(pk=self.response.json()['route'])
+        self.assertEqual((route.origin, route.destination), (self.nairobi, self.mombasa))
+
+        self.response = self.client.post(reverse('quotes_bulk'), [
+            {'item_name': 'Parcel', 'item_description': 'Testing', 'location_from': 'Nairobi', 'location_to': 'Mombasa'},
+            {'item_name': 'Parcel', 'item_description': 'Testing', 'location_from': 'Nowhere', 'location_to': 'Mombasa'},
+        ], content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            list(Quote.objects.order_by('id').values_list('route_id', flat=True)),
+            [route.pk, route.pk, None]
+        )
+
+    def test_assign_quote_routes(self):
+        quotes = [self.create_quote('Nairobi', 'Kisumu'), self.create_quote('Nairobi', 'Kisumu'), self.create_quote('Nowhere', 'Kisumu')]
+        Quote.objects.update(route=None)
+        self.assertEqual(assign_quote_routes(Quote.objects.all(), chunk_size=2), (2, 1))
+        self.assertEqual(len({quote.route_id for quote in Quote.objects.filter(pk__in=[quote.pk for quote in quotes[:2]])}), 1)
+
+    def test_route_lookup(self):
+        build_distance_matrix()
+        self.client.get(reverse('route_lookup') + '?from=Nairobi&to=Mombasa')
+        # Only the user lookup for authentication
+        with self.assertNumQueries(1):
+            self.response = self.client.get(reverse('route_lookup') + '?from=nairobi&to=Mombassa')
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.json()['destination']['name'], 'Mombasa')
+        self.assertGreater(self.response.json()['duration_minutes'], 0)
+
+        self.response = self.client.get(reverse('route_lookup') + '?from=Nairobi&to=Lodwar')
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,89 @@
+import json
+from unittest import mock
+
+from django.shortcuts import reverse
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..serializers import OrderSerializer
+from .factories import create_order, create_quote
+from ..models import Quote, Order, OrderStatusEvent, InvalidStatusTransition
+User = get_user_model()
+
+
+class OrderStatusTransitionTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+        self.quote = create_quote(self.staff)
+        self.order = create_order(self.staff, self.quote)
+
+    def test_create_records_placed_event(self):
+        events = OrderStatusEvent.objects.filter(order=self.order)
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].to_status, Order.PLA)
+        self.assertEqual(events[0].from_status, '')
+
+    def test_transition_appends_event(self):
+        self.order.transition_to(Order.WAR, user=self.staff)
+        self.order.transition_to(Order.REL, user=self.staff)
+
+        self.assertEqual(Order.objects.get(pk=self.order.pk).order_status, Order.REL)
+        self.assertEqual(
+            list(OrderStatusEvent.objects.filter(order=self.order).order_by('id').values_list('to_status', flat=True)),
+            [Order.PLA, Order.WAR, Order.REL]
+        )
+
+    def test_illegal_transition(self):
+        with self.assertRaises(InvalidStatusTransition):
+            self.order.transition_to(Order.DEL)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).order_status, Order.PLA)
+        self.assertEqual(OrderStatusEvent.objects.filter(order=self.order).count(), 1)
+
+    def test_events_are_append_only(self):
+        event = OrderStatusEvent.objects.get(order=self.order)
+        event.to_status = Order.DEL
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_put_routes_status_through_transitions(self):
+        url = reverse('order', kwargs={'id': self.order.pk})
+        self.response = self.client.put(url, data=json.dumps({'order_status': Order.TRA}), content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.response = self.client.put(url, data=json.dumps({'order_status': Order.WAR}), content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.json()['order_status'], Order.WAR)
+
+    def test_put_keeps_a_status_changed_meanwhile(self):
+        url = reverse('order', kwargs={'id': self.order.pk})
+        is_valid = OrderSerializer.is_valid
+
+        def transition_meanwhile(serializer, *args, **kwargs):
+            Order.objects.get(pk=self.order.pk).transition_to(Order.WAR)
+            return is_valid(serializer, *args, **kwargs)
+
+        with mock.patch.object(OrderSerializer, 'is_valid', transition_meanwhile):
+            self.response = self.client.put(url, data=json.dumps({'payment_ref': 'REF-1'}), content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.order_status, order.payment_ref), (Order.WAR, 'REF-1'))
+
+    def test_timeline(self):
+        self.order.transition_to(Order.WAR, user=self.staff)
+        self.response = self.client.get(reverse('order_timeline', kwargs={'id': self.order.pk}))
+
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.json()['order_status'], Order.WAR)
+        self.assertEqual([event['to_status'] for event in self.response.json()['events']], [Order.PLA, Order.WAR])
+        self.assertEqual(self.response.json()['events'][1]['user'], self.staff.pk)
+
+    def tearDown(self):
+        Order.objects.all().delete()
+        Quote.objects.all().delete()
+        User.objects.all().delete()
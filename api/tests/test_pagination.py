@@ -0,0 +1,60 @@
+from django.shortcuts import reverse
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_quote
+from ..models import Quote
+User = get_user_model()
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+        for index in range(7):
+            create_quote(self.staff, item_name=f'Parcel {index}')
+
+    def get_page(self, url):
+        self.response = self.client.get(url)
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        return self.response.json()
+
+    def test_walk_forward_and_back(self):
+        first = self.get_page(reverse('staff_quotes') + '?page_size=3')
+        self.assertEqual([quote['item_name'] for quote in first['results']], ['Parcel 6', 'Parcel 5', 'Parcel 4'])
+        self.assertIsNone(first['previous'])
+
+        second = self.get_page(first['next'])
+        self.assertEqual([quote['item_name'] for quote in second['results']], ['Parcel 3', 'Parcel 2', 'Parcel 1'])
+
+        last = self.get_page(second['next'])
+        self.assertEqual([quote['item_name'] for quote in last['results']], ['Parcel 0'])
+        self.assertIsNone(last['next'])
+
+        back = self.get_page(last['previous'])
+        self.assertEqual(back['results'], second['results'])
+        self.assertIsNotNone(back['next'])
+
+        start = self.get_page(back['previous'])
+        self.assertEqual(start['results'], first['results'])
+        self.assertIsNone(start['previous'])
+
+    def test_timestamp_ties_are_broken_by_id(self):
+        Quote.objects.update(created_ts=Quote.objects.first().created_ts)
+
+        first = self.get_page(reverse('staff_quotes') + '?page_size=4')
+        second = self.get_page(first['next'])
+
+        ids = [quote['id'] for quote in first['results'] + second['results']]
+        self.assertEqual(ids, sorted(Quote.objects.values_list('id', flat=True), reverse=True))
+
+    def test_invalid_cursor(self):
+        self.response = self.client.get(reverse('staff_quotes') + '?cursor=garbage')
+        self.assertEqual(self.response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def tearDown(self):
+        Quote.objects.all().delete()
+        User.objects.all().delete()
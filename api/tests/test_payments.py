@@ -0,0 +1,151 @@
+import json
+
+from django.shortcuts import reverse
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+
+from benchmarks.fake_payment_provider import FakePaymentProvider
+
+from ..invoicing import generate_invoice
+from ..payments import process_callbacks, sign_callback
+from .factories import create_order, create_quote
+from ..models import Invoice, Payment, PaymentCallback, UserLedger
+User = get_user_model()
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRET='secret')
+class PaymentCallbackTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='client', password='test2020')
+        self.client = Client()
+        self.provider = FakePaymentProvider('secret', seed=1)
+
+    def create_order(self, payment_ref, total_amount=100):
+        order = create_order(self.user, payment_ref=payment_ref)
+        if total_amount is not None:
+            Invoice.objects.create(order=order, quote=order.quote, total_amount=total_amount)
+        return order
+
+    def post(self, body, signature):
+        return self.client.post(
+            reverse('payment_callback'), body,
+            content_type='application/json',
+            HTTP_X_PAYMENT_SIGNATURE=signature
+        ).status_code
+
+    def test_ingest_only_queues(self):
+        order = self.create_order('REF1')
+        self.provider.charge('REF1', 100)
+        with self.assertNumQueries(1):
+            codes = self.provider.deliver(self.post)
+        self.assertEqual(codes, [status.HTTP_202_ACCEPTED])
+        self.assertEqual(PaymentCallback.objects.filter(processed_ts__isnull=True).count(), 1)
+        order.refresh_from_db()
+        self.assertFalse(order.payment_complete_status)
+
+    def test_invalid_signature_is_refused(self):
+        body = json.dumps({'id': 'evt_1', 'payment_ref': 'REF1', 'amount': 100, 'status': 'succeeded'}).encode('utf-8')
+        self.assertEqual(self.post(body, sign_callback(body, 'wrong')), status.HTTP_403_FORBIDDEN)
+        with override_settings(PAYMENT_WEBHOOK_SECRET=''):
+            self.assertEqual(self.post(body, sign_callback(body, '')), status.HTTP_403_FORBIDDEN)
+        self.assertFalse(PaymentCallback.objects.exists())
+
+    def test_invalid_callback_is_rejected(self):
+        body = json.dumps([{'id': 'evt_1', 'payment_ref': 'REF1', 'amount': 'lots', 'status': 'succeeded'}]).encode('utf-8')
+        self.assertEqual(self.post(body, sign_callback(body)), status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(PaymentCallback.objects.exists())
+
+    def test_process_applies_payments(self):
+        paid = self.create_order('REF1', 100)
+        partial = self.create_order('REF2', 100)
+        unpriced = self.create_order('REF3', None)
+        self.provider.charge('REF1', 60)
+        self.provider.charge('REF1', 40)
+        self.provider.charge('REF2', 30)
+        self.provider.charge('REF3', 50)
+        self.provider.charge('REF4', 50)
+        self.provider.charge('REF2', 70, succeeded=False)
+        self.provider.deliver(self.post, batch_size=3)
+
+        outcomes = process_callbacks()
+        self.assertEqual(outcomes, {
+            PaymentCallback.APPLIED: 3,
+            PaymentCallback.UNINVOICED: 1,
+            PaymentCallback.UNMATCHED: 1,
+            PaymentCallback.FAILED: 1,
+        })
+
+        for order in (paid, partial, unpriced):
+            order.refresh_from_db()
+        self.assertTrue(paid.payment_complete_status)
+        self.assertFalse(partial.payment_complete_status)
+        self.assertFalse(unpriced.payment_complete_status)
+        self.assertEqual(paid.orderinvoice.payment_status, Invoice.PAID)
+        self.assertEqual(partial.orderinvoice.amount_due, 70)
+        self.assertEqual(UserLedger.objects.get(user=self.user).paid, 130)
+        self.assertEqual(
+            list(PaymentCallback.objects.filter(processed_ts__isnull=True).values_list('outcome', flat=True)),
+            [PaymentCallback.UNINVOICED]
+        )
+
+    def test_uninvoiced_order_is_invoiced_first(self):
+        order = create_order(self.user, create_quote(self.user, estimated_cost=100), payment_ref='REF1')
+        self.provider.charge('REF1', 30)
+        self.provider.deliver(self.post)
+        self.assertEqual(process_callbacks(), {PaymentCallback.APPLIED: 1})
+
+        order.refresh_from_db()
+        self.assertFalse(order.payment_complete_status)
+        self.assertEqual((order.orderinvoice.amount_paid, order.orderinvoice.amount_due), (30, 70))
+        self.assertEqual(UserLedger.objects.get(user=self.user).paid, 30)
+
+    def test_unpriced_order_waits_for_its_invoice(self):
+        quote = create_quote(self.user)
+        order = create_order(self.user, quote, payment_ref='REF1')
+        self.provider.charge('REF1', 100)
+        self.provider.deliver(self.post)
+        self.assertEqual(process_callbacks(), {PaymentCallback.UNINVOICED: 1})
+        self.assertEqual(process_callbacks(), {})
+        order.refresh_from_db()
+        self.assertFalse(order.payment_complete_status)
+        self.assertFalse(Payment.objects.exists())
+
+        quote.estimated_cost = 100
+        quote.save()
+        generate_invoice(order.pk)
+        self.assertEqual(process_callbacks(), {PaymentCallback.APPLIED: 1})
+        order.refresh_from_db()
+        self.assertTrue(order.payment_complete_status)
+        self.assertEqual(order.orderinvoice.payment_status, Invoice.PAID)
+
+    def test_redeliveries_are_applied_once(self):
+        order = self.create_order('REF1', 1000)
+        for _ in range(20):
+            self.provider.charge('REF1', 10)
+        self.provider.redeliver = 1.0
+        events = list(self.provider.events)
+        self.provider.deliver(self.post, batch_size=7)
+        self.assertEqual(PaymentCallback.objects.count(), 20)
+
+        # Redelivered after the first ones were processed and purged from the queue
+        process_callbacks(batch_size=5)
+        PaymentCallback.objects.filter(processed_ts__isnull=False).delete()
+        self.provider.events = events
+        self.provider.deliver(self.post, batch_size=7)
+        while process_callbacks(batch_size=5):
+            pass
+
+        order.orderinvoice.refresh_from_db()
+        self.assertEqual(Payment.objects.count(), 20)
+        self.assertEqual(order.orderinvoice.amount_paid, 200)
+        self.assertEqual(PaymentCallback.objects.filter(outcome=PaymentCallback.DUPLICATE).count(), 5)
+
+    def test_ambiguous_payment_ref(self):
+        self.create_order('REF1')
+        self.create_order('REF1')
+        self.provider.charge('REF1', 100)
+        self.provider.deliver(self.post)
+        self.assertEqual(process_callbacks(), {PaymentCallback.AMBIGUOUS: 1})
+        self.assertFalse(Payment.objects.exists())
@@ -0,0 +1,154 @@
+import math
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+
+from django.shortcuts import reverse
+from django.test import TestCase, Client
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..locations import assign_quote_routes, build_distance_matrix, distance_matrix, location_index
+from ..planning import RunLimits, RunProblem, plan_delivery_runs, plan_runs, solve, two_opt
+from .factories import create_order, create_quote
+from ..models import Location, Quote, Order, DeliveryRun, DeliveryStop
+User = get_user_model()
+
+
+def grid_problem(points, weights=None, deadlines=None):
+    '''
+    Depot at the origin, one stop per point, straight-line distances, one minute per km
+    '''
+    coordinates = np.array([(0, 0)] + points, dtype=np.float64)
+    distances = np.sqrt(((coordinates[:, None, :] - coordinates[None, :, :]) ** 2).sum(axis=2))
+    return RunProblem(
+        depot=0,
+        nodes=list(range(1, len(points) + 1)),
+        weights=weights or [1] * len(points),
+        deadlines=deadlines or [math.inf] * len(points),
+        distances=distances,
+        durations=distances
+    )
+
+
+class PlanRunsTestCase(TestCase):
+    limits = RunLimits(capacity_kg=100, max_stops=50, max_minutes=1000, stop_minutes=0)
+
+    def test_two_opt_uncrosses_a_run(self):
+        problem = grid_problem([(1, 0), (1, 1), (0, 1)])
+        run = two_opt([1, 0, 2], problem, self.limits)
+        self.assertAlmostEqual(run.distance_km, 4)
+        self.assertIn(run.stops, ([0, 1, 2], [2, 1, 0]))
+
+    def test_capacity_and_stop_limits_split_runs(self):
+        problem = grid_problem([(x, 0) for x in range(1, 11)], weights=[30] * 10)
+        runs, unplanned = plan_runs(problem, self.limits)
+        self.assertEqual(unplanned, [])
+        self.assertEqual(sorted(stop for run in runs for stop in run.stops), list(range(10)))
+        self.assertTrue(all(len(run.stops) <= 3 for run in runs))
+
+        runs, _ = plan_runs(problem, self.limits._replace(capacity_kg=1000, max_stops=4))
+        self.assertEqual([len(run.stops) for run in runs], [4, 4, 2])
+
+    def test_deadlines_and_duration_are_respected(self):
+        # The far stop is due early, so it is driven to first despite the detour
+        problem = grid_problem([(1, 0), (2, 0), (10, 0)], deadlines=[math.inf, math.inf, 10])
+        runs, unplanned = plan_runs(problem, self.limits)
+        self.assertEqual(unplanned, [])
+        for run in runs:
+            for stop, arrival in zip(run.stops, run.arrivals):
+                self.assertLessEqual(arrival, problem.deadlines[stop])
+
+        runs, unplanned = plan_runs(problem, self.limits._replace(max_minutes=15))
+        self.assertEqual(unplanned, [2])
+        self.assertTrue(all(run.duration_minutes <= 15 for run in runs))
+
+    def test_overweight_stop_is_unplanned(self):
+        runs, unplanned = plan_runs(grid_problem([(1, 0), (2, 0)], weights=[1, 500]), self.limits)
+        self.assertEqual(unplanned, [1])
+        self.assertEqual([run.stops for run in runs], [[0]])
+
+    def test_process_pool_matches_sequential(self):
+        rng = np.random.default_rng(0)
+        problems = [grid_problem(rng.uniform(-20, 20, (60, 2)).tolist()) for _ in range(3)]
+        limits = self.limits._replace(max_stops=15)
+        self.assertEqual(solve(problems, limits, processes=2), solve(problems, limits))
+
+
+class DeliveryRunTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+        self.depot = Location.objects.create(name='Nairobi', latitude=-1.2864, longitude=36.8172)
+        Location.objects.create(name='Thika', latitude=-1.0333, longitude=37.0693)
+        Location.objects.create(name='Nyeri', latitude=-0.4201, longitude=36.9476)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = mock.patch.object(distance_matrix, 'directory', directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for cache in (location_index, distance_matrix):
+            cache.clear()
+            self.addCleanup(cache.clear)
+        build_distance_matrix()
+
+        self.orders = []
+        for destination in ['Thika', 'Nyeri', 'Thika', 'Nyeri', 'Thika']:
+            quote = create_quote(self.staff, location_to=destination, item_weight=10)
+            self.orders.append(create_order(self.staff, quote, order_status=Order.REL))
+        # Not released yet, so not planned
+        create_order(self.staff, create_quote(self.staff, location_to='Thika'))
+        assign_quote_routes(Quote.objects.all())
+
+    def test_plan_delivery_runs(self):
+        departure = timezone.now()
+        with self.settings(RUN_MAX_STOPS=3):
+            runs, unplanned = plan_delivery_runs([self.depot.pk], departure=departure)
+        self.assertEqual(unplanned, 0)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(DeliveryStop.objects.count(), 5)
+        self.assertEqual(set(DeliveryStop.objects.values_list('order_id', flat=True)), {order.pk for order in self.orders})
+
+        for run in runs:
+            stops = list(run.stops.all())
+            self.assertEqual([stop.sequence for stop in stops], list(range(1, len(stops) + 1)))
+            self.assertEqual([stop.eta for stop in stops], sorted(stop.eta for stop in stops))
+            self.assertGreater(stops[0].eta, departure)
+            self.assertGreater(run.distance_km, 0)
+
+        # Planned orders are not planned again
+        self.assertEqual(plan_delivery_runs([self.depot.pk]), ([], 0))
+
+    def test_late_orders_are_unplanned(self):
+        Quote.objects.filter(order=self.orders[0]).update(estimated_delivery=timezone.now() - timedelta(hours=1))
+        runs, unplanned = plan_delivery_runs([self.depot.pk])
+        self.assertEqual(unplanned, 1)
+        self.assertFalse(DeliveryStop.objects.filter(order=self.orders[0]).exists())
+
+    def test_staff_plan_and_list_runs(self):
+        self.response = self.client.post(reverse('staff_runs_plan'), {}, content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum(len(run['stops']) for run in self.response.json()['data']), 5)
+
+        self.response = self.client.get(reverse('staff_runs') + f'?depot={self.depot.pk}&status={DeliveryRun.PLANNED}')
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        stops = self.response.json()['results'][0]['stops']
+        self.assertEqual([stop['sequence'] for stop in stops], list(range(1, len(stops) + 1)))
+
+    def test_staff_runs_reject_bad_input(self):
+        for query in ['?depot=abc', '?status=LOST']:
+            self.response = self.client.get(reverse('staff_runs') + query)
+            self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertFalse(self.response.json()['success'])
+
+        for body in [[self.depot.pk], {'depots': [True]}, {'depots': 'all'}]:
+            self.response = self.client.post(reverse('staff_runs_plan'), body, content_type='application/json')
+            self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DeliveryRun.objects.exists())
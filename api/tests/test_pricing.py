@@ -0,0 +1,98 @@
+import json
+from datetime import timedelta
+
+from django.shortcuts import reverse
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_quote
+from ..models import Quote, RouteRate, Order
+from ..pricing import pricing_table, reprice_quotes
+User = get_user_model()
+
+
+class PricingTestCase(TestCase):
+    def setUp(self):
+        pricing_table.clear()
+        self.user = User.objects.create_user(username='test', password='test2020')
+        RouteRate.objects.create(location_from='Nairobi', location_to='Mombasa', base_cost=500, cost_per_kg=100, delivery_hours=24)
+        RouteRate.objects.create(location_from='Nairobi', location_to='Kisumu', base_cost=400, delivery_hours=12)
+
+    def create_quote(self, location_from, location_to, item_weight=None):
+        return create_quote(self.user, location_from=location_from, location_to=location_to, item_weight=item_weight)
+
+    def test_single_price(self):
+        quote = self.create_quote('nairobi', ' Mombasa', 2.5)
+        cost, delivery = pricing_table.price(quote.location_from, quote.location_to, quote.item_weight, quote.created_ts)
+
+        self.assertEqual(cost, 800)
+        self.assertEqual(delivery, quote.created_ts + timedelta(hours=24))
+        self.assertEqual(pricing_table.price('Mombasa', 'Nairobi', 1, quote.created_ts), (None, None))
+
+    def test_batch_matches_single_price(self):
+        rows = [('Nairobi', 'Mombasa', 0.2), ('Nairobi', 'Kisumu', None), ('Kisumu', 'Nairobi', 3), ('NAIROBI', 'mombasa', None)]
+        costs, lead_times, priced = pricing_table.price_batch(*zip(*rows))
+
+        self.assertEqual(list(priced), [True, True, False, True])
+        self.assertEqual(list(costs[priced]), [600, 400, 500])
+        self.assertEqual(lead_times[0].item(), timedelta(hours=24))
+
+    def test_reprice_pending_quotes(self):
+        pending = [self.create_quote('Nairobi', 'Mombasa', weight) for weight in (1, 2, 3)]
+        unknown = self.create_quote('Kisumu', 'Nairobi')
+        ordered = self.create_quote('Nairobi', 'Kisumu')
+        Order.objects.create(quote=ordered)
+
+        self.assertEqual(reprice_quotes(chunk_size=2), (3, 1))
+        self.assertEqual(
+            list(Quote.objects.filter(pk__in=[quote.pk for quote in pending]).order_by('id').values_list('estimated_cost', flat=True)),
+            [600, 700, 800]
+        )
+        self.assertIsNone(Quote.objects.get(pk=unknown.pk).estimated_cost)
+        self.assertIsNone(Quote.objects.get(pk=ordered.pk).estimated_cost)
+
+    def test_rate_change_reloads_table(self):
+        self.assertEqual(pricing_table.price('Nairobi', 'Kisumu', None, self.user.date_joined)[0], 400)
+        RouteRate.objects.filter(location_to='Kisumu').get().delete()
+        self.assertEqual(pricing_table.price('Nairobi', 'Kisumu', None, self.user.date_joined), (None, None))
+
+    def test_new_quote_is_priced(self):
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.response = self.client.post(reverse('quotes'), data=json.dumps({
+            'item_name': 'Parcel',
+            'item_description': 'Testing',
+            'location_from': 'Nairobi',
+            'location_to': 'Mombasa',
+            'item_weight': 1
+        }), content_type='application/json')
+
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.response.json()['estimated_cost'], 600)
+        self.assertIsNotNone(self.response.json()['estimated_delivery'])
+
+    def test_bulk_quotes_are_priced(self):
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        quote = {'item_name': 'Parcel', 'item_description': 'Testing', 'location_from': 'Nairobi'}
+        self.response = self.client.post(reverse('quotes_bulk'), data=json.dumps([
+            {**quote, 'location_to': 'Mombasa', 'item_weight': 1},
+            {**quote, 'location_to': 'Kisumu'},
+            {**quote, 'location_to': 'Nakuru'},
+            {**quote, 'location_to': 'Mombasa', 'estimated_cost': 50}
+        ]), content_type='application/json')
+
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            list(Quote.objects.order_by('id').values_list('estimated_cost', flat=True)),
+            [600, 400, None, 50]
+        )
+        self.assertEqual(Quote.objects.filter(estimated_delivery__isnull=False).count(), 2)
+
+    def tearDown(self):
+        pricing_table.clear()
+        Order.objects.all().delete()
+        Quote.objects.all().delete()
+        RouteRate.objects.all().delete()
+        User.objects.all().delete()
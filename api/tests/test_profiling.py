@@ -0,0 +1,72 @@
+import json
+
+from django.conf import settings
+from django.shortcuts import reverse
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_quote
+from ..models import Quote
+from ..profiling import metrics
+User = get_user_model()
+
+
+@override_settings(
+    MIDDLEWARE=['api.profiling.ProfilingMiddleware'] + settings.MIDDLEWARE,
+    PROFILING_SLOW_REQUEST_MS=60000
+)
+class ProfilingMiddlewareTestCase(TestCase):
+    def setUp(self):
+        metrics.clear()
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        create_quote(self.staff)
+        access_token = RefreshToken.for_user(self.staff).access_token
+        self.client = self.client_class(HTTP_AUTHORIZATION=f'Bearer {access_token}')
+
+    def tearDown(self):
+        metrics.clear()
+        Quote.objects.all().delete()
+        self.staff.delete()
+
+    def test_server_timing_header(self):
+        self.response = self.client.get(reverse('staff_quotes'))
+
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        timing = self.response['Server-Timing']
+        self.assertIn('total;dur=', timing)
+        self.assertIn('queries"', timing)
+        self.assertRegex(timing, r'serialize;dur=\d')
+
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.settings(PROFILING_SLOW_REQUEST_MS=0), self.assertLogs('api.slow_requests') as logs:
+            self.client.get(reverse('staff_quotes'))
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['route'], 'api/staff/quotes')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['query_count'], len(record['queries']))
+        self.assertTrue(any('api_quote' in query['sql'] for query in record['queries']))
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('staff_quotes'))
+        self.client.get(reverse('staff_quotes'))
+        self.response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertTrue(self.response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = self.response.content.decode()
+        labels = 'method="GET",endpoint="api/staff/quotes",status="2xx"'
+        self.assertIn(f'api_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f'api_db_queries_total{{{labels}}}', body)
+
+    def test_metrics_are_staff_only(self):
+        client = User.objects.create_user(username='client', password='test2020')
+        access_token = RefreshToken.for_user(client).access_token
+        self.response = self.client_class(HTTP_AUTHORIZATION=f'Bearer {access_token}').get(reverse('metrics'))
+
+        self.assertEqual(self.response.status_code, status.HTTP_403_FORBIDDEN)
+        client.delete()
@@ -0,0 +1,72 @@
+from django.db import connection
+from django.shortcuts import reverse
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_order
+from ..models import Rider, Quote, Order, Invoice
+from ..serializers import OrderSerializer, InvoiceSerializer
+User = get_user_model()
+
+
+class EagerLoadingSerializerTestCase(TestCase):
+    def test_order_related_fields(self):
+        select_related, prefetch_related = OrderSerializer.get_related_fields()
+
+        self.assertCountEqual(select_related, ['rider', 'quote'])
+        self.assertEqual(prefetch_related, [])
+
+    def test_invoice_related_fields(self):
+        select_related, prefetch_related = InvoiceSerializer.get_related_fields()
+
+        self.assertCountEqual(select_related, ['order', 'order__rider', 'order__quote', 'quote'])
+        self.assertEqual(prefetch_related, [])
+
+
+class StaffListQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+
+    def create_invoices(self, count):
+        for _ in range(count):
+            index = Rider.objects.count()
+            rider = Rider.objects.create(rider_name=f'Rider {index}', rider_motor=f'KAA {index}')
+            order = create_order(self.staff, rider=rider)
+            Invoice.objects.create(order=order, quote=order.quote, total_amount=100, amount_paid=0, amount_due=100)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.response = self.client.get(url)
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_staff_orders_query_count_is_constant(self):
+        self.create_invoices(2)
+        few = self.count_queries(reverse('staff_orders'))
+        self.create_invoices(20)
+        many = self.count_queries(reverse('staff_orders'))
+
+        self.assertEqual(len(self.response.json()['results']), 22)
+        self.assertEqual(few, many)
+
+    def test_staff_invoices_query_count_is_constant(self):
+        self.create_invoices(2)
+        few = self.count_queries(reverse('staff_invoice'))
+        self.create_invoices(20)
+        many = self.count_queries(reverse('staff_invoice'))
+
+        self.assertEqual(len(self.response.json()['results']), 22)
+        self.assertEqual(few, many)
+        self.assertEqual(self.response.json()['results'][-1]['order']['rider']['rider_name'], 'Rider 0')
+
+    def tearDown(self):
+        Invoice.objects.all().delete()
+        Order.objects.all().delete()
+        Quote.objects.all().delete()
+        Rider.objects.all().delete()
+        User.objects.all().delete()
@@ -0,0 +1,46 @@
+from django.shortcuts import reverse
+from django.test import TestCase, Client
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_quote
+from ..models import Rider, Order
+User = get_user_model()
+
+
+class QuoteOrderViewTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='client', password='test2020')
+        self.other = User.objects.create_user(username='other', password='test2020')
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.quote = create_quote(self.user)
+        self.url = reverse('quote_order', kwargs={'quote_id': self.quote.pk})
+
+    def test_order_own_quote_once(self):
+        rider = Rider.objects.create(rider_name='Rider', rider_motor='KAA 001')
+        self.response = self.client.post(self.url, {'payment_ref': 'REF-1', 'rider': rider.pk}, content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(quote=self.quote)
+        self.assertEqual((order.payment_ref, order.rider_id), ('REF-1', rider.pk))
+
+        self.response = self.client.post(self.url, {'payment_ref': 'REF-2'}, content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(self.response.json()['success'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_cannot_order_another_clients_quote(self):
+        quote = create_quote(self.other)
+        self.response = self.client.post(reverse('quote_order', kwargs={'quote_id': quote.pk}), {})
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_rider(self):
+        self.response = self.client.post(self.url, {'rider': 0}, content_type='application/json')
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+    def test_only_post_is_allowed(self):
+        self.response = self.client.get(self.url)
+        self.assertEqual(self.response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
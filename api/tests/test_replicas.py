@@ -0,0 +1,70 @@
+from django.core.cache import cache
+from django.db import connections
+from django.shortcuts import reverse
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .factories import create_quote
+from ..models import Quote
+from ..replicas import is_pinned
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.quote = create_quote(self.staff)
+        access_token = RefreshToken.for_user(self.staff).access_token
+        self.client = self.client_class(HTTP_AUTHORIZATION=f'Bearer {access_token}')
+
+    def tearDown(self):
+        cache.clear()
+        Quote.objects.all().delete()
+        self.staff.delete()
+
+    def quote_reads(self, url):
+        '''
+        The aliases that read the quote table while serving url
+        '''
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            self.response = self.client.get(url)
+            if self.response.streaming:
+                self.content = b''.join(self.response.streaming_content)
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        return {
+            alias for alias, context in (('default', primary), ('replica', replica))
+            if any('"api_quote"' in query['sql'] for query in context.captured_queries)
+        }
+
+    def test_staff_lists_read_from_replica(self):
+        self.assertEqual(self.quote_reads(reverse('staff_quotes')), {'replica'})
+        self.assertEqual(self.response.json()['results'][0]['item_name'], 'Parcel')
+
+    def test_exports_read_from_replica(self):
+        self.assertEqual(self.quote_reads(reverse('staff_quotes_export') + '?format=ndjson'), {'replica'})
+        self.assertIn(b'Parcel', self.content)
+
+    def test_client_views_read_from_primary(self):
+        self.assertEqual(self.quote_reads(reverse('quotes')), {'default'})
+
+    def test_reads_stick_to_primary_after_own_write(self):
+        self.response = self.client.post(reverse('quotes'), {
+            'item_name': 'Box',
+            'item_description': 'Testing',
+            'location_from': 'Nairobi',
+            'location_to': 'Mombasa'
+        })
+        self.assertEqual(self.response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(is_pinned(self.staff))
+
+        self.assertEqual(self.quote_reads(reverse('staff_quotes')), {'default'})
+        self.assertEqual(len(self.response.json()['results']), 2)
@@ -0,0 +1,53 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+
+from ..locations import location_index
+from ..models import Rider, Quote, RouteRate, Order, OrderStatusEvent, Invoice
+User = get_user_model()
+
+
+class SeedSyntheticTestCase(TestCase):
+    options = {'users': 5, 'staff': 1, 'riders': 4, 'quotes': 20, 'orders': 10, 'invoices': 5, 'seed': 7}
+
+    def setUp(self):
+        # Loaded with the seeded locations, which roll back with the test
+        self.addCleanup(location_index.clear)
+
+    def seed(self, **options):
+        call_command('seed_synthetic', stdout=StringIO(), **{**self.options, **options})
+
+    def test_seeds_requested_counts(self):
+        self.seed()
+
+        self.assertEqual(User.objects.filter(is_staff=False).count(), 5)
+        self.assertEqual(User.objects.filter(is_staff=True).count(), 1)
+        self.assertEqual(Rider.objects.count(), 4)
+        self.assertEqual(Quote.objects.count(), 20)
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertEqual(Invoice.objects.count(), 5)
+        self.assertTrue(RouteRate.objects.exists())
+        # Quotes are priced from the seeded route rates and grouped by route
+        self.assertFalse(Quote.objects.filter(estimated_cost__isnull=True).exists())
+        self.assertFalse(Quote.objects.filter(route__isnull=True).exists())
+        # Every order has its history, ending at its current status
+        for order in Order.objects.all():
+            self.assertEqual(order.status_events.latest('created_ts').to_status, order.order_status)
+        self.assertEqual(OrderStatusEvent.objects.filter(to_status=Order.PLA).count(), 10)
+
+    def test_same_seed_gives_same_data(self):
+        self.seed()
+        first = list(Quote.objects.order_by('id').values_list('item_name', 'location_from', 'location_to', 'item_weight'))
+        self.seed(clear=True)
+        second = list(Quote.objects.order_by('id').values_list('item_name', 'location_from', 'location_to', 'item_weight'))
+
+        self.assertEqual(first, second)
+
+    def test_refuses_to_seed_twice_without_clear(self):
+        self.seed()
+
+        with self.assertRaises(CommandError):
+            self.seed()
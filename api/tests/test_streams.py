@@ -0,0 +1,174 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+
+from django.test import TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from project.asgi import application
+from .factories import create_order
+from ..models import Order, OrderStatusEvent
+from ..streams import stream_hub
+User = get_user_model()
+
+
+def parse_events(body):
+    '''
+    (id, event, data) of every event in a Server-Sent Events body, comments left out
+    '''
+    events = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if line and not line.startswith(':'))
+        if 'data' in fields:
+            events.append((fields.get('id'), fields.get('event'), json.loads(fields['data'])))
+    return events
+
+
+class StreamClient:
+    '''
+    Drives the ASGI application the way a server would for one request.
+    With a gate, sends of events wait until it is opened, like a client
+    that stopped reading.
+    '''
+    def __init__(self, path, query='', headers=(), gate=None):
+        self.scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query.encode('utf-8'),
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        }
+        self.gate = gate
+        self.requests = asyncio.Queue()
+        self.messages = asyncio.Queue()
+        self.body = ''
+
+    async def send(self, message):
+        if self.gate is not None and b'event: status' in message.get('body', b''):
+            await self.gate.wait()
+        await self.messages.put(message)
+
+    async def __aenter__(self):
+        await self.requests.put({'type': 'http.request', 'body': b'', 'more_body': False})
+        self.task = asyncio.ensure_future(application(self.scope, self.requests.get, self.send))
+        self.start = await asyncio.wait_for(self.messages.get(), 5)
+        return self
+
+    async def read_until(self, text):
+        '''
+        The body received so far, once it contains text or the response ends
+        '''
+        while text not in self.body:
+            message = await asyncio.wait_for(self.messages.get(), 5)
+            self.body += message.get('body', b'').decode('utf-8')
+            if not message.get('more_body', False):
+                break
+        return self.body
+
+    async def __aexit__(self, *args):
+        await self.requests.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(self.task, 5)
+
+
+class OrderStreamTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='client', password='test2020')
+        self.other = User.objects.create_user(username='other', password='test2020')
+        self.staff = User.objects.create_user(username='staff', password='test2020', is_staff=True)
+        self.order = create_order(self.user)
+        self.other_order = create_order(self.other)
+        patcher = mock.patch.object(stream_hub, 'poll_seconds', 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The hub outlives the test, and its event loop with it
+        self.addCleanup(stream_hub.reset, None)
+
+    def auth(self, user):
+        return [('authorization', f'Bearer {RefreshToken.for_user(user).access_token}')]
+
+    async def test_requires_a_valid_token(self):
+        async with StreamClient('/api/orders/stream') as stream:
+            self.assertEqual(stream.start['status'], 401)
+        async with StreamClient('/api/orders/stream', headers=[('authorization', 'Bearer invalid')]) as stream:
+            self.assertEqual(stream.start['status'], 401)
+        async with StreamClient('/api/staff/orders/stream', headers=self.auth(self.user)) as stream:
+            self.assertEqual(stream.start['status'], 403)
+
+    async def test_streams_own_orders_and_staff_all(self):
+        token = RefreshToken.for_user(self.user).access_token
+        async with StreamClient('/api/orders/stream', query=f'token={token}') as own, \
+                StreamClient('/api/staff/orders/stream', headers=self.auth(self.staff)) as staff:
+            self.assertEqual(own.start['status'], 200)
+            self.assertIn((b'content-type', b'text/event-stream'), own.start['headers'])
+            await own.read_until('retry:')
+            await staff.read_until('retry:')
+
+            await sync_to_async(self.other_order.transition_to)(Order.WAR)
+            await sync_to_async(self.order.transition_to)(Order.WAR)
+
+            events = parse_events(await own.read_until('"to_status": "WAREHOUSE"'))
+            self.assertEqual([(data['order'], data['to_status']) for _, _, data in events], [(self.order.pk, Order.WAR)])
+            self.assertEqual(events[0][1], 'status')
+            self.assertEqual(events[0][2]['tracking_number'], str(self.order.tracking_number))
+
+            body = await staff.read_until(f'"order": {self.order.pk}')
+            self.assertEqual([data['order'] for _, _, data in parse_events(body)], [self.other_order.pk, self.order.pk])
+
+    async def test_events_from_other_processes_are_polled(self):
+        async with StreamClient('/api/orders/stream', headers=self.auth(self.user)) as stream:
+            await stream.read_until('retry:')
+            # Written without this process's signals, as another worker would appear
+            await sync_to_async(OrderStatusEvent.objects.bulk_create)([
+                OrderStatusEvent(order=self.order, from_status=Order.PLA, to_status=Order.WAR)
+            ])
+            events = parse_events(await stream.read_until('event: status'))
+            self.assertEqual(events[0][2]['to_status'], Order.WAR)
+
+    async def test_resume_from_last_event_id(self):
+        last_event_id = await sync_to_async(OrderStatusEvent.objects.filter(order=self.order).values_list('id', flat=True).get)()
+        await sync_to_async(self.order.transition_to)(Order.WAR)
+        await sync_to_async(self.order.transition_to)(Order.REL)
+        await sync_to_async(self.other_order.transition_to)(Order.WAR)
+
+        headers = self.auth(self.user) + [('last-event-id', str(last_event_id))]
+        async with StreamClient('/api/orders/stream', headers=headers) as stream:
+            events = parse_events(await stream.read_until(Order.REL))
+            self.assertEqual([data['to_status'] for _, _, data in events], [Order.WAR, Order.REL])
+            self.assertTrue(all(int(event_id) > last_event_id for event_id, _, _ in events))
+
+        # Too far behind to replay, the client should reload instead
+        with override_settings(SSE_REPLAY_LIMIT=1):
+            async with StreamClient('/api/orders/stream', query=f'last_event_id={last_event_id}', headers=self.auth(self.user)) as stream:
+                body = await stream.read_until('event: reset')
+                self.assertEqual(parse_events(body)[0][1], 'reset')
+
+    @override_settings(SSE_HEARTBEAT_SECONDS=0.05)
+    async def test_idle_stream_gets_heartbeats(self):
+        async with StreamClient('/api/orders/stream', headers=self.auth(self.user)) as stream:
+            body = await stream.read_until(': heartbeat')
+            self.assertEqual(parse_events(body), [])
+
+    async def test_slow_stream_is_closed(self):
+        gate = asyncio.Event()
+        with mock.patch.object(stream_hub, 'queue_size', 1):
+            async with StreamClient('/api/staff/orders/stream', headers=self.auth(self.staff), gate=gate) as stream:
+                await stream.read_until('retry:')
+                # The first event is stuck in the send, the second fills the queue, the third overflows it
+                for order in (self.order, self.other_order):
+                    await sync_to_async(order.transition_to)(Order.WAR)
+                    await asyncio.sleep(0.2)
+                await sync_to_async(self.order.transition_to)(Order.REL)
+                await asyncio.sleep(0.2)
+                subscription, = stream_hub.subscribers[None]
+                self.assertTrue(subscription.overflowed)
+
+                # Once the client reads again it gets what was in flight and the stream ends
+                gate.set()
+                body = await stream.read_until('never sent')
+                self.assertEqual([data['order'] for _, _, data in parse_events(body)], [self.order.pk])
+                await asyncio.wait_for(stream.task, 5)
+                self.assertNotIn(None, stream_hub.subscribers)
@@ -0,0 +1,62 @@
+import uuid
+
+from django.shortcuts import reverse
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+
+from rest_framework import status
+
+from ..cache import tracking_cache
+from .factories import create_order, create_quote
+from ..models import Quote, Order
+User = get_user_model()
+
+
+class TrackOrderViewTestCase(TransactionTestCase):
+    # Invalidation runs on commit, which a TestCase never reaches
+    def setUp(self):
+        tracking_cache.clear()
+        self.user = User.objects.create_user(username='test', password='test2020')
+        self.quote = create_quote(self.user)
+        self.order = create_order(self.user, self.quote)
+        self.url = reverse('track', kwargs={'tracking_number': self.order.tracking_number})
+
+    def test_track_without_authentication(self):
+        self.response = self.client.get(self.url)
+
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.response.json()['order_status'], Order.PLA)
+        self.assertEqual(self.response.json()['location_to'], 'Mombasa')
+
+    def test_repeat_lookup_is_cached(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            self.response = self.client.get(self.url)
+        self.assertEqual(self.response.status_code, status.HTTP_200_OK)
+
+    def test_status_change_invalidates(self):
+        self.client.get(self.url)
+        self.order.order_status = Order.TRA
+        self.order.save()
+
+        self.response = self.client.get(self.url)
+        self.assertEqual(self.response.json()['order_status'], Order.TRA)
+
+    def test_quote_change_invalidates(self):
+        self.client.get(self.url)
+        self.quote.location_to = 'Malindi'
+        self.quote.save()
+
+        self.response = self.client.get(self.url)
+        self.assertEqual(self.response.json()['location_to'], 'Malindi')
+
+    def test_unknown_tracking_number(self):
+        self.response = self.client.get(reverse('track', kwargs={'tracking_number': uuid.uuid4()}))
+        self.assertEqual(self.response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def tearDown(self):
+        tracking_cache.clear()
+        Order.objects.all().delete()
+        Quote.objects.all().delete()
+        User.objects.all().delete()
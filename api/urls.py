@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 
 from rest_framework_simplejwt.views import TokenRefreshView
@@ -5,28 +6,83 @@ from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     UserRegisterView,
     LoginTokenObtainPairView,
+    RiderListView,
+    RiderDetailsView,
+    RiderBulkView,
+    RouteLookupView,
+    QuoteBulkView,
+    StaffOrderBulkView,
+    StaffOrderAssignView,
+    StaffRunListView,
+    StaffRunPlanView,
     StaffQuoteListView,
     StaffOrderListView,
     StaffInvoiceListView,
+    StaffQuoteExportView,
+    StaffOrderExportView,
+    StaffInvoiceExportView,
     QuoteListView,
     QuoteDetailsView,
     OrderListView,
+    QuoteOrderView,
     OrderDetailsView,
+    OrderTimelineView,
+    OrderStreamView,
+    TrackOrderView,
     InvoiceListView,
-    InvoiceDetailsView
+    InvoiceDetailsView,
+    InvoicePaymentsView,
+    PaymentCallbackView,
+    StaffLedgerSummaryView,
+    StaffLedgerDailyView,
+    StaffLedgerUsersView,
+    MetricsView,
+    executor_view
 )
 
+
+def pooled_view(view_class):
+    '''
+    List and detail views are served from the thread pool when ASYNC_API_VIEWS is on
+    '''
+    view = view_class.as_view()
+    return executor_view(view) if settings.ASYNC_API_VIEWS else view
+
+
 urlpatterns = [
     path('register', UserRegisterView.as_view(), name='register'),
     path('login', LoginTokenObtainPairView.as_view(), name='login'),
     path('token/refresh', TokenRefreshView.as_view(), name='refresh_token'),
-    path('staff/quotes', StaffQuoteListView.as_view(), name='staff_quotes'),
-    path('staff/orders', StaffOrderListView.as_view(), name='staff_orders'),
-    path('staff/invoices', StaffInvoiceListView.as_view(), name='staff_invoice'),
-    path('quotes', QuoteListView.as_view(), name='quotes'),
-    path('quote/<int:id>', QuoteDetailsView.as_view(), name='quote'),
-    path('orders', OrderListView.as_view(), name='orders'),
-    path('order/<int:id>', OrderDetailsView.as_view(), name='order'),
-    path('invoices', InvoiceListView.as_view(), name='invoices'),
-    path('invoice/<int:id>', InvoiceDetailsView.as_view(), name='invoice'),
+    path('riders', RiderListView.as_view(), name='riders'),
+    path('rider/<int:id>', RiderDetailsView.as_view(), name='rider'),
+    path('riders/bulk', RiderBulkView.as_view(), name='riders_bulk'),
+    path('routes/lookup', pooled_view(RouteLookupView), name='route_lookup'),
+    path('staff/quotes', pooled_view(StaffQuoteListView), name='staff_quotes'),
+    path('staff/orders', pooled_view(StaffOrderListView), name='staff_orders'),
+    path('staff/invoices', pooled_view(StaffInvoiceListView), name='staff_invoice'),
+    path('staff/quotes/export', StaffQuoteExportView.as_view(), name='staff_quotes_export'),
+    path('staff/orders/export', StaffOrderExportView.as_view(), name='staff_orders_export'),
+    path('staff/orders/assign', StaffOrderAssignView.as_view(), name='staff_orders_assign'),
+    path('staff/orders/bulk', StaffOrderBulkView.as_view(), name='staff_orders_bulk'),
+    path('staff/orders/stream', OrderStreamView.as_view(), name='staff_order_stream'),
+    path('staff/runs', pooled_view(StaffRunListView), name='staff_runs'),
+    path('staff/runs/plan', StaffRunPlanView.as_view(), name='staff_runs_plan'),
+    path('staff/invoices/export', StaffInvoiceExportView.as_view(), name='staff_invoices_export'),
+    path('staff/ledger/summary', pooled_view(StaffLedgerSummaryView), name='staff_ledger_summary'),
+    path('staff/ledger/daily', pooled_view(StaffLedgerDailyView), name='staff_ledger_daily'),
+    path('staff/ledger/users', pooled_view(StaffLedgerUsersView), name='staff_ledger_users'),
+    path('quotes', pooled_view(QuoteListView), name='quotes'),
+    path('quotes/bulk', QuoteBulkView.as_view(), name='quotes_bulk'),
+    path('quote/<int:id>', pooled_view(QuoteDetailsView), name='quote'),
+    path('quote/<int:quote_id>/order', QuoteOrderView.as_view(), name='quote_order'),
+    path('orders', pooled_view(OrderListView), name='orders'),
+    path('orders/stream', OrderStreamView.as_view(), name='order_stream'),
+    path('order/<int:id>', pooled_view(OrderDetailsView), name='order'),
+    path('order/<int:id>/timeline', pooled_view(OrderTimelineView), name='order_timeline'),
+    path('track/<uuid:tracking_number>', pooled_view(TrackOrderView), name='track'),
+    path('invoices', pooled_view(InvoiceListView), name='invoices'),
+    path('invoice/<int:id>', pooled_view(InvoiceDetailsView), name='invoice'),
+    path('invoice/<int:id>/payments', InvoicePaymentsView.as_view(), name='invoice_payments'),
+    path('payments/callback', PaymentCallbackView.as_view(), name='payment_callback'),
+    path('_metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,4 +1,15 @@
+from collections import Counter
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, router, transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 
@@ -6,7 +17,7 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 from .serializers import (
@@ -15,10 +26,32 @@ from .serializers import (
     RiderSerializer,
     QuoteSerializer,
     OrderSerializer,
-    InvoiceSerializer
+    OrderBulkUpdateSerializer,
+    OrderStatusEventSerializer,
+    DeliveryRunSerializer,
+    InvoiceSerializer,
+    PaymentSerializer,
+    UserLedgerSerializer,
+    DailyLedgerSerializer,
+    StatusLedgerSerializer,
+    PaymentCallbackSerializer
 )
+from .assignment import assign_riders
+from .cache import CachedDetailMixin, get_tracking
+from .jobs import enqueue
+from .ledger import PaymentReferenceTaken, record_payment
+from .locations import distance_matrix, location_index
+from .pagination import KeysetPagination
+from .payments import enqueue_callbacks, verify_callback
+from .planning import plan_delivery_runs, planning_depots
+from .replicas import ReplicaReadMixin
+from .profiling import metrics
+from .renderers import CSVRenderer, NDJSONRenderer, PrometheusRenderer, get_serializer_header
 from .permissions import IsAuthenticatedClient, IsAuthenticatedStaff, IsAuthenticatedClientOrStaff
-from .models import Rider, Quote, Order, Invoice
+from .models import (
+    Rider, Quote, Order, OrderStatusEvent, DeliveryRun, Invoice, Payment,
+    UserLedger, DailyLedger, StatusLedger, InvalidStatusTransition
+)
 User = get_user_model()
 
 class UserRegisterView(APIView):
@@ -32,11 +65,10 @@ class UserRegisterView(APIView):
                 first_name = serializer.data['first_name'],
                 last_name = serializer.data['last_name'],
                 email = serializer.data['email'],
-                password = make_password(serializer.data['password']),
-                bio = serializer.data['bio'],
-                location = serializer.data['location']
+                password = make_password(serializer.data['password'])
             )
             user.save()
+            enqueue('send_welcome_email', {'user_id': user.pk})
             return Response({
                 'success': True,
                 'message': 'User successfully created',
@@ -45,9 +77,7 @@ class UserRegisterView(APIView):
                     'first_name': serializer.data['first_name'],
                     'last_name': serializer.data['last_name'],
                     'email': serializer.data['email'],
-                    'date_joined': user.date_joined,
-                    'bio': serializer.data['bio'],
-                    'location': serializer.data['location']
+                    'date_joined': user.date_joined
                 }
             },status=status.HTTP_201_CREATED)
         return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
@@ -68,9 +98,11 @@ class RiderListView(APIView):
     permission_classes = [IsAuthenticatedStaff]
 
     def get(self, request, format=None):
-        riders = Rider.objects.all()
-        serializer = RiderSerializer(riders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        riders = RiderSerializer.setup_eager_loading(Rider.objects.all())
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(riders, request, view=self)
+        serializer = RiderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     def post(self, request, format=None):
         serializer = RiderSerializer(data=request.data)
@@ -139,17 +171,51 @@ class RiderDetailsView(APIView):
 
 
 
+# Route Views
+class RouteLookupView(APIView):
+    '''
+    Resolve ?from= and ?to= free-text locations to canonical locations and
+    their precomputed distance and travel time, without touching the database
+    '''
+    permission_classes = [IsAuthenticatedClientOrStaff]
+
+    def get(self, request, format=None):
+        location_from = request.query_params.get('from', '')
+        location_to = request.query_params.get('to', '')
+        origin_id, destination_id = location_index.resolve(location_from), location_index.resolve(location_to)
+        if origin_id is None or destination_id is None:
+            return Response({
+                'success': False,
+                'message': 'Unknown location',
+                'data': {'from': origin_id is not None, 'to': destination_id is not None}
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        distance_km, duration_minutes = distance_matrix.lookup(origin_id, destination_id)
+        return Response({
+            'origin': {'id': origin_id, 'name': location_index.name(origin_id)},
+            'destination': {'id': destination_id, 'name': location_index.name(destination_id)},
+            'distance_km': distance_km,
+            'duration_minutes': duration_minutes
+        }, status=status.HTTP_200_OK)
+
+
+
+
+
+
 # Quotes Views
-class StaffQuoteListView(APIView):
+class StaffQuoteListView(ReplicaReadMixin, APIView):
     '''
     Allow Staff to view all quotes
     '''
     permission_classes = [IsAuthenticatedStaff]
 
     def get(self, request, format=None):
-        quotes = Quote.objects.all()
-        serializer = QuoteSerializer(quotes, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        quotes = QuoteSerializer.setup_eager_loading(Quote.objects.all())
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(quotes, request, view=self)
+        serializer = QuoteSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class QuoteListView(APIView):
     '''
@@ -158,9 +224,11 @@ class QuoteListView(APIView):
     permission_classes = [IsAuthenticatedClient]
 
     def get(self, request, format=None):
-        quotes = Quote.objects.filter(user=request.user)
-        serializer = QuoteSerializer(quotes, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        quotes = QuoteSerializer.setup_eager_loading(Quote.objects.filter(user=request.user))
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(quotes, request, view=self)
+        serializer = QuoteSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     def post(self, request, format=None):
         serializer = QuoteSerializer(data=request.data)
@@ -171,8 +239,10 @@ class QuoteListView(APIView):
         return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
         
 
-class QuoteDetailsView(APIView):
+class QuoteDetailsView(CachedDetailMixin, APIView):
     permission_classes = [IsAuthenticatedClientOrStaff]
+    model = Quote
+    serializer_class = QuoteSerializer
 
     def get_quote(self, id):
         try:
@@ -188,13 +258,7 @@ class QuoteDetailsView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
     
     def get(self, request, id, format=None):
-        try:
-            quote = self.get_quote(id)
-        except Http404:
-            return self.error_response()
-
-        serializer = QuoteSerializer(quote)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.get_cached_response(request, id)
 
     def put(self, request, id, format=None):
         try:
@@ -231,45 +295,82 @@ class QuoteDetailsView(APIView):
 
 
 # Order Views
-class StaffOrderListView(APIView):
+class StaffOrderListView(ReplicaReadMixin, APIView):
     '''
     Allow Staff to view all quotes
     '''
     permission_classes = [IsAuthenticatedStaff]
 
     def get(self, request, format=None):
-        orders = Order.objects.all()
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        orders = OrderSerializer.setup_eager_loading(Order.objects.all())
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class OrderListView(APIView):
     permission_classes = [IsAuthenticatedClient]
 
     def get(self, request, format=None):
-        orders = Order.objects.filter(user=request.user)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        orders = OrderSerializer.setup_eager_loading(Order.objects.filter(quote__user=request.user))
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class QuoteOrderView(APIView):
+    '''
+    Allow Clients to order one of their quotes, optionally with the rider
+    given as "rider". A quote is ordered at most once.
+    '''
+    permission_classes = [IsAuthenticatedClient]
+    http_method_names = ['post', 'options']
 
-    def post(self, request, quote_id, rider_id, format=None):
+    def error_response(self, message):
+        return Response({
+                'success': False,
+                'message': message,
+                'data': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    def post(self, request, quote_id, format=None):
         try:
-            quote = Quote.objects.get(pk=quote_id)
+            quote = Quote.objects.get(pk=quote_id, user=request.user)
         except Quote.DoesNotExist:
-            raise(Http404)
-        
-        rider = Rider.objects.get(pk=rider_id) or None
+            return self.error_response('The Quote does not exist')
 
-        serializer = OrderSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(rider=rider, quote=quote)
-            return Response(serializer.data,status=status.HTTP_201_CREATED)
-        return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
+        data = request.data.copy() if isinstance(request.data, dict) else {}
+        rider_id = data.get('rider')
+        data.pop('rider', None)
+        try:
+            rider = Rider.objects.get(pk=rider_id) if rider_id is not None else None
+        except (Rider.DoesNotExist, ValueError, TypeError):
+            return self.error_response('The Rider does not exist')
 
-class OrderDetailsView(APIView):
+        serializer = OrderSerializer(data=data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                if Order.objects.filter(quote=quote).exists():
+                    return self.error_response('The Quote has already been ordered')
+                serializer.save(rider=rider, quote=quote)
+        except IntegrityError:
+            # Ordered concurrently, or the rider is already on an undelivered order
+            return self.error_response('The Quote has already been ordered, or the Rider is on another order')
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class OrderDetailsView(CachedDetailMixin, APIView):
     permission_classes = [IsAuthenticatedClientOrStaff]
+    model = Order
+    serializer_class = OrderSerializer
 
-    def get_order(self, id):
+    def get_order(self, id, lock=False):
+        orders = OrderSerializer.setup_eager_loading(Order.objects.all())
+        if lock:
+            orders = orders.select_for_update(of=('self',))
         try:
-            return Order.objects.get(pk=id)
+            return orders.get(pk=id)
         except Order.DoesNotExist:
             raise(Http404)
     
@@ -281,49 +382,195 @@ class OrderDetailsView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
     
     def get(self, request, id, format=None):
-        try:
-            order = self.get_order(id)
-        except Http404:
-            return self.error_response()
-
-        serializer = OrderSerializer(order)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.get_cached_response(request, id)
 
     def put(self, request, id, format=None):
         try:
-            order = self.get_order(id)
-        except Http404:
-            return self.error_response()
+            with transaction.atomic():
+                # Locked so the status compared below is the one the save keeps
+                try:
+                    order = self.get_order(id, lock=True)
+                except Http404:
+                    return self.error_response()
+
+                serializer = OrderSerializer(order, request.data)
+                if not serializer.is_valid():
+                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                order_status = serializer.validated_data.pop('order_status', order.order_status)
+                serializer.save()
+                if order_status != order.order_status:
+                    order.transition_to(order_status, user=request.user)
+        except InvalidStatusTransition as error:
+            return Response({
+                'success': False,
+                'message': str(error),
+                'data': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
-        serializer = OrderSerializer(order, request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+class OrderTimelineView(APIView):
+    '''
+    Status history of an order, oldest first
+    '''
+    permission_classes = [IsAuthenticatedClientOrStaff]
+
+    def get(self, request, id, format=None):
+        order = Order.objects.filter(pk=id).values('order_status', 'status_changed_ts').first()
+        if order is None:
+            return Response({
+                'success': False,
+                'message': 'The Order does not exist',
+                'data': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        events = OrderStatusEvent.objects.filter(order_id=id).order_by('created_ts', 'id')
+        serializer = OrderStatusEventSerializer(events, many=True)
+        return Response({
+            'order_status': order['order_status'],
+            'status_changed_ts': order['status_changed_ts'],
+            'events': serializer.data
+        }, status=status.HTTP_200_OK)
+
+class StaffOrderAssignView(APIView):
+    '''
+    Allow Staff to run one rider assignment pass over released orders
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+
+    def post(self, request, format=None):
+        assignments = assign_riders()
+        return Response({
+            'success': True,
+            'message': f'Assigned {len(assignments)} orders',
+            'data': [{'order': order.pk, 'rider': rider.pk} for order, rider in assignments]
+        }, status=status.HTTP_200_OK)
+
+class TrackOrderView(APIView):
+    '''
+    Public order status lookup by tracking number
+    '''
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request, tracking_number, format=None):
+        tracking = get_tracking(tracking_number)
+        if tracking is None:
+            return Response({
+                'success': False,
+                'message': 'The Order does not exist',
+                'data': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response(tracking, status=status.HTTP_200_OK)
+
+class OrderStreamView(APIView):
+    '''
+    Order status streams are served by api.streams on the ASGI deployment,
+    ahead of Django; this route only answers when running under WSGI
+    '''
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, format=None):
+        return Response({
+            'success': False,
+            'message': 'Order streams are only served by the ASGI application',
+            'data': []
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+
+
+
+# Delivery Run Views
+class StaffRunListView(ReplicaReadMixin, APIView):
+    '''
+    Allow Staff to view delivery runs with their stops in order, filtered
+    by ?depot= and ?status=
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+
+    def get(self, request, format=None):
+        runs = DeliveryRunSerializer.setup_eager_loading(DeliveryRun.objects.all())
+        if 'depot' in request.query_params:
+            try:
+                runs = runs.filter(depot_id=int(request.query_params['depot']))
+            except ValueError:
+                return Response({
+                    'success': False,
+                    'message': 'depot must be a location id',
+                    'data': []
+                }, status=status.HTTP_400_BAD_REQUEST)
+        if 'status' in request.query_params:
+            run_status = request.query_params['status']
+            if run_status not in dict(DeliveryRun.RUN_STATUS_CHOICES):
+                return Response({
+                    'success': False,
+                    'message': f'status must be one of {", ".join(dict(DeliveryRun.RUN_STATUS_CHOICES))}',
+                    'data': []
+                }, status=status.HTTP_400_BAD_REQUEST)
+            runs = runs.filter(run_status=run_status)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(runs, request, view=self)
+        serializer = DeliveryRunSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class StaffRunPlanView(APIView):
+    '''
+    Allow Staff to plan delivery runs for the RELEASED orders of the
+    depots listed in "depots", or of every depot with waiting orders
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+
+    def post(self, request, format=None):
+        # A body that is not an object, e.g. a JSON array, is rejected below
+        depot_ids = (request.data.get('depots') or planning_depots()) if isinstance(request.data, dict) else None
+        if not isinstance(depot_ids, list) or not all(
+            isinstance(depot_id, int) and not isinstance(depot_id, bool) for depot_id in depot_ids
+        ):
+            return Response({
+                'success': False,
+                'message': 'depots must be a list of location ids',
+                'data': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        runs, unplanned = plan_delivery_runs(depot_ids)
+        serializer = DeliveryRunSerializer(
+            DeliveryRunSerializer.setup_eager_loading(DeliveryRun.objects.filter(pk__in=[run.pk for run in runs])),
+            many=True
+        )
+        return Response({
+            'success': True,
+            'message': f'Planned {len(runs)} runs, {unplanned} orders could not be planned',
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
 
 
 
 
 
 # Invoice Views
-class StaffInvoiceListView(APIView):
+class StaffInvoiceListView(ReplicaReadMixin, APIView):
     '''
     Allow Staff to view all invoices
     '''
     permission_classes = [IsAuthenticatedStaff]
 
     def get(self, request, format=None):
-        invoices = Invoice.objects.all()
-        serializer = InvoiceSerializer(invoices, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        invoices = InvoiceSerializer.setup_eager_loading(Invoice.objects.all())
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(invoices, request, view=self)
+        serializer = InvoiceSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class InvoiceListView(APIView):
     permission_classes = [IsAuthenticatedClient]
 
     def get(self, request, format=None):
-        invoices = Invoice.objects.filter(user=request.user)
-        serializer = InvoiceSerializer(invoices, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        invoices = InvoiceSerializer.setup_eager_loading(Invoice.objects.filter(quote__user=request.user))
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(invoices, request, view=self)
+        serializer = InvoiceSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request, quote_id, order_id, format=None):
         try:
@@ -337,12 +584,14 @@ class InvoiceListView(APIView):
             return Response(serializer.data,status=status.HTTP_201_CREATED)
         return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
 
-class InvoiceDetailsView(APIView):
+class InvoiceDetailsView(CachedDetailMixin, APIView):
     permission_classes = [IsAuthenticatedClientOrStaff]
+    model = Invoice
+    serializer_class = InvoiceSerializer
 
     def get_invoice(self, id):
         try:
-            return Invoice.objects.get(pk=id)
+            return InvoiceSerializer.setup_eager_loading(Invoice.objects.all()).get(pk=id)
         except Invoice.DoesNotExist:
             raise(Http404)
     
@@ -354,13 +603,7 @@ class InvoiceDetailsView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
     
     def get(self, request, id, format=None):
-        try:
-            invoice = self.get_invoice(id)
-        except Http404:
-            return self.error_response()
-
-        serializer = InvoiceSerializer(invoice)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.get_cached_response(request, id)
 
     def put(self, request, id, format=None):
         try:
@@ -372,4 +615,369 @@ class InvoiceDetailsView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class InvoicePaymentsView(APIView):
+    '''
+    Payments recorded against an invoice, oldest first. Staff record new
+    ones; a reference that was already recorded is not applied twice.
+    '''
+    permission_classes = [IsAuthenticatedClientOrStaff]
+
+    def error_response(self):
+        return Response({
+                'success': False,
+                'message': 'The Invoice does not exist',
+                'data': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+    def get(self, request, id, format=None):
+        invoices = Invoice.objects.filter(pk=id)
+        if not request.user.is_staff:
+            invoices = invoices.filter(quote__user=request.user)
+        invoice = invoices.values('amount_paid', 'amount_due', 'payment_status').first()
+        if invoice is None:
+            return self.error_response()
+
+        payments = Payment.objects.filter(invoice_id=id).order_by('created_ts', 'id')
+        serializer = PaymentSerializer(payments, many=True)
+        return Response({**invoice, 'payments': serializer.data}, status=status.HTTP_200_OK)
+
+    def post(self, request, id, format=None):
+        if not request.user.is_staff:
+            return Response({
+                'success': False,
+                'message': 'Only staff can record payments'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = PaymentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            payment, created = record_payment(id, user=request.user, **serializer.validated_data)
+        except Invoice.DoesNotExist:
+            return self.error_response()
+        except PaymentReferenceTaken as error:
+            return Response({
+                'success': False,
+                'message': str(error),
+                'data': []
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            PaymentSerializer(payment).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+
+
+
+
+# Ledger Views
+class StaffLedgerSummaryView(ReplicaReadMixin, APIView):
+    '''
+    Allow Staff to view invoice totals per payment status, read from the
+    rollup table rather than aggregated over the invoices
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+
+    def get(self, request, format=None):
+        statuses = StatusLedgerSerializer(StatusLedger.objects.order_by('status'), many=True).data
+        totals = {
+            field: sum(row[field] for row in statuses)
+            for field in ('invoice_count', 'invoiced', 'paid', 'due')
+        }
+        return Response({'totals': totals, 'statuses': statuses}, status=status.HTTP_200_OK)
+
+class StaffLedgerDailyView(ReplicaReadMixin, APIView):
+    '''
+    Allow Staff to view amounts invoiced and collected per day between
+    ?start= and ?end= (ISO dates), the last LEDGER_DAILY_DAYS days by default
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+
+    def get(self, request, format=None):
+        today = timezone.localdate()
+        try:
+            end = parse_date(request.query_params.get('end', '')) or today
+            start = parse_date(request.query_params.get('start', '')) or end - timedelta(days=settings.LEDGER_DAILY_DAYS - 1)
+        except ValueError:
+            start = end = None
+        if start is None or start > end:
+            return Response({
+                'success': False,
+                'message': 'start and end must be dates with start on or before end'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        days = DailyLedger.objects.filter(day__range=(start, end)).order_by('day')
+        serializer = DailyLedgerSerializer(days, many=True)
+        return Response({'start': start, 'end': end, 'days': serializer.data}, status=status.HTTP_200_OK)
+
+class StaffLedgerUsersView(ReplicaReadMixin, APIView):
+    '''
+    Allow Staff to view the clients with the largest outstanding balance,
+    up to ?limit= of them
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+
+    def get(self, request, format=None):
+        try:
+            limit = min(max(int(request.query_params.get('limit', settings.LEDGER_USERS_LIMIT)), 1), settings.LEDGER_USERS_MAX_LIMIT)
+        except ValueError:
+            limit = settings.LEDGER_USERS_LIMIT
+
+        users = UserLedger.objects.filter(due__gt=0).order_by('-due', 'user_id')[:limit]
+        serializer = UserLedgerSerializer(users, many=True)
+        return Response({'users': serializer.data}, status=status.HTTP_200_OK)
+
+
+
+
+
+# Payment Views
+class PaymentCallbackView(APIView):
+    '''
+    Webhook for the payment provider. Takes one callback or a JSON array
+    of up to PAYMENT_CALLBACK_MAX_ITEMS, signed with PAYMENT_WEBHOOK_SECRET
+    in the X-Payment-Signature header. Callbacks are only validated and
+    queued here, the process_payments command applies them.
+    '''
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, format=None):
+        # The signature covers the raw body, read before request.data parses it
+        if not verify_callback(request.body, request.META.get('HTTP_X_PAYMENT_SIGNATURE')):
+            return Response({
+                'success': False,
+                'message': 'Invalid callback signature'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        data = request.data if isinstance(request.data, list) else [request.data]
+        if not data or len(data) > settings.PAYMENT_CALLBACK_MAX_ITEMS:
+            return Response({
+                'success': False,
+                'message': f'Expected between 1 and {settings.PAYMENT_CALLBACK_MAX_ITEMS} callbacks'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = PaymentCallbackSerializer(data=data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        enqueue_callbacks(serializer.validated_data)
+        return Response({'success': True, 'queued': len(data)}, status=status.HTTP_202_ACCEPTED)
+
+
+
+
+
+# Export Views
+class StaffExportView(ReplicaReadMixin, APIView):
+    '''
+    Stream a full table to staff as CSV or NDJSON, picked with ?format=.
+    Rows are read through a server-side cursor and written as they are
+    serialized, so memory stays flat however large the export is.
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+    model = None
+    serializer_class = None
+    filename = None
+
+    def get(self, request, format=None):
+        serializer = self.serializer_class()
+        # Bound now, the rows are only read once the response streams
+        queryset = self.serializer_class.setup_eager_loading(
+            self.model.objects.using(router.db_for_read(self.model)).order_by('id')
+        )
+        rows = (
+            serializer.to_representation(instance)
+            for instance in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        )
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(rows, get_serializer_header(serializer)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.{renderer.format}"'
+        return response
+
+class StaffQuoteExportView(StaffExportView):
+    model = Quote
+    serializer_class = QuoteSerializer
+    filename = 'quotes'
+
+class StaffOrderExportView(StaffExportView):
+    model = Order
+    serializer_class = OrderSerializer
+    filename = 'orders'
+
+class StaffInvoiceExportView(StaffExportView):
+    model = Invoice
+    serializer_class = InvoiceSerializer
+    filename = 'invoices'
+
+
+
+
+
+# Bulk Views
+class BulkWriteView(APIView):
+    '''
+    Create (POST) or partially update (PATCH) up to BULK_MAX_ITEMS objects
+    from a JSON array. The whole batch is validated with a many=True
+    serializer and written in one transaction; if any item is invalid
+    nothing is saved and the errors are reported per item.
+    '''
+    model = None
+    serializer_class = None
+
+    def get_save_kwargs(self, request):
+        return {}
+
+    def check_batch(self, data):
+        if not isinstance(data, list) or not data:
+            return 'Expected a non-empty list of items'
+        if len(data) > settings.BULK_MAX_ITEMS:
+            return f'Expected at most {settings.BULK_MAX_ITEMS} items, got {len(data)}'
+
+    def batch_error_response(self, message):
+        return Response({
+            'success': False,
+            'message': message,
+            'data': []
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    def item_error_response(self, errors):
+        return Response({
+            'success': False,
+            'message': 'No items were saved, fix the invalid items and retry',
+            'errors': [{'index': index, 'errors': error} for index, error in enumerate(errors) if error]
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_id_errors(self, ids, instances):
+        counts = Counter(ids)
+        errors = []
+        for id in ids:
+            if id not in instances:
+                errors.append({'id': ['Object with this id does not exist.']})
+            elif counts[id] > 1:
+                errors.append({'id': ['Duplicate id in batch.']})
+            else:
+                errors.append({})
+        return errors
+
+    def post(self, request, format=None):
+        message = self.check_batch(request.data)
+        if message:
+            return self.batch_error_response(message)
+
+        serializer = self.serializer_class(data=request.data, many=True, context={'request': request})
+        if not serializer.is_valid():
+            return self.item_error_response(serializer.errors)
+
+        with transaction.atomic():
+            serializer.save(**self.get_save_kwargs(request))
+        return Response({
+            'success': True,
+            'message': f'Created {len(serializer.validated_data)} items',
+            'data': serializer.data
+        }, status=status.HTTP_201_CREATED)
+
+    def patch(self, request, format=None):
+        message = self.check_batch(request.data)
+        if message:
+            return self.batch_error_response(message)
+
+        ids = [item.get('id') if isinstance(item, dict) and isinstance(item.get('id'), int) else None for item in request.data]
+        with transaction.atomic():
+            instances = self.model.objects.select_for_update().in_bulk([id for id in ids if id is not None])
+            errors = self.get_id_errors(ids, instances)
+            if any(errors):
+                return self.item_error_response(errors)
+
+            serializer = self.serializer_class(
+                [instances[id] for id in ids],
+                data=request.data,
+                many=True,
+                partial=True,
+                context={'request': request}
+            )
+            if not serializer.is_valid():
+                return self.item_error_response(serializer.errors)
+            serializer.save(**self.get_save_kwargs(request))
+
+        return Response({
+            'success': True,
+            'message': f'Updated {len(ids)} items',
+            'data': serializer.data
+        }, status=status.HTTP_200_OK)
+
+class RiderBulkView(BulkWriteView):
+    permission_classes = [IsAuthenticatedStaff]
+    model = Rider
+    serializer_class = RiderSerializer
+
+class QuoteBulkView(BulkWriteView):
+    '''
+    Allow Clients to submit many quotes at once
+    '''
+    permission_classes = [IsAuthenticatedClient]
+    http_method_names = ['post', 'options']
+    model = Quote
+    serializer_class = QuoteSerializer
+
+    def get_save_kwargs(self, request):
+        return {'user': request.user}
+
+class StaffOrderBulkView(BulkWriteView):
+    '''
+    Allow Staff to update the status, payment and rider of many orders at once
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+    http_method_names = ['patch', 'options']
+    model = Order
+    serializer_class = OrderBulkUpdateSerializer
+
+
+
+
+
+# Metrics Views
+class MetricsView(APIView):
+    '''
+    Allow Staff to scrape this process's per-endpoint request metrics, in
+    the Prometheus text format. Empty unless PROFILING_ENABLED is on.
+    '''
+    permission_classes = [IsAuthenticatedStaff]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request, format=None):
+        return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+
+
+# Async Views
+def executor_view(view):
+    '''
+    Async version of a sync API view for ASGI deployments. Django runs
+    plain sync views one at a time on a single shared thread there; this
+    runs the view and the rendering of its response on the executor's
+    thread pool instead, so requests waiting on the database overlap.
+    Pool threads hold their own connections, so they are recycled around
+    every call the way the request cycle would per CONN_MAX_AGE.
+    '''
+    def run(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(run, thread_sensitive=False)(request, *args, **kwargs)
+    return async_view
@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+
+from decouple import config
+
+from .dispatch import LocalDispatchAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed, error):
+        self.count += 1
+        self.errors += int(error)
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+
+class APIClient:
+    '''
+    Shared client for the frontend's calls to the API. One requests.Session
+    keeps a pool of keep-alive connections, every call gets a timeout,
+    failed connections and idempotent requests are retried with backoff,
+    and latency is recorded per endpoint.
+
+    The session never stores cookies, the API is authenticated with JWT
+    headers, so one instance is safe to share between threads.
+
+    With transport='local' calls under base_url are dispatched to the API
+    views in this process rather than over HTTP, for deployments that
+    serve the frontend and the API from the same project.
+    '''
+    def __init__(self, base_url, pool_size=10, timeout=(3.05, 10), retries=3, backoff=0.2, transport='http'):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if transport == 'local':
+            self.session.mount(base_url, LocalDispatchAdapter())
+        elif transport != 'http':
+            raise ValueError(f'Unknown API client transport {transport!r}')
+
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def request(self, method, path, access_token=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if access_token:
+            kwargs['headers'] = {**kwargs.get('headers', {}), 'Authorization': f'Bearer {access_token}'}
+
+        started = time.perf_counter()
+        error = True
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', **kwargs)
+            error = response.status_code >= 500
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            self.record(f'{method} {path}', elapsed, error)
+
+    def record(self, endpoint, elapsed, error):
+        with self.lock:
+            self.metrics.setdefault(endpoint, LatencyStats()).add(elapsed, error)
+        logger.debug('%s took %.1fms', endpoint, elapsed * 1000)
+
+    def stats(self):
+        with self.lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self.metrics.items()}
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+
+api_client = APIClient(
+    config('API_URL'),
+    pool_size=settings.API_CLIENT_POOL_SIZE,
+    timeout=(settings.API_CLIENT_CONNECT_TIMEOUT, settings.API_CLIENT_READ_TIMEOUT),
+    retries=settings.API_CLIENT_RETRIES,
+    backoff=settings.API_CLIENT_BACKOFF,
+    transport=settings.API_CLIENT_TRANSPORT
+)
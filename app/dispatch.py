@@ -0,0 +1,94 @@
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+
+
+class DispatchHandler(BaseHandler):
+    '''
+    The request handler of a WSGI server, middleware and all, without the
+    request_started and request_finished signals: a dispatched call runs
+    inside another request, whose database connections those would close.
+    Like django.test.client.ClientHandler.
+    '''
+    def __call__(self, environ):
+        if self._middleware_chain is None:
+            self.load_middleware()
+        return self.get_response(WSGIRequest(environ))
+
+
+class LocalDispatchAdapter(BaseAdapter):
+    '''
+    requests transport that hands API calls straight to the API views in
+    this process instead of sending them over a socket. Each call becomes a
+    synthetic WSGIRequest carrying the same headers, including the JWT
+    Authorization header, so the views authenticate and permission check
+    it exactly as they would over HTTP. The Django response is converted
+    back into a requests.Response, callers can't tell the difference.
+    Calls go through the project's middleware like any other request.
+
+    Only mounted for the API_URL prefix, anything else still goes over HTTP.
+    '''
+    def __init__(self):
+        super().__init__()
+        self.handler = DispatchHandler()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'PATH_INFO': url.path,
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': url.hostname or 'localhost',
+            'SERVER_PORT': str(url.port or (443 if url.scheme == 'https' else 80)),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+            'wsgi.url_scheme': url.scheme or 'http',
+            'wsgi.errors': BytesIO(),
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in request.headers.items():
+            name = name.upper().replace('-', '_')
+            if name == 'CONTENT_TYPE':
+                environ[name] = value
+            elif name != 'CONTENT_LENGTH':
+                environ[f'HTTP_{name}'] = value
+
+        django_response = self.handler(environ)
+        return self.build_response(request, django_response)
+
+    def build_response(self, request, django_response):
+        response = Response()
+        response.status_code = django_response.status_code
+        response.reason = django_response.reason_phrase
+        response.headers = CaseInsensitiveDict(django_response.items())
+        response.encoding = django_response.charset
+        response.url = request.url
+        response.request = request
+        if django_response.streaming:
+            response._content = b''.join(django_response.streaming_content)
+        else:
+            response._content = django_response.content
+        # What django_response.close() does, less its request_finished signal
+        for closer in django_response._resource_closers:
+            closer()
+        django_response._resource_closers.clear()
+        return response
+
+    def close(self):
+        pass
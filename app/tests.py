@@ -1,3 +1,199 @@
-from django.test import TestCase
+import base64
+import json
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.shortcuts import reverse
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from requests import Response
+from requests.adapters import BaseAdapter
+
+from . import tokens
+from .client import APIClient
+from api.models import Quote
+User = get_user_model()
+
+
+class RecordingAdapter(BaseAdapter):
+    def __init__(self, status_code=200):
+        super().__init__()
+        self.status_code = status_code
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append((request, kwargs))
+        response = Response()
+        response.status_code = self.status_code
+        response.request = request
+        response.url = request.url
+        response._content = b'{}'
+        return response
+
+    def close(self):
+        pass
+
+
+class APIClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = APIClient('http://api.test/api/', timeout=(1, 2))
+        self.adapter = RecordingAdapter()
+        self.client.session.mount('http://', self.adapter)
+
+    def test_request_url_timeout_and_token(self):
+        self.client.get('quotes', access_token='token')
+
+        request, kwargs = self.adapter.requests[0]
+        self.assertEqual(request.url, 'http://api.test/api/quotes')
+        self.assertEqual(request.headers['Authorization'], 'Bearer token')
+        self.assertEqual(kwargs['timeout'], (1, 2))
+
+    def test_records_latency_per_endpoint(self):
+        self.client.post('login', data={'username': 'test'})
+        self.client.post('login', data={'username': 'test'})
+        self.adapter.status_code = 503
+        self.client.get('quotes')
+
+        stats = self.client.stats()
+        self.assertEqual(stats['POST login']['count'], 2)
+        self.assertEqual(stats['POST login']['errors'], 0)
+        self.assertEqual(stats['GET quotes']['errors'], 1)
+
+
+
+def make_token(expiry):
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).rstrip(b'=').decode('ascii')
+    return f'{encode({"alg": "HS256"})}.{encode({"exp": expiry})}.signature'
+
+
+class TokenRefreshTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        cache.clear()
+
+    def post(self, path, data=None, **kwargs):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(1)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'access': make_token(int(time.time()) + 300)}
+        return response
+
+    def test_needs_refresh(self):
+        self.assertFalse(tokens.needs_refresh(make_token(int(time.time()) + 300), window=60))
+        self.assertTrue(tokens.needs_refresh(make_token(int(time.time()) + 30), window=60))
+        self.assertTrue(tokens.needs_refresh('not-a-jwt', window=60))
+
+    def test_concurrent_refreshes_share_one_call(self):
+        results = []
+        with mock.patch.object(tokens.api_client, 'post', self.post):
+            leader = threading.Thread(target=lambda: results.append(tokens.refresh_access_token('refresh')))
+            leader.start()
+            self.started.wait(1)
+            followers = [
+                threading.Thread(target=lambda: results.append(tokens.refresh_access_token('refresh')))
+                for _ in range(4)
+            ]
+            for follower in followers:
+                follower.start()
+            self.release.set()
+            for thread in [leader] + followers:
+                thread.join()
+
+            self.assertEqual(self.calls, 1)
+            self.assertEqual(len(set(results)), 1)
+
+            # Later requests reuse the cached token until it is due again
+            tokens.refresh_access_token('refresh')
+            self.assertEqual(self.calls, 1)
+
+
+class LocalDispatchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='test', password='test2020')
+        self.access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.client = APIClient('http://testserver/api/', transport='local')
+
+    def tearDown(self):
+        Quote.objects.all().delete()
+        self.user.delete()
+
+    def test_dispatches_to_api_views_with_jwt_identity(self):
+        with mock.patch('requests.adapters.HTTPAdapter.send') as send:
+            self.response = self.client.post('quotes', access_token=self.access_token, data={
+                'item_name': 'Parcel',
+                'item_description': 'Testing',
+                'location_from': 'Nairobi',
+                'location_to': 'Mombasa'
+            })
+            send.assert_not_called()
+
+        self.assertEqual(self.response.status_code, 201)
+        self.assertEqual(Quote.objects.get().user, self.user)
+
+        self.response = self.client.get('quotes', access_token=self.access_token)
+        self.assertEqual(self.response.status_code, 200)
+        self.assertEqual(self.response.json()['results'][0]['item_name'], 'Parcel')
+
+    def test_unauthenticated_and_unknown_paths(self):
+        self.assertEqual(self.client.get('quotes').status_code, 401)
+        self.assertEqual(self.client.get('missing').status_code, 404)
+
+    def test_runs_middleware_and_leaves_connections_open(self):
+        finished = mock.Mock()
+        request_finished.connect(finished)
+        try:
+            self.response = self.client.get('quotes', access_token=self.access_token)
+        finally:
+            request_finished.disconnect(finished)
+
+        self.assertEqual(self.response.status_code, 200)
+        # Set by XFrameOptionsMiddleware
+        self.assertEqual(self.response.headers['X-Frame-Options'], 'DENY')
+        finished.assert_not_called()
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class DashboardTestCase(TestCase):
+    def setUp(self):
+        session = self.client.session
+        session['access_token'] = make_token(int(time.time()) + 300)
+        session['refresh_token'] = 'refresh'
+        session.save()
+        self.paths = []
+        self.barrier = threading.Barrier(3, timeout=2)
+
+    def get(self, path, access_token=None, **kwargs):
+        self.paths.append(path)
+        # Only passes once all three calls are in flight together
+        self.barrier.wait()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'results': [{'item_name': f'{path} item'}]}
+        return response
+
+    def test_fetches_api_calls_concurrently(self):
+        with mock.patch('app.views.api_client.get', self.get):
+            self.response = self.client.get(reverse('dashboard'))
+
+        self.assertEqual(self.response.status_code, 200)
+        self.assertCountEqual(self.paths, ['quotes', 'orders', 'invoices'])
+        self.assertContains(self.response, 'quotes item')
+
+    def test_redirects_without_session(self):
+        self.client.session.flush()
+        self.client.cookies.clear()
+        self.response = self.client.get(reverse('dashboard'))
+
+        self.assertRedirects(self.response, reverse('signin'), fetch_redirect_response=False)
@@ -0,0 +1,101 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .client import api_client
+
+
+def token_expiry(token):
+    '''
+    The exp claim of a JWT, read without verifying the signature. The API
+    verifies the token on every call, the frontend only needs to know
+    when to refresh it. Returns None for anything that does not parse.
+    '''
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def needs_refresh(token, window=None):
+    '''
+    True once the token is inside the refresh window before it expires
+    '''
+    window = settings.TOKEN_REFRESH_WINDOW if window is None else window
+    expiry = token_expiry(token)
+    return expiry is None or expiry - time.time() <= window
+
+
+class SingleFlight:
+    '''
+    Runs a function once per key at a time; concurrent callers with the
+    same key wait for the running call and share its result
+    '''
+    class Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def run(self, key, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
+
+
+refresh_flight = SingleFlight()
+
+
+def refresh_access_token(refresh_token):
+    '''
+    Exchange a refresh token for a new access token, or None if the API
+    refused it. Concurrent refreshes for the same session are merged into
+    one call, and requests that started with the old access token reuse
+    the new one instead of refreshing again.
+    '''
+    key = 'token-refresh:' + hashlib.sha256(refresh_token.encode('utf-8')).hexdigest()
+    access_token = cache.get(key)
+    if access_token and not needs_refresh(access_token):
+        return access_token
+
+    def refresh():
+        response = api_client.post('token/refresh', data={'refresh': refresh_token})
+        if response.status_code != 200:
+            return None
+        access_token = response.json()['access']
+        expiry = token_expiry(access_token)
+        if expiry is not None:
+            cache.set(key, access_token, timeout=max(int(expiry - time.time()), 1))
+        return access_token
+
+    return refresh_flight.run(key, refresh)
@@ -7,6 +7,7 @@ urlpatterns = [
     path('signup/', views.signup, name='signup'),
     path('signin', views.signin, name='signin'),
     path('logout', views.logout, name='logout'),
+    path('dashboard', views.dashboard, name='dashboard'),
     # path('post/<int:id>', views.post, name='post'),
     # path('create/post', views.create_post, name='create_post'),
 ]
\ No newline at end of file
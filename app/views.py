@@ -1,26 +1,70 @@
-import requests
+import asyncio
+from functools import wraps
 
+from asgiref.sync import sync_to_async
+
+from django.db import close_old_connections
 from django.shortcuts import render, loader, redirect, HttpResponse
 from django.contrib import messages
 
+from .client import api_client
+from .tokens import needs_refresh, refresh_access_token
 from .forms import UserSignUpForm, UserLoginForm, QuoteForm, OrderForm, InvoiceForm
 
-from decouple import config
-
-API_URL = config('API_URL')
+def fresh_access_token(session):
+    '''
+    The session's access token, refreshed first when it is inside the
+    TOKEN_REFRESH_WINDOW before it expires. None when the session is not
+    signed in or the API refused the refresh.
+    '''
+    access_token = session.get('access_token')
+    refresh_token = session.get('refresh_token')
+    if not (access_token and refresh_token):
+        return None
+    if needs_refresh(access_token):
+        access_token = refresh_access_token(refresh_token)
+        if access_token is None:
+            return None
+        session['access_token'] = access_token
+    return access_token
 
 def handle_refresh(function):
+    '''
+    Require a signed in session and keep its access token fresh. Works
+    for sync and async views.
+    '''
+    if asyncio.iscoroutinefunction(function):
+        @wraps(function)
+        async def async_wrapper(request, *args, **kwargs):
+            if await sync_to_async(fresh_access_token)(request.session) is None:
+                return redirect('signin')
+            return await function(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(function)
     def wrapper(request, *args, **kwargs):
-        if request.session["access_token"] and request.session['refresh_token']:
-            payload = {
-                'refresh': request.session["refresh_token"]
-            }
-            response = requests.post(f'{API_URL}token/refresh', payload)
-            request.session["access_token"] = response.json()["access"]
-            return function(request, *args, **kwargs)
-        return redirect('signin')
+        if fresh_access_token(request.session) is None:
+            return redirect('signin')
+        return function(request, *args, **kwargs)
     return wrapper
 
+async def fetch_results(path, access_token):
+    '''
+    GET a page of API results on a pool thread, so several can be in
+    flight at once. The local transport opens a database connection on
+    that thread, it is recycled like the request cycle would.
+    '''
+    def get():
+        try:
+            return api_client.get(path, access_token=access_token)
+        finally:
+            close_old_connections()
+
+    response = await sync_to_async(get, thread_sensitive=False)()
+    if response.status_code != 200:
+        return []
+    return response.json()['results']
+
 # def index(request):
 #     '''
 #     Create and View all the Posts
@@ -53,7 +97,7 @@ def signup(request):
                 'bio': form.cleaned_data['bio'],
                 'location': form.cleaned_data['location']
             }
-            response = requests.post(f'{API_URL}register', data=payload)
+            response = api_client.post('register', data=payload)
             if response.status_code == 201:
                 messages.add_message(request, messages.SUCCESS, 'User successfully registered, Login!')
                 return redirect('signin')
@@ -75,7 +119,7 @@ def signin(request):
                 'username': form.cleaned_data['username'],
                 'password': form.cleaned_data['password'],
             }
-            response = requests.post(f'{API_URL}login', data=payload)
+            response = api_client.post('login', data=payload)
             if response.status_code == 200:
                 response_data = response.json()
                 request.session["access_token"] = response_data['authentication']['access_token']
@@ -106,9 +150,23 @@ def logout(request):
 
 
 @handle_refresh
-def dashboard(request):
+async def dashboard(request):
+    '''
+    The client's quotes, orders and invoices, fetched from the API concurrently
+    '''
+    access_token = request.session['access_token']
+    quotes, orders, invoices = await asyncio.gather(
+        fetch_results('quotes', access_token),
+        fetch_results('orders', access_token),
+        fetch_results('invoices', access_token)
+    )
     template = loader.get_template('dashboard.html')
-    return HttpResponse(template.render({}, request))
+    context = {
+        'quotes': quotes,
+        'orders': orders,
+        'invoices': invoices
+    }
+    return HttpResponse(await sync_to_async(template.render)(context, request))
 
 # @handle_refresh
 # def create_quote(request):
@@ -0,0 +1,220 @@
+'''
+In-process benchmark of the main API endpoints against seed_synthetic
+data. Each case is run through the Django test client, so the numbers
+cover URL routing, middleware, authentication, the view, serialization
+and the database, without sockets or a web server.
+
+By default a throwaway test database is created and seeded with a fixed
+seed, so runs are comparable; --existing runs against the configured
+database instead (seed it first). Results are compared with a saved
+baseline and the run fails if any case's p95 regressed past --tolerance.
+
+    python -m benchmarks.api_suite                    # compare with benchmarks/baseline.json
+    python -m benchmarks.api_suite --save-baseline    # record a new baseline
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.shortcuts import reverse  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+from api.models import Quote, Order, Invoice  # noqa: E402
+User = get_user_model()
+
+BASELINE = Path(__file__).with_name('baseline.json')
+SEED = {'users': 200, 'staff': 2, 'riders': 300, 'quotes': 5000, 'orders': 3000, 'invoices': 2000, 'seed': 18}
+
+
+def authenticated(user):
+    return Client(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+
+def build_cases(rng, password):
+    '''
+    (name, callable) pairs, each callable makes one request and returns it
+    '''
+    staff = User.objects.filter(username__startswith='synthetic-staff-').first()
+    clients = list(User.objects.filter(username__startswith='synthetic-', is_staff=False).order_by('id'))
+    if staff is None or not clients:
+        raise SystemExit('No synthetic data found, run manage.py seed_synthetic first')
+
+    client_sessions = {user.pk: authenticated(user) for user in clients[:20]}
+    # Order create needs quotes that have no order yet, one per request, owned by a signed in client
+    pending = list(Quote.objects.filter(order__isnull=True, user__in=client_sessions).values_list('pk', 'user_id'))
+    rng.shuffle(pending)
+    quote_ids = [pk for pk, _ in Quote.objects.filter(user__in=clients).values_list('pk', 'user_id')]
+    order_ids = list(Order.objects.values_list('pk', flat=True))
+    invoice_ids = list(Invoice.objects.values_list('pk', flat=True))
+
+    staff_client = authenticated(staff)
+    anonymous = Client()
+
+    def login():
+        user = rng.choice(clients)
+        return anonymous.post(reverse('login'), {'username': user.username, 'password': password})
+
+    def quote_list():
+        return rng.choice(list(client_sessions.values())).get(reverse('quotes'))
+
+    def staff_orders():
+        return staff_client.get(reverse('staff_orders'))
+
+    def staff_invoices():
+        return staff_client.get(reverse('staff_invoice'))
+
+    def quote_detail():
+        return staff_client.get(reverse('quote', kwargs={'id': rng.choice(quote_ids)}))
+
+    def order_detail():
+        return staff_client.get(reverse('order', kwargs={'id': rng.choice(order_ids)}))
+
+    def invoice_detail():
+        return staff_client.get(reverse('invoice', kwargs={'id': rng.choice(invoice_ids)}))
+
+    def order_create():
+        quote_id, user_id = pending.pop()
+        return client_sessions[user_id].post(reverse('quote_order', kwargs={'quote_id': quote_id}), {'payment_ref': 'BENCH'})
+
+    return [
+        ('login', login),
+        ('quote_list', quote_list),
+        ('staff_order_list', staff_orders),
+        ('staff_invoice_list', staff_invoices),
+        ('quote_detail', quote_detail),
+        ('order_detail', order_detail),
+        ('invoice_detail', invoice_detail),
+        ('order_create', order_create),
+    ], len(pending)
+
+
+def percentile(latencies, fraction):
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+
+def run_case(request, iterations, warmup):
+    for _ in range(warmup):
+        request()
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        request_started = time.perf_counter()
+        response = request()
+        latencies.append(time.perf_counter() - request_started)
+        errors += int(response.status_code >= 400)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'throughput_rps': round(iterations / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    '''
+    Cases whose p95 got slower than the baseline by more than tolerance,
+    ignoring differences under min_delta_ms that are within run-to-run noise
+    '''
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('cases', {}).get(name)
+        if (
+            previous
+            and result['p95_ms'] > previous['p95_ms'] * (1 + tolerance)
+            and result['p95_ms'] - previous['p95_ms'] >= min_delta_ms
+        ):
+            regressions.append((name, previous['p95_ms'], result['p95_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200, help='Measured requests per case')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per case first')
+    parser.add_argument('--cases', nargs='*', help='Only run these cases')
+    parser.add_argument('--existing', action='store_true', help='Use the configured database instead of a seeded test database')
+    parser.add_argument('--password', default='synthetic', help='Password of the synthetic users')
+    parser.add_argument('--baseline', type=Path, default=BASELINE, help='Baseline JSON to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown against the baseline, 0.25 is 25%%')
+    parser.add_argument('--min-delta-ms', type=float, default=5, help='Ignore p95 slowdowns smaller than this')
+    parser.add_argument('--output', type=Path, help='Also write the results as JSON here')
+    options = parser.parse_args()
+
+    setup_test_environment()
+    old_name = None
+    if not options.existing:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        call_command('seed_synthetic', password=options.password, verbosity=0, **SEED)
+    try:
+        for alias in ('default', 'detail'):
+            caches[alias].clear()
+        cases, pending = build_cases(random.Random(SEED['seed']), options.password)
+        if options.cases:
+            cases = [(name, request) for name, request in cases if name in options.cases]
+        if any(name == 'order_create' for name, _ in cases) and pending < options.iterations + options.warmup:
+            raise SystemExit(f'order_create needs {options.iterations + options.warmup} quotes without an order, found {pending}')
+
+        results = {}
+        print(f"{'case':<20} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name, request in cases:
+            result = results[name] = run_case(request, options.iterations, options.warmup)
+            print(
+                f"{name:<20} {result['throughput_rps']:>8} {result['p50_ms']:>9} "
+                f"{result['p95_ms']:>9} {result['p99_ms']:>9} {result['errors']:>7}"
+            )
+    finally:
+        if old_name is not None:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    report = {
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'seed': SEED,
+        'iterations': options.iterations,
+        'cases': results,
+    }
+    if options.output:
+        options.output.write_text(json.dumps(report, indent=2) + '\n')
+    if options.save_baseline:
+        options.baseline.write_text(json.dumps(report, indent=2) + '\n')
+        print(f'Saved baseline to {options.baseline}')
+        return
+
+    if not options.baseline.exists():
+        print(f'No baseline at {options.baseline}, run with --save-baseline to record one')
+        return
+    regressions = compare(results, json.loads(options.baseline.read_text()), options.tolerance, options.min_delta_ms)
+    for name, before, after in regressions:
+        print(f'REGRESSION {name}: p95 {before}ms -> {after}ms')
+    if regressions:
+        sys.exit(1)
+    print(f'No p95 regressions beyond {options.tolerance:.0%} of the baseline')
+
+
+if __name__ == '__main__':
+    main()
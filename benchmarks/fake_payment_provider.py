@@ -0,0 +1,136 @@
+'''
+Fake payment provider: charges orders by payment_ref and delivers signed
+callbacks to the webhook the way a real provider does, in batches, from
+many connections at once and with a share of them redelivered. Used by
+the tests through FakePaymentProvider, and from the command line to push
+a burst at a running server:
+
+    PAYMENT_WEBHOOK_SECRET=secret python -m benchmarks.fake_payment_provider \
+        http://localhost:8000/api/payments/callback --callbacks 20000
+    python manage.py process_payments
+'''
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import requests
+
+
+class FakePaymentProvider:
+    def __init__(self, secret, redeliver=0.0, seed=None):
+        self.secret = secret
+        self.redeliver = redeliver
+        self.rng = random.Random(seed)
+        self.events = []
+
+    def charge(self, payment_ref, amount, succeeded=True):
+        '''
+        Record a charge and return its callback event
+        '''
+        event = {
+            'id': f'evt_{uuid.UUID(int=self.rng.getrandbits(128)).hex}',
+            'payment_ref': payment_ref,
+            'amount': amount,
+            'status': 'succeeded' if succeeded else 'failed',
+        }
+        self.events.append(event)
+        return event
+
+    def deliveries(self, batch_size=1):
+        '''
+        Signed (body, signature) pairs for every event charged so far, in
+        batches of batch_size. Each event is redelivered with probability
+        redeliver, sometimes in a later batch, as providers do on timeouts.
+        '''
+        from api.payments import sign_callback
+
+        events = list(self.events)
+        events += [event for event in self.events if self.rng.random() < self.redeliver]
+        self.rng.shuffle(events)
+        self.events = []
+
+        for start in range(0, len(events), batch_size):
+            batch = events[start:start + batch_size]
+            body = json.dumps(batch if batch_size > 1 else batch[0]).encode('utf-8')
+            yield body, sign_callback(body, self.secret)
+
+    def deliver(self, post, batch_size=1):
+        '''
+        Send every delivery with post(body, signature) and return the
+        status codes; post is the test client or an HTTP session
+        '''
+        return [post(body, signature) for body, signature in self.deliveries(batch_size)]
+
+
+def load_orders(limit):
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    django.setup()
+
+    from api.models import Order
+
+    return list(
+        Order.objects.exclude(payment_ref='').filter(payment_complete_status=False)
+        .values_list('payment_ref', 'orderinvoice__total_amount')[:limit]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url', help='Payment callback URL')
+    parser.add_argument('--callbacks', type=int, default=10000, help='Charges to make')
+    parser.add_argument('--batch-size', type=int, default=1, help='Callbacks per request')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent connections')
+    parser.add_argument('--redeliver', type=float, default=0.1, help='Share of callbacks delivered twice')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    secret = os.environ.get('PAYMENT_WEBHOOK_SECRET')
+    if not secret:
+        parser.error('Set PAYMENT_WEBHOOK_SECRET to the secret the server verifies callbacks with')
+
+    provider = FakePaymentProvider(secret, redeliver=args.redeliver, seed=args.seed)
+    orders = load_orders(args.callbacks)
+    if not orders:
+        parser.error('No unpaid orders with a payment_ref, run seed_synthetic first')
+    for index in range(args.callbacks):
+        payment_ref, amount = orders[index % len(orders)]
+        provider.charge(payment_ref, amount or 100, succeeded=provider.rng.random() > 0.02)
+
+    deliveries = list(provider.deliveries(args.batch_size))
+    codes = []
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                if not deliveries:
+                    return
+                body, signature = deliveries.pop()
+            response = session.post(args.url, data=body, timeout=30, headers={
+                'Content-Type': 'application/json',
+                'X-Payment-Signature': signature,
+            })
+            with lock:
+                codes.append(response.status_code)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    accepted = codes.count(202)
+    print(f'{len(codes)} requests in {elapsed:.2f}s ({len(codes) / elapsed:.0f} req/s, '
+          f'{len(codes) * args.batch_size / elapsed:.0f} callbacks/s), {accepted} accepted')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+'''
+Closed-loop load test: a fixed number of concurrent clients request one
+URL per target for a fixed time, then latency percentiles are compared.
+Point it at the WSGI and the ASGI (uvicorn) deployment of the same path:
+
+    gunicorn project.wsgi -b :8000 &
+    gunicorn project.asgi -c project/gunicorn_asgi.py &  # PORT=8001
+    python -m benchmarks.load_test --username test \
+        http://localhost:8000/api/quotes http://localhost:8001/api/quotes
+'''
+import argparse
+import os
+import threading
+import time
+
+import requests
+
+
+def percentile(latencies, fraction):
+    if not latencies:
+        return 0.0
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+
+def mint_token(username):
+    '''
+    An access token for an existing user, read from this project's database
+    '''
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    user = get_user_model().objects.get(username=username)
+    return str(RefreshToken.for_user(user).access_token)
+
+
+def run(url, headers, clients, duration):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                failed = session.get(url, headers=headers, timeout=30).status_code >= 400
+            except requests.RequestException:
+                failed = True
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += int(failed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / duration,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('urls', nargs='+', help='URLs to compare, e.g. the WSGI and ASGI deployment of one endpoint')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per target')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds per target first')
+    parser.add_argument('--token', help='JWT access token to send')
+    parser.add_argument('--username', help='Mint an access token for this user instead')
+    options = parser.parse_args()
+
+    token = options.token or (mint_token(options.username) if options.username else None)
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    print(f"{'url':<48} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for url in options.urls:
+        if options.warmup:
+            run(url, headers, options.clients, options.warmup)
+        result = run(url, headers, options.clients, options.duration)
+        print(
+            f"{url:<48} {result['requests']:>9} {result['errors']:>7} {result['rps']:>8.1f} "
+            f"{result['p50']:>8.1f} {result['p95']:>8.1f} {result['p99']:>8.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
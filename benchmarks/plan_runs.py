@@ -0,0 +1,69 @@
+'''
+Delivery run planning benchmark on synthetic depots: stops scattered
+around each depot with random weights and deadlines, planned with
+api.planning's nearest neighbour + 2-opt. Needs no database.
+
+    python -m benchmarks.plan_runs --stops 2000
+    python -m benchmarks.plan_runs --stops 2000 --depots 4 --processes 4
+'''
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+
+
+def make_problem(rng, stops, radius_km):
+    from api.locations import haversine_km
+    from api.planning import RunProblem
+
+    # The depot is node 0, each stop gets a node of its own
+    latitudes = np.concatenate([[-1.2864], -1.2864 + rng.uniform(-1, 1, stops) * radius_km / 111])
+    longitudes = np.concatenate([[36.8172], 36.8172 + rng.uniform(-1, 1, stops) * radius_km / 111])
+    distances = haversine_km(latitudes[:, None], longitudes[:, None], latitudes[None, :], longitudes[None, :]) * 1.3
+    deadlines = np.where(rng.random(stops) < 0.3, rng.uniform(120, 600, stops), math.inf)
+    return RunProblem(
+        depot=0,
+        nodes=list(range(1, stops + 1)),
+        weights=rng.uniform(0.5, 20, stops).tolist(),
+        deadlines=deadlines.tolist(),
+        distances=distances,
+        durations=distances / 50 * 60
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stops', type=int, default=2000, help='Stops per depot')
+    parser.add_argument('--depots', type=int, default=1, help='Independent depots')
+    parser.add_argument('--processes', type=int, default=1, help='Depots planned in parallel')
+    parser.add_argument('--radius-km', type=float, default=40, help='How far stops are scattered from their depot')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    django.setup()
+
+    from api.planning import get_limits, solve
+
+    rng = np.random.default_rng(args.seed)
+    problems = [make_problem(rng, args.stops, args.radius_km) for _ in range(args.depots)]
+    limits = get_limits()
+
+    started = time.perf_counter()
+    solutions = solve(problems, limits, args.processes)
+    elapsed = time.perf_counter() - started
+
+    runs = [run for planned, _ in solutions for run in planned]
+    unplanned = sum(len(skipped) for _, skipped in solutions)
+    planned_stops = sum(len(run.stops) for run in runs)
+    print(f'{args.depots} depot(s) x {args.stops} stops on {args.processes} process(es): {elapsed:.2f}s')
+    print(f'{len(runs)} runs, {planned_stops} stops planned, {unplanned} unplanned, '
+          f'{sum(run.distance_km for run in runs):.0f}km, '
+          f'mean {planned_stops / max(len(runs), 1):.1f} stops per run')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''
+Open many idle order streams against a running ASGI server and hold
+them, counting the ones that connected, failed and got heartbeats.
+
+    python -m benchmarks.sse_connections --username client [--connections 2000] [--hold 30] [--host 127.0.0.1] [--port 8000]
+'''
+import argparse
+import asyncio
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+
+async def hold_stream(host, port, token, hold, results):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        results['failed'] += 1
+        return
+    try:
+        writer.write(
+            f'GET /api/orders/stream HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n'
+            'Accept: text/event-stream\r\n\r\n'.encode('ascii')
+        )
+        status = await reader.readline()
+        if b' 200 ' not in status:
+            results['failed'] += 1
+            return
+        results['connected'] += 1
+        deadline = time.monotonic() + hold
+        while time.monotonic() < deadline:
+            try:
+                line = await asyncio.wait_for(reader.readline(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not line:
+                results['closed'] += 1
+                break
+            if line.startswith(b': heartbeat'):
+                results['heartbeats'] += 1
+    finally:
+        writer.close()
+
+
+async def run(args, token):
+    results = {'connected': 0, 'failed': 0, 'closed': 0, 'heartbeats': 0}
+    started = time.monotonic()
+    tasks = []
+    for _ in range(args.connections):
+        tasks.append(asyncio.ensure_future(hold_stream(args.host, args.port, token, args.hold, results)))
+        # Spread the connects so the accept backlog does not overflow
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*tasks)
+    return results, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--connections', type=int, default=2000)
+    parser.add_argument('--hold', type=float, default=30)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    token = RefreshToken.for_user(get_user_model().objects.get(username=args.username)).access_token
+    results, elapsed = asyncio.run(run(args, token))
+    print(
+        f"{results['connected']} of {args.connections} streams connected, {results['failed']} failed, "
+        f"{results['closed']} closed early, {results['heartbeats']} heartbeats in {elapsed:.1f}s"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+'''
+Count token refresh calls per 1000 dashboard page views, with the old
+refresh-on-every-view decorator and with the expiry-aware one.
+
+    python -m benchmarks.token_refresh [--views 1000] [--interval 2] [--lifetime 300]
+'''
+import argparse
+import base64
+import json
+import os
+import threading
+from unittest import mock
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from app import tokens  # noqa: E402
+from app.views import handle_refresh  # noqa: E402
+
+
+def make_token(expiry):
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).rstrip(b'=').decode('ascii')
+    return f'{encode({"alg": "HS256", "typ": "JWT"})}.{encode({"exp": expiry})}.signature'
+
+
+class FakeAPI:
+    '''
+    Stands in for the token/refresh endpoint on a simulated clock
+    '''
+    def __init__(self, lifetime):
+        self.lifetime = lifetime
+        self.now = 1_600_000_000.0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def post(self, path, data=None, **kwargs):
+        with self.lock:
+            self.calls += 1
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'access': make_token(int(self.now + self.lifetime))}
+        return response
+
+
+def legacy_handle_refresh(api):
+    '''
+    The decorator before expiry checks: one refresh per decorated view
+    '''
+    def decorator(function):
+        def wrapper(request, *args, **kwargs):
+            if request.session['access_token'] and request.session['refresh_token']:
+                response = api.post('token/refresh', data={'refresh': request.session['refresh_token']})
+                request.session['access_token'] = response.json()['access']
+                return function(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def page_views(decorator, api, views, interval):
+    view = decorator(lambda request: HttpResponse('ok'))
+    session = {'access_token': make_token(int(api.now + api.lifetime)), 'refresh_token': 'refresh'}
+    factory = RequestFactory()
+    for _ in range(views):
+        request = factory.get('/app/dashboard')
+        request.session = session
+        view(request)
+        api.now += interval
+    return api.calls
+
+
+def concurrent_views(api, threads):
+    '''
+    Many simultaneous views of one session whose token has already expired
+    '''
+    view = handle_refresh(lambda request: HttpResponse('ok'))
+    factory = RequestFactory()
+    barrier = threading.Barrier(threads)
+
+    def run():
+        request = factory.get('/app/dashboard')
+        request.session = {'access_token': make_token(int(api.now - 1)), 'refresh_token': 'concurrent'}
+        barrier.wait()
+        view(request)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return api.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--views', type=int, default=1000, help='Page views to simulate')
+    parser.add_argument('--interval', type=float, default=2, help='Seconds between page views')
+    parser.add_argument('--lifetime', type=int, default=300, help='Access token lifetime in seconds')
+    parser.add_argument('--threads', type=int, default=20, help='Concurrent views in the merge scenario')
+    options = parser.parse_args()
+
+    cache.clear()
+    legacy_api = FakeAPI(options.lifetime)
+    before = page_views(legacy_handle_refresh(legacy_api), legacy_api, options.views, options.interval)
+
+    api = FakeAPI(options.lifetime)
+    with mock.patch.object(tokens, 'api_client', api), mock.patch.object(tokens.time, 'time', lambda: api.now):
+        after = page_views(handle_refresh, api, options.views, options.interval)
+
+    concurrent_api = FakeAPI(options.lifetime)
+    with mock.patch.object(tokens, 'api_client', concurrent_api), mock.patch.object(tokens.time, 'time', lambda: concurrent_api.now):
+        concurrent = concurrent_views(concurrent_api, options.threads)
+
+    per_thousand = 1000 / options.views
+    print(f'{options.views} page views, one every {options.interval}s, {options.lifetime}s access tokens')
+    print(f'refresh calls per 1000 views, before: {before * per_thousand:.0f}')
+    print(f'refresh calls per 1000 views, after:  {after * per_thousand:.0f}')
+    print(f'refresh calls for {options.threads} concurrent views of an expired session: {concurrent}')
+
+
+if __name__ == '__main__':
+    main()
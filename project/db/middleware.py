@@ -0,0 +1,50 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+local = threading.local()
+
+
+def record_connection(sender, connection, **kwargs):
+    opened = getattr(local, 'opened', None)
+    if opened is not None:
+        opened[connection.alias] = 'pooled' if getattr(connection, 'pool_reused', False) else 'new'
+
+
+connection_created.connect(record_connection)
+
+
+class ConnectionReuseMiddleware:
+    '''
+    Reports how each database alias got its connection for this request
+    in the debug log and, with SQL_CONNECTION_HEADER, the X-DB-Connection
+    header: "reused" for a
+    persistent connection kept from an earlier request, "pooled" for one
+    checked out of the connection pool, "new" for a fresh connect. Only
+    queries made on the request thread are seen.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        held = {connection.alias for connection in connections.all() if connection.connection is not None}
+        # Calls dispatched in process nest inside the request making them
+        outer, local.opened = getattr(local, 'opened', None), {}
+        opened = local.opened
+        try:
+            response = self.get_response(request)
+        finally:
+            local.opened = outer
+
+        report = {alias: 'reused' for alias in held}
+        report.update(opened)
+        if report:
+            if settings.SQL_CONNECTION_HEADER:
+                response['X-DB-Connection'] = ', '.join(f'{alias}={how}' for alias, how in sorted(report.items()))
+            logger.debug('%s %s database connections: %s', request.method, request.path, report)
+        return response
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+
+class ConnectionPool:
+    '''
+    Bounded pool of DB-API connections shared by the threads of one
+    process. get() blocks up to timeout seconds for a free slot, reuses
+    the most recently returned idle connection, optionally pinging it
+    first, and only opens a new one when none is idle. put() rolls back
+    anything left open, optionally resets the session state a caller may
+    have changed, and keeps the connection for the next caller; one that
+    fails either is discarded.
+    '''
+    def __init__(self, connect, size, timeout=10, ping=None, reset=None):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping = ping
+        self.reset = reset
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = deque()
+        self.counters = {'created': 0, 'reused': 0, 'discarded': 0, 'waits': 0, 'timeouts': 0}
+        self.checked_out = 0
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def get(self):
+        '''
+        Returns (connection, reused)
+        '''
+        if not self.slots.acquire(blocking=False):
+            self.count('waits')
+            started = time.monotonic()
+            if not self.slots.acquire(timeout=self.timeout):
+                self.count('timeouts')
+                raise OperationalError(f'No database connection free after {time.monotonic() - started:.1f}s')
+        try:
+            while True:
+                with self.lock:
+                    connection = self.idle.pop() if self.idle else None
+                if connection is None:
+                    connection = self.connect()
+                    reused = False
+                    self.count('created')
+                    break
+                if not connection.closed and (self.ping is None or self.ping(connection)):
+                    reused = True
+                    self.count('reused')
+                    break
+                self.discard(connection)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.checked_out += 1
+        return connection, reused
+
+    def put(self, connection, discard=False):
+        try:
+            if not discard and not connection.closed:
+                try:
+                    connection.rollback()
+                    if self.reset is not None:
+                        self.reset(connection)
+                except Exception:
+                    discard = True
+            if discard or connection.closed:
+                self.discard(connection)
+            else:
+                with self.lock:
+                    self.idle.append(connection)
+        finally:
+            with self.lock:
+                self.checked_out -= 1
+            self.slots.release()
+
+    def discard(self, connection):
+        self.count('discarded')
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = list(self.idle), deque()
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'checked_out': self.checked_out,
+                **self.counters
+            }
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias, factory):
+    '''
+    The process-wide pool for a database alias, created on first use
+    '''
+    pool = pools.get(alias)
+    if pool is None:
+        with pools_lock:
+            pool = pools.get(alias)
+            if pool is None:
+                pool = pools[alias] = factory()
+    return pool
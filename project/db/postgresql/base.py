@@ -0,0 +1,88 @@
+from django.db.backends.postgresql import base
+
+from ..pool import ConnectionPool, get_pool, pools
+
+
+def ping(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Exception:
+        return False
+
+
+def reset(connection):
+    '''
+    Back to a fresh session: SET parameters, temporary tables, prepared
+    statements and advisory locks are dropped. DISCARD ALL can't run in a
+    transaction, the rollback before it has ended any.
+    '''
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute('DISCARD ALL')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''
+    PostgreSQL backend with two additions configured from DATABASES:
+
+    HEALTH_CHECKS pings a persistent connection before its first query in
+    each request and reconnects if the server dropped it, instead of
+    failing that request.
+
+    POOL_SIZE > 0 checks connections out of a process-wide pool instead of
+    connecting, and returns them to it, reset, instead of closing. Use it with
+    CONN_MAX_AGE = 0 so each request holds a connection only while it
+    runs, POOL_TIMEOUT bounds the wait for a free one.
+    '''
+    health_check_done = False
+    pool_reused = False
+
+    def get_pool(self, conn_params):
+        size = self.settings_dict.get('POOL_SIZE') or 0
+        if size <= 0:
+            return None
+        return get_pool(self.alias, lambda: ConnectionPool(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            size,
+            timeout=self.settings_dict.get('POOL_TIMEOUT', 10),
+            ping=ping if self.settings_dict.get('HEALTH_CHECKS') else None,
+            reset=reset
+        ))
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        if pool is None:
+            self.pool_reused = False
+            return super().get_new_connection(conn_params)
+        connection, self.pool_reused = pool.get()
+        return connection
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def _close(self):
+        pool = pools.get(self.alias)
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.put(self.connection, discard=self.errors_occurred)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Runs at the start and end of every request
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.settings_dict.get('HEALTH_CHECKS')
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
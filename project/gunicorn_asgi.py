@@ -0,0 +1,15 @@
+"""
+gunicorn settings for the ASGI deployment profile: uvicorn workers
+serving project.asgi, with the API list and detail views on the
+executor's thread pool.
+
+    gunicorn project.asgi -c project/gunicorn_asgi.py
+"""
+# gunicorn reads every module level name as a setting, including "config"
+import decouple
+
+bind = f"0.0.0.0:{decouple.config('PORT', default='8000')}"
+workers = decouple.config('WEB_CONCURRENCY', default=2, cast=int)
+worker_class = 'uvicorn.workers.UvicornWorker'
+keepalive = decouple.config('WEB_KEEPALIVE', default=5, cast=int)
+raw_env = ['ASYNC_API_VIEWS=True']
@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'project.db.middleware.ConnectionReuseMiddleware',
+    'api.replicas.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +84,12 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Report in an X-DB-Connection response header how each request got its database connections
+SQL_CONNECTION_HEADER = config('SQL_CONNECTION_HEADER', default=DEBUG, cast=bool)
+
+# Connections kept in each process's in-app pool, 0 disables pooling (with pgbouncer in front, leave it off)
+SQL_POOL_SIZE = config('SQL_POOL_SIZE', default=0, cast=int)
+
 DATABASES = {
     "default": {
         "ENGINE": os.environ.get("SQL_ENGINE", "django.db.backends.sqlite3"),
@@ -90,9 +98,48 @@ DATABASES = {
         "PASSWORD": os.environ.get("SQL_PASSWORD", "password"),
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
+        # Seconds a connection is kept for later requests; pooled connections go back to the pool after each request instead
+        "CONN_MAX_AGE": 0 if SQL_POOL_SIZE else config('SQL_CONN_MAX_AGE', default=60, cast=int),
+        # Ping a kept connection before its first query in a request and reconnect if the server dropped it
+        "HEALTH_CHECKS": config('SQL_HEALTH_CHECKS', default=True, cast=bool),
+        "POOL_SIZE": SQL_POOL_SIZE,
+        # Seconds a request waits for a free pooled connection before failing
+        "POOL_TIMEOUT": config('SQL_POOL_TIMEOUT', default=10, cast=float),
+        "OPTIONS": {},
     }
 }
 
+if DATABASES["default"]["ENGINE"] in ("django.db.backends.postgresql", "django.db.backends.postgresql_psycopg2"):
+    # Same backend plus health checks and the optional pool
+    DATABASES["default"]["ENGINE"] = "project.db.postgresql"
+    DATABASES["default"]["OPTIONS"] = {
+        "connect_timeout": config('SQL_CONNECT_TIMEOUT', default=5, cast=int),
+        # Milliseconds before the server cancels a statement. Off by default, as
+        # migrations and the set-based management commands run longer; set it
+        # only in the environment of the web workers
+        "options": f"-c statement_timeout={config('SQL_STATEMENT_TIMEOUT', default=0, cast=int)}",
+        "application_name": config('SQL_APPLICATION_NAME', default='logistics'),
+    }
+
+# Read replica hosts for the staff reporting views, comma separated, sharing the primary's credentials.
+# Without any, a single "replica" alias points at the primary so the routing can still be exercised locally.
+SQL_REPLICA_HOSTS = config('SQL_REPLICA_HOSTS', default='', cast=Csv())
+for position, host in enumerate(SQL_REPLICA_HOSTS or [DATABASES["default"]["HOST"]]):
+    DATABASES["replica" if position == 0 else f"replica_{position + 1}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Aliases the router may send reporting reads to, empty keeps every read on the primary
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"] if SQL_REPLICA_HOSTS else []
+# Seconds a user's reads stay on the primary after they write, longer than the worst expected replication lag
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+# Must be shared between workers in production for the pin to follow the user
+REPLICA_PIN_CACHE_ALIAS = config('REPLICA_PIN_CACHE_ALIAS', default='default')
+
 # DATABASES = {
 #     'default': dj_database_url.config(default=config('DATABASE_URL'))
 # }
@@ -101,6 +148,29 @@ DATABASES = {
 # DATABASES['default'].update(db_from_env)
 
 
+# Caches
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# The detail cache backend is pluggable, e.g. DETAIL_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# with DETAIL_CACHE_LOCATION=/var/tmp/api-detail, or a shared memcached/redis backend in production
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'detail': {
+        'BACKEND': config('DETAIL_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('DETAIL_CACHE_LOCATION', default='api-detail'),
+        'TIMEOUT': config('DETAIL_CACHE_TIMEOUT', default=300, cast=int),
+    },
+}
+
+DETAIL_CACHE_ALIAS = 'detail'
+
+# In-process LRU behind the public tracking lookup; the timeout bounds staleness across workers
+TRACKING_CACHE_SIZE = config('TRACKING_CACHE_SIZE', default=10000, cast=int)
+TRACKING_CACHE_TIMEOUT = config('TRACKING_CACHE_TIMEOUT', default=5, cast=float)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -127,8 +197,144 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': config('API_PAGE_SIZE', default=50, cast=int),
 }
 
+# Largest JSON array the bulk endpoints accept, and rows per INSERT/UPDATE statement
+BULK_MAX_ITEMS = config('BULK_MAX_ITEMS', default=1000, cast=int)
+BULK_BATCH_SIZE = config('BULK_BATCH_SIZE', default=500, cast=int)
+
+# Rider assignment: orders claimed per pass, scoring function and how often the free rider index reloads
+RIDER_ASSIGNMENT_BATCH_SIZE = config('RIDER_ASSIGNMENT_BATCH_SIZE', default=200, cast=int)
+RIDER_SCORING_FUNCTION = config('RIDER_SCORING_FUNCTION', default='api.assignment.location_score')
+RIDER_INDEX_MAX_AGE = config('RIDER_INDEX_MAX_AGE', default=30, cast=float)
+
+# Quote pricing: quotes repriced per vectorized batch and how often the rate table reloads
+PRICING_CHUNK_SIZE = config('PRICING_CHUNK_SIZE', default=5000, cast=int)
+PRICING_TABLE_MAX_AGE = config('PRICING_TABLE_MAX_AGE', default=300, cast=float)
+
+# Frontend HTTP client for calls to the API: pooled keep-alive connections, timeouts in seconds, retries with backoff
+API_CLIENT_POOL_SIZE = config('API_CLIENT_POOL_SIZE', default=10, cast=int)
+API_CLIENT_CONNECT_TIMEOUT = config('API_CLIENT_CONNECT_TIMEOUT', default=3.05, cast=float)
+API_CLIENT_READ_TIMEOUT = config('API_CLIENT_READ_TIMEOUT', default=10, cast=float)
+API_CLIENT_RETRIES = config('API_CLIENT_RETRIES', default=3, cast=int)
+API_CLIENT_BACKOFF = config('API_CLIENT_BACKOFF', default=0.2, cast=float)
+# 'local' dispatches API calls to the api views in-process when both apps are served together, 'http' goes through API_URL
+API_CLIENT_TRANSPORT = config('API_CLIENT_TRANSPORT', default='http')
+
+# Seconds before access token expiry at which the frontend asks the API for a new one
+TOKEN_REFRESH_WINDOW = config('TOKEN_REFRESH_WINDOW', default=60, cast=int)
+
+# Run the API list and detail views on the ASGI executor's thread pool, enabled by the uvicorn profile
+ASYNC_API_VIEWS = config('ASYNC_API_VIEWS', default=False, cast=bool)
+
+# Opt-in per-request profiling: Server-Timing headers, /api/_metrics histograms and a slow request log
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+# Requests at least this slow (milliseconds) are written to the slow request log with their SQL
+PROFILING_SLOW_REQUEST_MS = config('PROFILING_SLOW_REQUEST_MS', default=500, cast=float)
+PROFILING_SLOW_REQUEST_MAX_QUERIES = config('PROFILING_SLOW_REQUEST_MAX_QUERIES', default=100, cast=int)
+PROFILING_SLOW_REQUEST_LOG = config('PROFILING_SLOW_REQUEST_LOG', default=os.path.join(BASE_DIR, 'slow_requests.log'))
+PROFILING_SLOW_REQUEST_LOG_BYTES = config('PROFILING_SLOW_REQUEST_LOG_BYTES', default=10 * 1024 * 1024, cast=int)
+PROFILING_SLOW_REQUEST_LOG_BACKUPS = config('PROFILING_SLOW_REQUEST_LOG_BACKUPS', default=5, cast=int)
+
+if PROFILING_ENABLED:
+    MIDDLEWARE.insert(0, 'api.profiling.ProfilingMiddleware')
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            # Records are already JSON, one per line
+            'json_lines': {'format': '{"time": "%(asctime)s", "request": %(message)s}'},
+        },
+        'handlers': {
+            'slow_requests': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'filename': PROFILING_SLOW_REQUEST_LOG,
+                'maxBytes': PROFILING_SLOW_REQUEST_LOG_BYTES,
+                'backupCount': PROFILING_SLOW_REQUEST_LOG_BACKUPS,
+                'delay': True,
+                'formatter': 'json_lines',
+            },
+        },
+        'loggers': {
+            'api.slow_requests': {'handlers': ['slow_requests'], 'level': 'WARNING', 'propagate': False},
+        },
+    }
+
+# Days the staff daily ledger covers when no start date is given
+LEDGER_DAILY_DAYS = config('LEDGER_DAILY_DAYS', default=30, cast=int)
+
+# Default and largest number of clients listed by the staff ledger by balance due
+LEDGER_USERS_LIMIT = config('LEDGER_USERS_LIMIT', default=50, cast=int)
+LEDGER_USERS_MAX_LIMIT = config('LEDGER_USERS_MAX_LIMIT', default=500, cast=int)
+
+# Shared secret the payment provider signs callbacks with; callbacks are refused while it is empty
+PAYMENT_WEBHOOK_SECRET = config('PAYMENT_WEBHOOK_SECRET', default='')
+
+# Callbacks accepted per webhook request, applied per worker batch, and days processed ones are kept
+PAYMENT_CALLBACK_MAX_ITEMS = config('PAYMENT_CALLBACK_MAX_ITEMS', default=1000, cast=int)
+PAYMENT_CALLBACK_BATCH_SIZE = config('PAYMENT_CALLBACK_BATCH_SIZE', default=500, cast=int)
+PAYMENT_CALLBACK_RETENTION_DAYS = config('PAYMENT_CALLBACK_RETENTION_DAYS', default=30, cast=int)
+
+# Location resolution: how often the fuzzy-match index reloads, the lowest trigram score
+# accepted as a match and how many resolved inputs are memoized
+LOCATION_INDEX_MAX_AGE = config('LOCATION_INDEX_MAX_AGE', default=300, cast=float)
+LOCATION_MATCH_THRESHOLD = config('LOCATION_MATCH_THRESHOLD', default=0.6, cast=float)
+LOCATION_MATCH_CACHE_SIZE = config('LOCATION_MATCH_CACHE_SIZE', default=10000, cast=int)
+
+# Distance matrix: where build_distance_matrix writes it, how often readers look for a
+# new build, and the road distance factor and average speed it is estimated with
+LOCATION_MATRIX_DIR = config('LOCATION_MATRIX_DIR', default=os.path.join(BASE_DIR, 'var', 'distance_matrix'))
+LOCATION_MATRIX_MAX_AGE = config('LOCATION_MATRIX_MAX_AGE', default=60, cast=float)
+LOCATION_ROAD_FACTOR = config('LOCATION_ROAD_FACTOR', default=1.3, cast=float)
+LOCATION_AVERAGE_SPEED_KMH = config('LOCATION_AVERAGE_SPEED_KMH', default=50, cast=float)
+
+# Delivery run planning: load, stop count and duration limits of a run, minutes spent at
+# each stop, and processes depots are planned on in parallel
+RUN_CAPACITY_KG = config('RUN_CAPACITY_KG', default=150, cast=float)
+RUN_MAX_STOPS = config('RUN_MAX_STOPS', default=40, cast=int)
+RUN_MAX_MINUTES = config('RUN_MAX_MINUTES', default=600, cast=float)
+RUN_STOP_MINUTES = config('RUN_STOP_MINUTES', default=5, cast=float)
+RUN_PLANNING_PROCESSES = config('RUN_PLANNING_PROCESSES', default=1, cast=int)
+
+# Order status streams (Server-Sent Events): events a stream may fall behind before it is
+# closed, seconds between heartbeats on an idle stream and the reconnect delay sent to
+# clients, how often and how far back the worker polls for events written by other
+# processes, and the most events replayed to a resuming client before it is told to reload
+SSE_QUEUE_SIZE = config('SSE_QUEUE_SIZE', default=256, cast=int)
+SSE_HEARTBEAT_SECONDS = config('SSE_HEARTBEAT_SECONDS', default=15, cast=float)
+SSE_RETRY_MS = config('SSE_RETRY_MS', default=3000, cast=int)
+SSE_POLL_SECONDS = config('SSE_POLL_SECONDS', default=1, cast=float)
+SSE_POLL_OVERLAP = config('SSE_POLL_OVERLAP', default=100, cast=int)
+SSE_REPLAY_LIMIT = config('SSE_REPLAY_LIMIT', default=1000, cast=int)
+
+# Background jobs: attempts per job and the retry backoff (first and longest wait, in
+# seconds), jobs a worker claims at a time, seconds before a running job is presumed
+# abandoned by a dead worker, days finished jobs are kept, and error text kept per job
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=5, cast=int)
+JOB_BACKOFF_SECONDS = config('JOB_BACKOFF_SECONDS', default=10, cast=float)
+JOB_BACKOFF_MAX_SECONDS = config('JOB_BACKOFF_MAX_SECONDS', default=3600, cast=float)
+JOB_BATCH_SIZE = config('JOB_BATCH_SIZE', default=5, cast=int)
+JOB_TIMEOUT_SECONDS = config('JOB_TIMEOUT_SECONDS', default=600, cast=int)
+JOB_RETENTION_DAYS = config('JOB_RETENTION_DAYS', default=7, cast=int)
+JOB_ERROR_MAX_LENGTH = config('JOB_ERROR_MAX_LENGTH', default=4000, cast=int)
+
+# Outgoing email, sent from the background jobs; printed to the worker's output by default
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='webmaster@localhost')
+
+# Orders invoiced per transaction by the generate_invoices backfill
+INVOICE_CHUNK_SIZE = config('INVOICE_CHUNK_SIZE', default=1000, cast=int)
+
+# Rows fetched per server-side cursor round trip by the staff exports
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
 